@@ -0,0 +1,369 @@
+"""
+Two-tier cache for AI search results
+
+A repeated AI search for the same unknown grade costs another 20-30 s
+Perplexity call. Results are cached in two tiers:
+
+- Memory: LRU of the most recent entries (no database access on a hit)
+- Database: ai_searches table (survives restarts, shared by workers)
+
+Keys are normalized grade names ("AISI 304", "aisi-304" → "AISI304").
+
+Misses (AI answered that the grade was not found) are kept in a separate
+short-TTL memory cache, so retries for a nonexistent grade return at once
+instead of paying the full upstream latency again. Callers bypass both
+caches with force=True (see AISearch.search_steel).
+
+Only results whose confidence meets AI_CACHE_MIN_CONFIDENCE are admitted,
+and entries are re-checked against the threshold and TTL on every read, so
+raising the threshold or lowering the TTL takes effect for existing entries.
+
+Settings (.env):
+    CACHE_AI_RESULTS=True          # enable cache
+    AI_CACHE_TTL=604800            # entry lifetime, seconds
+    AI_CACHE_MIN_CONFIDENCE=medium # low / medium / high
+    AI_CACHE_MEMORY_SIZE=256       # entries in the memory tier
+    AI_NEGATIVE_CACHE_TTL=900      # lifetime of "not found" entries, seconds
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Tuple
+
+from database_schema import get_connection, create_ai_cache_table
+from grade_index import normalize_grade_name
+
+
+# Confidence levels (see AISearch._calculate_confidence_score) in ascending order
+CONFIDENCE_LEVELS = {'low': 0, 'medium': 1, 'high': 2}
+
+
+def cache_key(grade_name: str) -> str:
+    """Normalized cache key for a grade name"""
+    return normalize_grade_name((grade_name or '').strip()) or ''
+
+
+class AICache:
+    """In-memory LRU in front of the ai_searches table"""
+
+    def __init__(self, ttl: Optional[int] = None, min_confidence: Optional[str] = None,
+                 memory_size: Optional[int] = None, negative_ttl: Optional[int] = None):
+        """
+        Args:
+            ttl: Entry lifetime in seconds (default: AI_CACHE_TTL)
+            min_confidence: Lowest admitted confidence level (default: AI_CACHE_MIN_CONFIDENCE)
+            memory_size: Max entries in memory tier (default: AI_CACHE_MEMORY_SIZE)
+            negative_ttl: "Not found" entry lifetime in seconds (default: AI_NEGATIVE_CACHE_TTL)
+        """
+        self.enabled = os.getenv('CACHE_AI_RESULTS', 'True').lower() == 'true'
+        self.ttl = ttl if ttl is not None else int(os.getenv('AI_CACHE_TTL', '604800'))
+        self.memory_size = memory_size if memory_size is not None else int(os.getenv('AI_CACHE_MEMORY_SIZE', '256'))
+        self.negative_ttl = negative_ttl if negative_ttl is not None else int(os.getenv('AI_NEGATIVE_CACHE_TTL', '900'))
+
+        min_confidence = (min_confidence or os.getenv('AI_CACHE_MIN_CONFIDENCE', 'medium')).lower()
+        if min_confidence not in CONFIDENCE_LEVELS:
+            print(f"WARNING: Unknown AI_CACHE_MIN_CONFIDENCE '{min_confidence}', using 'medium'")
+            min_confidence = 'medium'
+        self.min_confidence = min_confidence
+
+        # key -> (result_json, created_at epoch, latency seconds)
+        self._memory: 'OrderedDict[str, Tuple[str, float, float]]' = OrderedDict()
+        # key -> (created_at epoch, latency seconds) of searches that found nothing
+        self._misses: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._stats = {
+            'memory_hits': 0,
+            'db_hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'admitted': 0,
+            'rejected': 0,
+            'saved_seconds': 0.0
+        }
+
+        if self.enabled:
+            self._create_table()
+
+    def _create_table(self) -> None:
+        """Create (or upgrade) ai_searches once at startup"""
+        try:
+            conn = get_connection()
+            try:
+                create_ai_cache_table(conn.cursor())
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[AI Cache] Failed to create cache table, database tier disabled: {e}")
+
+    def _admissible(self, result: Dict[str, Any]) -> bool:
+        level = CONFIDENCE_LEVELS.get(str(result.get('confidence', '')).lower(), -1)
+        return level >= CONFIDENCE_LEVELS[self.min_confidence]
+
+    def _remember(self, key: str, result_json: str, created_at: float, latency: float) -> None:
+        with self._lock:
+            self._memory[key] = (result_json, created_at, latency)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _hit(self, result_json: str, created_at: float, latency: float, tier: str) -> Optional[Dict[str, Any]]:
+        """Decode and verify entry; None if it no longer qualifies"""
+        age = time.time() - created_at
+        if age >= self.ttl:
+            return None
+
+        try:
+            result = json.loads(result_json)
+        except (TypeError, ValueError):
+            return None
+
+        if not isinstance(result, dict) or not self._admissible(result):
+            return None
+
+        result['cached'] = True
+        result['cache_tier'] = tier
+        result['cache_age'] = age
+
+        with self._lock:
+            self._stats[f'{tier}_hits'] += 1
+            self._stats['saved_seconds'] += latency
+
+        return result
+
+    def get(self, grade_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Get cached result for grade
+
+        Args:
+            grade_name: Grade name as searched
+
+        Returns:
+            Result dict with 'cached', 'cache_tier' ('memory'/'db') and
+            'cache_age' (seconds), or None on miss
+        """
+        if not self.enabled:
+            return None
+
+        key = cache_key(grade_name)
+        if not key:
+            return None
+
+        # Tier 1: memory
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+
+        if entry is not None:
+            result = self._hit(*entry, tier='memory')
+            if result is not None:
+                return result
+            with self._lock:
+                self._memory.pop(key, None)
+
+        # Tier 2: database
+        try:
+            conn = get_connection()
+            try:
+                row = conn.execute("""
+                    SELECT result, created_at, latency_ms
+                    FROM ai_searches
+                    WHERE cache_key = ?
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                """, (key,)).fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[AI Cache] Read error: {e}")
+            row = None
+
+        if row:
+            result_json, created_at, latency_ms = row
+            created_ts = datetime.fromisoformat(created_at).timestamp()
+            latency = (latency_ms or 0) / 1000
+            result = self._hit(result_json, created_ts, latency, tier='db')
+            if result is not None:
+                self._remember(key, result_json, created_ts, latency)
+                return result
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, grade_name: str, result: Dict[str, Any], latency: float = 0.0) -> bool:
+        """
+        Store result if its confidence meets the admission threshold
+
+        Args:
+            grade_name: Grade name as searched
+            result: AI search result (with 'confidence' level)
+            latency: Duration of the AI search in seconds
+
+        Returns:
+            True if admitted
+        """
+        if not self.enabled or not result:
+            return False
+
+        key = cache_key(grade_name)
+        if not key:
+            return False
+
+        # Grade was found after all (e.g. forced search)
+        with self._lock:
+            self._misses.pop(key, None)
+
+        if not self._admissible(result):
+            with self._lock:
+                self._stats['rejected'] += 1
+            print(f"[AI Cache] Not cached '{grade_name}': confidence "
+                  f"'{result.get('confidence')}' below '{self.min_confidence}'")
+            return False
+
+        stored = {k: v for k, v in result.items() if k not in ('cached', 'cache_tier', 'cache_age')}
+        result_json = json.dumps(stored, ensure_ascii=False)
+        created = datetime.now()
+
+        try:
+            conn = get_connection()
+            try:
+                conn.execute("""
+                    INSERT INTO ai_searches (grade_name, result, created_at, cache_key, confidence, latency_ms)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (grade_name, result_json, created.isoformat(), key,
+                      result.get('confidence'), int(latency * 1000)))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[AI Cache] Save error: {e}")
+
+        self._remember(key, result_json, created.timestamp(), latency)
+
+        with self._lock:
+            self._stats['admitted'] += 1
+        return True
+
+    def get_miss(self, grade_name: str) -> Optional[float]:
+        """
+        Check whether a recent AI search for grade found nothing
+
+        Returns:
+            Age of the "not found" entry in seconds, or None
+        """
+        if not self.enabled or self.negative_ttl <= 0:
+            return None
+
+        key = cache_key(grade_name)
+        with self._lock:
+            entry = self._misses.get(key)
+            if entry is None:
+                return None
+
+            created_at, latency = entry
+            age = time.time() - created_at
+            if age >= self.negative_ttl:
+                del self._misses[key]
+                return None
+
+            self._stats['negative_hits'] += 1
+            self._stats['saved_seconds'] += latency
+            return age
+
+    def put_miss(self, grade_name: str, latency: float = 0.0) -> None:
+        """
+        Remember that the AI could not find grade (for negative_ttl seconds)
+
+        Args:
+            grade_name: Grade name as searched
+            latency: Duration of the AI search in seconds
+        """
+        if not self.enabled or self.negative_ttl <= 0:
+            return
+
+        key = cache_key(grade_name)
+        if not key:
+            return
+
+        with self._lock:
+            self._misses[key] = (time.time(), latency)
+            self._misses.move_to_end(key)
+            while len(self._misses) > self.memory_size:
+                self._misses.popitem(last=False)
+
+    def purge(self, grade_name: Optional[str] = None, expired_only: bool = False) -> int:
+        """
+        Remove cached entries
+
+        "Not found" entries of the grade (or all of them) are dropped as well.
+
+        Args:
+            grade_name: Purge only this grade (default: all grades)
+            expired_only: Purge only entries older than TTL
+
+        Returns:
+            Number of database rows removed
+        """
+        key = cache_key(grade_name) if grade_name else None
+        cutoff = time.time() - self.ttl
+
+        with self._lock:
+            for miss_key in list(self._misses):
+                if key is None or miss_key == key:
+                    del self._misses[miss_key]
+
+            for memory_key in list(self._memory):
+                if key is not None and memory_key != key:
+                    continue
+                if expired_only and self._memory[memory_key][1] > cutoff:
+                    continue
+                del self._memory[memory_key]
+
+        conditions, params = [], []
+        if key is not None:
+            conditions.append("(cache_key = ? OR grade_name = ?)")
+            params.extend([key, grade_name])
+        if expired_only:
+            conditions.append("created_at < ?")
+            params.append((datetime.now() - timedelta(seconds=self.ttl)).isoformat())
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        try:
+            conn = get_connection()
+            try:
+                cursor = conn.execute(f"DELETE FROM ai_searches {where}", params)
+                conn.commit()
+                removed = cursor.rowcount
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[AI Cache] Purge error: {e}")
+            return 0
+
+        print(f"[AI Cache] Purged {removed} entries"
+              f"{f' for {grade_name}' if grade_name else ''}{' (expired)' if expired_only else ''}")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and latency saved since startup"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['negative_entries'] = len(self._misses)
+
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 3) if lookups else 0.0
+        stats['saved_seconds'] = round(stats['saved_seconds'], 1)
+        stats['enabled'] = self.enabled
+        stats['min_confidence'] = self.min_confidence
+        stats['ttl'] = self.ttl
+        stats['negative_ttl'] = self.negative_ttl
+        return stats
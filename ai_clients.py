@@ -0,0 +1,195 @@
+"""
+Long-lived API clients for Perplexity and OpenAI
+
+Creating an OpenAI(...) client per call opens a new HTTP connection pool, so
+every search paid DNS + TCP + TLS setup again. Clients are created lazily once
+per process (per provider and API key) and reused; their keep-alive pools
+are shared by all threads.
+
+Settings (.env):
+    PERPLEXITY_BASE_URL=https://api.perplexity.ai
+    OPENAI_BASE_URL=                    # empty: OpenAI default
+    AI_HTTP_MAX_CONNECTIONS=10          # per provider
+    AI_HTTP_MAX_KEEPALIVE=5             # idle connections kept open
+    AI_HTTP_KEEPALIVE_EXPIRY=60         # seconds an idle connection is kept
+    AI_HTTP_CONNECT_TIMEOUT=10          # seconds
+    AI_HTTP_READ_TIMEOUT=120            # seconds (Perplexity answers take 20-60 s)
+    AI_HTTP_MAX_RETRIES=2
+
+The openai client retries a failed request with the full read timeout again,
+so a call under a deadline (ai_deadline) goes through create_completion: it
+retries itself, cutting every attempt's timeout to the remaining time and
+stopping when no attempt fits any more.
+
+Usage:
+    from ai_clients import get_perplexity_client, create_completion
+    client = get_perplexity_client(api_key)
+    client.chat.completions.create(...)
+    create_completion(client, deadline, model=..., messages=...)
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Tuple, Any
+
+from ai_concurrency import is_provider_failure
+
+try:
+    import httpx
+except ImportError:
+    # Newer openai releases ship their HTTP client as httpx2
+    try:
+        import httpx2 as httpx
+    except ImportError:
+        httpx = None
+
+
+PERPLEXITY_BASE_URL = os.getenv('PERPLEXITY_BASE_URL', 'https://api.perplexity.ai')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+# provider -> base URL (None = library default)
+_BASE_URLS = {
+    'perplexity': PERPLEXITY_BASE_URL,
+    'openai': OPENAI_BASE_URL
+}
+
+# Seconds an attempt needs at least to be worth retrying under a deadline
+MIN_RETRY_BUDGET = 2.0
+
+_clients: Dict[Tuple[str, str], Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _http_settings() -> Dict[str, Any]:
+    return {
+        'max_connections': int(os.getenv('AI_HTTP_MAX_CONNECTIONS', '10')),
+        'max_keepalive': int(os.getenv('AI_HTTP_MAX_KEEPALIVE', '5')),
+        'keepalive_expiry': float(os.getenv('AI_HTTP_KEEPALIVE_EXPIRY', '60')),
+        'connect_timeout': float(os.getenv('AI_HTTP_CONNECT_TIMEOUT', '10')),
+        'read_timeout': float(os.getenv('AI_HTTP_READ_TIMEOUT', '120')),
+        'max_retries': int(os.getenv('AI_HTTP_MAX_RETRIES', '2'))
+    }
+
+
+def create_completion(client, deadline=None, guard=None, **kwargs):
+    """
+    chat.completions.create whose retries stay within a deadline
+
+    Without a bounded deadline this is a plain create (the client's own
+    retries). With one, each attempt runs with max_retries=0 and a timeout
+    cut to the remaining time; provider failures (see
+    ai_concurrency.is_provider_failure) are retried up to AI_HTTP_MAX_RETRIES
+    times with backoff while MIN_RETRY_BUDGET seconds are left afterwards.
+
+    Args:
+        client: Client from get_client
+        deadline: ai_deadline.Deadline (None = unlimited)
+        guard: CallGuard of the circuit breaker; deadline_limited is set for
+               the last attempt
+        **kwargs: Arguments of chat.completions.create
+
+    Returns:
+        The completion response (the last attempt's error is raised)
+    """
+    if deadline is None or not deadline.bounded:
+        return client.chat.completions.create(**kwargs)
+
+    settings = _http_settings()
+    for attempt in range(settings['max_retries'] + 1):
+        timeout = deadline.timeout(settings['read_timeout'])
+        deadline_limited = timeout < settings['read_timeout']
+        if guard is not None:
+            guard.deadline_limited = deadline_limited
+        try:
+            return client.with_options(max_retries=0, timeout=timeout).chat.completions.create(**kwargs)
+        except Exception as e:
+            delay = min(0.5 * 2 ** attempt, 8.0)
+            if (attempt == settings['max_retries'] or not is_provider_failure(e, deadline_limited)
+                    or not deadline.allows(delay + MIN_RETRY_BUDGET)):
+                raise
+            print(f"[AI Clients] Retrying after {type(e).__name__} in {delay:g} s ({deadline})")
+            time.sleep(delay)
+
+
+def _create_client(provider: str, api_key: str):
+    """Create OpenAI-compatible client with a pooled HTTP client"""
+    from openai import OpenAI, DefaultHttpxClient, Timeout
+
+    settings = _http_settings()
+    timeout = Timeout(settings['read_timeout'], connect=settings['connect_timeout'])
+
+    http_client = None
+    if httpx is not None:
+        http_client = DefaultHttpxClient(
+            limits=httpx.Limits(
+                max_connections=settings['max_connections'],
+                max_keepalive_connections=settings['max_keepalive'],
+                keepalive_expiry=settings['keepalive_expiry']
+            ),
+            timeout=timeout
+        )
+
+    kwargs = {
+        'api_key': api_key,
+        'timeout': timeout,
+        'max_retries': settings['max_retries'],
+        'http_client': http_client
+    }
+    if _BASE_URLS.get(provider):
+        kwargs['base_url'] = _BASE_URLS[provider]
+
+    print(f"[AI Clients] Created {provider} client "
+          f"(pool {settings['max_connections']}, keep-alive {settings['max_keepalive']})")
+    return OpenAI(**kwargs)
+
+
+def get_client(provider: str, api_key: str):
+    """
+    Get shared client for provider ('perplexity' or 'openai')
+
+    Args:
+        provider: Provider name
+        api_key: API key (one client per key)
+
+    Returns:
+        openai.OpenAI instance (thread-safe, reused across calls)
+
+    Raises:
+        ImportError: openai package not installed
+    """
+    key = (provider, api_key)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _create_client(provider, api_key)
+            _clients[key] = client
+    return client
+
+
+def get_perplexity_client(api_key: str):
+    """Shared Perplexity client (OpenAI-compatible API)"""
+    return get_client('perplexity', api_key)
+
+
+def get_openai_client(api_key: str):
+    """Shared OpenAI client"""
+    return get_client('openai', api_key)
+
+
+def close_clients() -> None:
+    """Close all pooled connections (e.g. on shutdown or in tests)"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            print(f"[AI Clients] Close error: {e}")
+
@@ -0,0 +1,495 @@
+"""
+Concurrency control for AI searches
+
+SingleFlight coalesces concurrent identical calls: the first caller for a key
+(leader) runs the function, callers arriving while it runs wait on the same
+future and receive the same result (or exception). When a grade is trending,
+N simultaneous searches cost one Perplexity call + PDF parse instead of N.
+
+ProviderLimiter is the admission layer in front of each AI provider:
+
+- a semaphore bounds concurrent upstream calls
+- a token bucket bounds requests per minute (with a small burst)
+- at most queue_size callers wait for a slot; when the queue is full, or a
+  slot cannot be had within max_wait, ProviderBusyError is raised at once
+  (HTTP 429 with Retry-After) instead of piling up threads or running into
+  the provider's own rate limit after a long wait
+
+CircuitBreaker short-circuits calls to a provider that is failing: after
+AI_<P>_BREAKER_THRESHOLD consecutive failures the circuit opens and calls
+fail at once with CircuitOpenError (a ProviderBusyError, HTTP 429) for
+AI_<P>_BREAKER_RESET seconds, instead of every worker waiting for its own
+timeout. Then one trial call is let through: success closes the circuit,
+failure opens it again. Only provider failures count (5xx, 429, connection
+errors, timeouts); a timeout the caller had cut to its request deadline
+(guard.deadline_limited) and client errors (4xx) do not.
+
+Settings (.env), per provider (PERPLEXITY / OPENAI):
+    AI_PERPLEXITY_MAX_CONCURRENT=4
+    AI_PERPLEXITY_RPM=40
+    AI_PERPLEXITY_QUEUE_SIZE=16
+    AI_PERPLEXITY_BREAKER_THRESHOLD=5
+    AI_PERPLEXITY_BREAKER_RESET=30  # seconds
+    AI_LIMITER_MAX_WAIT=30          # seconds, all providers
+
+Usage:
+    flights = SingleFlight()
+    result, shared = flights.do(cache_key(grade), lambda: expensive(grade))
+
+    with get_circuit_breaker('perplexity').call() as guard, get_provider_limiter('perplexity').slot():
+        # Sets guard.deadline_limited when the deadline cut the timeout
+        create_completion(client, deadline, guard, model=..., messages=...)
+"""
+
+import os
+import copy
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+class SingleFlight:
+    """Per-key coalescing of concurrent calls"""
+
+    def __init__(self):
+        self._flights: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Run fn once for all concurrent callers with the same key
+
+        Args:
+            key: Coalescing key (e.g. normalized grade name)
+            fn: Function producing the result
+            timeout: Max seconds a waiter waits for another caller's flight
+
+        Returns:
+            (result, shared) - shared is True if the result came from another
+            caller's flight. Waiters get a deep copy, so callers may modify it.
+
+        Raises:
+            Whatever fn raised (re-raised in every waiting caller)
+            TimeoutError: Waiter's timeout expired (the flight goes on)
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._flights[key] = future
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return copy.deepcopy(future.result(timeout)), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            # Waiters copy from a snapshot the leader's caller cannot modify
+            future.set_result(copy.deepcopy(result))
+            return result, False
+        finally:
+            # Later callers start a new flight (and normally hit the cache)
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def is_in_flight(self, key: str) -> bool:
+        """True if a call for key is running (a new caller would wait for it)"""
+        with self._lock:
+            return key in self._flights
+
+    def in_flight(self) -> int:
+        """Number of keys currently being computed"""
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self) -> Dict[str, int]:
+        """Leader/coalesced call counters since startup"""
+        return {
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'in_flight': self.in_flight()
+        }
+
+
+class ProviderBusyError(Exception):
+    """Provider admission queue is full or no slot within max_wait"""
+
+    def __init__(self, provider: str, message: str, retry_after: float):
+        super().__init__(message)
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Requests-per-minute limiter; reservations may go into debt (FIFO-fair)"""
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(max(burst, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Take one token; returns seconds to wait before it may be used"""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def cancel(self) -> None:
+        """Return an unused reservation"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    def delay(self) -> float:
+        """Seconds until a token would be available (without taking it)"""
+        with self._lock:
+            self._refill()
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+
+class ProviderLimiter:
+    """Concurrency + rate admission for one AI provider"""
+
+    def __init__(self, provider: str, max_concurrent: int, rate_per_minute: float,
+                 queue_size: int, max_wait: float):
+        """
+        Args:
+            provider: Provider name (for errors and metrics)
+            max_concurrent: Concurrent upstream calls
+            rate_per_minute: Sustained requests per minute
+            queue_size: Max callers waiting for a slot
+            max_wait: Max seconds a caller waits before ProviderBusyError
+        """
+        self.provider = provider
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._bucket = TokenBucket(rate_per_minute, burst=max_concurrent)
+        self._lock = threading.Lock()
+
+        self.rate_per_minute = rate_per_minute
+        self.waiting = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def _busy(self, reason: str) -> ProviderBusyError:
+        with self._lock:
+            self.rejected += 1
+        retry_after = max(1.0, self._bucket.delay())
+        return ProviderBusyError(
+            self.provider,
+            f"{self.provider} is busy ({reason}), retry in {retry_after:.0f} s",
+            retry_after
+        )
+
+    @contextmanager
+    def slot(self, max_wait: Optional[float] = None) -> Iterator[None]:
+        """
+        Hold one upstream call slot for the duration of the block
+
+        Args:
+            max_wait: Shorter wait limit for this caller (e.g. its deadline)
+
+        Raises:
+            ProviderBusyError: Queue full, or no slot/token within max_wait
+        """
+        wait_limit = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+
+        with self._lock:
+            if self.waiting >= self.queue_size:
+                full = True
+            else:
+                full = False
+                self.waiting += 1
+        if full:
+            raise self._busy(f"{self.queue_size} requests waiting")
+
+        started = time.monotonic()
+        acquired = False
+        try:
+            if not self._slots.acquire(timeout=wait_limit):
+                raise self._busy(f"no free slot within {wait_limit:.0f} s")
+            acquired = True
+
+            delay = self._bucket.reserve()
+            if delay > wait_limit - (time.monotonic() - started):
+                self._bucket.cancel()
+                raise self._busy(f"rate limit {self.rate_per_minute:.0f}/min")
+            if delay > 0:
+                time.sleep(delay)
+        except BaseException:
+            if acquired:
+                self._slots.release()
+            with self._lock:
+                self.waiting -= 1
+            raise
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            self.total_wait += waited
+            self.max_wait_seen = max(self.max_wait_seen, waited)
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait times and admission counters"""
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'rate_per_minute': self.rate_per_minute,
+                'queue_size': self.queue_size,
+                'active': self.active,
+                'queue_depth': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'avg_wait_seconds': round(self.total_wait / self.admitted, 3) if self.admitted else 0.0,
+                'max_wait_seconds': round(self.max_wait_seen, 3)
+            }
+
+
+class CircuitOpenError(ProviderBusyError):
+    """Provider is failing, calls are short-circuited until the reset timeout"""
+
+
+def _is_timeout(error: BaseException) -> bool:
+    return isinstance(error, TimeoutError) or any('Timeout' in cls.__name__ for cls in type(error).__mro__)
+
+
+def is_provider_failure(error: BaseException, deadline_limited: bool = False) -> bool:
+    """
+    True if error means the provider is unhealthy
+
+    Counted: HTTP 5xx and 429, connection errors, timeouts (unless the
+    timeout was cut to the caller's deadline). Not counted: other HTTP
+    errors (bad request, auth) and errors of our own code. Classified by
+    status_code / class names, so openai and httpx need not be importable.
+    """
+    if _is_timeout(error):
+        return not deadline_limited
+
+    status = getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status >= 500 or status == 429
+
+    names = {cls.__name__ for cls in type(error).__mro__}
+    return isinstance(error, ConnectionError) or bool(names & {'APIConnectionError', 'TransportError'})
+
+
+class CallGuard:
+    """Yielded by CircuitBreaker.call; the caller marks deadline-cut timeouts"""
+
+    def __init__(self):
+        self.deadline_limited = False
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one AI provider"""
+
+    def __init__(self, provider: str, failure_threshold: int, reset_timeout: float):
+        """
+        Args:
+            provider: Provider name (for errors and metrics)
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call
+        """
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self.state = 'closed'  # closed → open → half_open → closed / open
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+
+        self.opened = 0
+        self.short_circuited = 0
+        self.last_error: Optional[str] = None
+
+    def _reject(self, retry_after: float) -> CircuitOpenError:
+        self.short_circuited += 1
+        return CircuitOpenError(
+            self.provider,
+            f"{self.provider} is failing ({self.last_error}), retry in {retry_after:.0f} s",
+            retry_after
+        )
+
+    def _before_call(self) -> None:
+        with self._lock:
+            if self.state == 'closed':
+                return
+
+            open_for = time.monotonic() - self.opened_at
+            if self.state == 'open' and open_for < self.reset_timeout:
+                raise self._reject(max(1.0, self.reset_timeout - open_for))
+
+            # Reset timeout elapsed: let one trial call through
+            if self._trial_running:
+                raise self._reject(1.0)
+            self.state = 'half_open'
+            self._trial_running = True
+
+    def _record(self, error: Optional[BaseException]) -> None:
+        with self._lock:
+            self._trial_running = False
+            if error is None:
+                self.state = 'closed'
+                self.failures = 0
+                return
+
+            self.failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"[:200]
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.opened += 1
+                    print(f"[Circuit] {self.provider} circuit opened after {self.failures} failures "
+                          f"({self.last_error})")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def _release_trial(self) -> None:
+        """Call ended without telling anything about the provider - next caller tries"""
+        with self._lock:
+            if self._trial_running:
+                self._trial_running = False
+                self.state = 'open'
+                self.opened_at = time.monotonic() - self.reset_timeout
+
+    @contextmanager
+    def call(self) -> Iterator[CallGuard]:
+        """
+        Guard one provider call
+
+        Exceptions raised in the block count as failures if they are
+        provider failures (see is_provider_failure); ProviderBusyError (our
+        own admission rejected the call), deadline-cut timeouts and other
+        errors leave the circuit as it is.
+
+        Yields:
+            CallGuard - set guard.deadline_limited when the call's timeout
+            was shortened by the request deadline
+
+        Raises:
+            CircuitOpenError: Circuit is open
+        """
+        self._before_call()
+        guard = CallGuard()
+        try:
+            yield guard
+        except ProviderBusyError:
+            self._release_trial()
+            raise
+        except BaseException as e:
+            if is_provider_failure(e, guard.deadline_limited):
+                self._record(e)
+            else:
+                self._release_trial()
+            raise
+        else:
+            self._record(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """State and counters"""
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout': self.reset_timeout,
+                'opened': self.opened,
+                'short_circuited': self.short_circuited,
+                'last_error': self.last_error
+            }
+
+
+# Default requests per minute per provider
+_DEFAULT_RPM = {'perplexity': 40, 'openai': 60}
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_provider_limiter(provider: str) -> ProviderLimiter:
+    """Get or create limiter for provider (configured from env)"""
+    limiter = _limiters.get(provider)
+    if limiter is not None:
+        return limiter
+
+    with _limiters_lock:
+        if provider not in _limiters:
+            prefix = f"AI_{provider.upper()}_"
+            _limiters[provider] = ProviderLimiter(
+                provider,
+                max_concurrent=int(os.getenv(prefix + 'MAX_CONCURRENT', '4')),
+                rate_per_minute=float(os.getenv(prefix + 'RPM', str(_DEFAULT_RPM.get(provider, 60)))),
+                queue_size=int(os.getenv(prefix + 'QUEUE_SIZE', '16')),
+                max_wait=float(os.getenv('AI_LIMITER_MAX_WAIT', '30'))
+            )
+        return _limiters[provider]
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """Metrics of all providers used so far"""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {provider: limiter.stats() for provider, limiter in limiters.items()}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    """Get or create circuit breaker for provider (configured from env)"""
+    breaker = _breakers.get(provider)
+    if breaker is not None:
+        return breaker
+
+    with _breakers_lock:
+        if provider not in _breakers:
+            prefix = f"AI_{provider.upper()}_"
+            _breakers[provider] = CircuitBreaker(
+                provider,
+                failure_threshold=int(os.getenv(prefix + 'BREAKER_THRESHOLD', '5')),
+                reset_timeout=float(os.getenv(prefix + 'BREAKER_RESET', '30'))
+            )
+        return _breakers[provider]
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """Circuit state of all providers used so far"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {provider: breaker.stats() for provider, breaker in breakers.items()}
@@ -0,0 +1,132 @@
+"""
+Deadlines for the AI search pipeline
+
+One AI search chains a Perplexity call, a PDF download, a PDF parse and an
+OpenAI extraction. Without a common deadline each stage used its own timeout
+(or none), so the server kept working on results after the client (e.g. the
+bot with its 60 s HTTP timeout) had given up.
+
+A Deadline is created once per request and passed down
+search_steel → _search_with_perplexity → _enhance_with_pdf:
+
+- a stage is skipped when less than its minimum budget remains
+  (Perplexity: the search fails with DeadlineExceeded; PDF enhancement
+  and OpenAI extraction: the result is returned without them)
+- waits and timeouts of a stage (provider queue, HTTP calls, PDF download
+  and parse) are cut to the remaining time
+
+Settings (.env):
+    AI_REQUEST_DEADLINE=55          # synchronous API requests, seconds (max)
+    AI_JOB_DEADLINE=180             # background jobs, seconds
+    AI_MIN_PERPLEXITY_BUDGET=10     # seconds needed to start a Perplexity call
+    AI_MIN_PDF_BUDGET=8             # ... PDF download + parse
+    AI_MIN_EXTRACTION_BUDGET=5      # ... OpenAI composition extraction
+
+Usage:
+    deadline = Deadline(55)
+    deadline.require(stage_budget('perplexity'), 'perplexity')
+    client.chat.completions.create(..., timeout=deadline.timeout(120))
+"""
+
+import os
+import time
+from typing import Optional
+
+
+_STAGE_BUDGETS = {
+    'perplexity': ('AI_MIN_PERPLEXITY_BUDGET', '10'),
+    'pdf': ('AI_MIN_PDF_BUDGET', '8'),
+    'extraction': ('AI_MIN_EXTRACTION_BUDGET', '5')
+}
+
+
+def stage_budget(stage: str) -> float:
+    """Minimum seconds a stage needs to be worth starting"""
+    name, default = _STAGE_BUDGETS[stage]
+    return float(os.getenv(name, default))
+
+
+class DeadlineExceeded(Exception):
+    """Not enough time left for a required stage"""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+
+
+class Deadline:
+    """Point in time by which a request must be answered (None = no limit)"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        """
+        Args:
+            seconds: Time budget from now, None for unlimited
+        """
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+
+    @property
+    def bounded(self) -> bool:
+        return self.expires_at is not None
+
+    def remaining(self) -> float:
+        """Seconds left (inf if unlimited, never negative)"""
+        if self.expires_at is None:
+            return float('inf')
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def allows(self, seconds: float) -> bool:
+        """True if at least `seconds` remain"""
+        return self.remaining() >= seconds
+
+    def require(self, seconds: float, stage: str) -> None:
+        """
+        Raises:
+            DeadlineExceeded: Less than `seconds` remain for stage
+        """
+        remaining = self.remaining()
+        if remaining < seconds:
+            raise DeadlineExceeded(
+                stage,
+                f"Deadline: {remaining:.1f} s left, {stage} needs at least {seconds:.0f} s"
+            )
+
+    def timeout(self, default: Optional[float] = None, reserve: float = 0.0) -> Optional[float]:
+        """
+        Timeout for a blocking call: default, cut to the remaining time
+
+        Args:
+            default: The call's own timeout (None = none)
+            reserve: Seconds to keep for later steps
+
+        Returns:
+            Seconds, or None if neither the deadline nor default limits the call
+        """
+        if self.expires_at is None:
+            return default
+        remaining = max(0.0, self.remaining() - reserve)
+        return remaining if default is None else min(default, remaining)
+
+    def __repr__(self) -> str:
+        if self.expires_at is None:
+            return "Deadline(unlimited)"
+        return f"Deadline({self.remaining():.1f} s left)"
+
+
+def request_deadline(seconds: Optional[float] = None) -> Deadline:
+    """
+    Deadline for a synchronous API request
+
+    Args:
+        seconds: Client's budget (e.g. its HTTP timeout minus a margin);
+                 capped at AI_REQUEST_DEADLINE
+    """
+    limit = float(os.getenv('AI_REQUEST_DEADLINE', '55'))
+    if seconds is not None and seconds > 0:
+        limit = min(limit, seconds)
+    return Deadline(limit)
+
+
+def job_deadline() -> Deadline:
+    """Deadline for a background AI search job (AI_JOB_DEADLINE)"""
+    return Deadline(float(os.getenv('AI_JOB_DEADLINE', '180')))
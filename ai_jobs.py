@@ -0,0 +1,285 @@
+"""
+Background AI search jobs
+
+An AI search (Perplexity + PDF download/parse + scoring) takes 20-60 s. Run
+synchronously it holds a Flask request worker for the whole time, so a few
+slow lookups exhaust the server. Jobs run the same pipeline on a small
+bounded worker pool instead:
+
+    POST /api/steels/ai-search/jobs            → 202 {job_id, ...} immediately
+    GET  /api/steels/ai-search/jobs/<id>       → status, stage progress, result
+    GET  /api/steels/ai-search/jobs/<id>/events → Server-Sent Events stream
+
+A search for a grade that already has an active job joins that job. A forced
+search (bypassing the cache) joins an active forced job; a still queued
+non-forced job is upgraded to forced, a running one is left alone and a
+separate forced job is started. When all
+workers are busy and AI_JOB_QUEUE_SIZE jobs are waiting, new jobs are
+rejected with JobQueueFullError (HTTP 503) instead of piling up.
+
+Settings (.env):
+    AI_JOB_WORKERS=4        # concurrent AI searches
+    AI_JOB_QUEUE_SIZE=32    # max active (queued + running) jobs
+    AI_JOB_RETENTION=900    # keep finished jobs for polling, seconds
+    AI_JOB_DEADLINE=180     # time budget of one job (see ai_deadline), seconds
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Iterator
+
+from ai_cache import cache_key
+from ai_deadline import Deadline, job_deadline
+from ai_result_store import attach_result_token
+
+
+class JobQueueFullError(Exception):
+    """Too many active AI jobs"""
+
+
+class AIJob:
+    """State of one AI search job (updated by the worker, read by API threads)"""
+
+    def __init__(self, grade: str, force: bool = False):
+        self.id = uuid.uuid4().hex
+        self.grade = grade
+        self.force = force
+        self.status = 'queued'  # queued → running → done / failed
+        self.stage = 'queued'
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.deadline: Optional[Deadline] = None  # Set when the job starts
+
+        self.events: List[Dict[str, Any]] = []
+        self._changed = threading.Condition()
+        self.add_event('queued', 'Ожидает свободного обработчика')
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def _append_event(self, stage: str, message: Optional[str]) -> None:
+        # Caller holds _changed
+        self.stage = stage
+        self.events.append({
+            'stage': stage,
+            'message': message,
+            'elapsed': round(time.time() - self.created_at, 2)
+        })
+        self._changed.notify_all()
+
+    def upgrade_force(self) -> bool:
+        """
+        Make a job that has not started yet bypass the cache
+
+        Returns:
+            True if the job will run forced
+        """
+        with self._changed:
+            if self.status == 'queued':
+                self.force = True
+            return self.force
+
+    def add_event(self, stage: str, message: Optional[str] = None) -> None:
+        """Record stage progress and wake up SSE listeners (AISearch progress callback)"""
+        with self._changed:
+            self._append_event(stage, message)
+
+    def start(self, deadline: Optional[Deadline] = None) -> None:
+        with self._changed:
+            self.deadline = deadline
+            self.status = 'running'
+            self._append_event('started', 'Поиск запущен')
+
+    def finish(self, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._changed:
+            self.result = result
+            self.error = error
+            self.status = 'failed' if error else 'done'
+            self.finished_at = time.time()
+            self._append_event(self.status, error or ('Найдено' if result else 'Не найдено'))
+
+    def wait_for_events(self, seen: int, timeout: float) -> int:
+        """
+        Block until there are more than `seen` events, the job finished or timeout
+
+        Returns:
+            Current number of events
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.events) > seen or self.finished, timeout)
+            return len(self.events)
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = {
+            'job_id': self.id,
+            'grade': self.grade,
+            'status': self.status,
+            'stage': self.stage,
+            'events': list(self.events),
+            'elapsed': round((self.finished_at or time.time()) - self.created_at, 2),
+            # Seconds the running job may still take (None: queued, finished or unlimited);
+            # pollers wait at least this long
+            'deadline_remaining': (
+                round(self.deadline.remaining(), 1)
+                if self.status == 'running' and self.deadline is not None and self.deadline.bounded
+                else None
+            ),
+            'error': self.error
+        }
+        if include_result and self.finished:
+            data['found'] = self.result is not None
+            data['result'] = self.result
+        return data
+
+
+class AIJobManager:
+    """Bounded worker pool running AISearch.search_steel as background jobs"""
+
+    def __init__(self, ai_search, workers: Optional[int] = None, queue_size: Optional[int] = None,
+                 retention: Optional[int] = None):
+        """
+        Args:
+            ai_search: AISearch instance
+            workers: Concurrent searches (default: AI_JOB_WORKERS)
+            queue_size: Max active jobs (default: AI_JOB_QUEUE_SIZE)
+            retention: Seconds finished jobs are kept (default: AI_JOB_RETENTION)
+        """
+        self.ai_search = ai_search
+        self.workers = workers or int(os.getenv('AI_JOB_WORKERS', '4'))
+        self.queue_size = queue_size or int(os.getenv('AI_JOB_QUEUE_SIZE', '32'))
+        self.retention = retention or int(os.getenv('AI_JOB_RETENTION', '900'))
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ai-job')
+        self._jobs: Dict[str, AIJob] = {}
+        # Active jobs by (cache key, forced)
+        self._active_by_key: Dict[tuple, AIJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, grade: str, force: bool = False) -> AIJob:
+        """
+        Start (or join) an AI search job for grade
+
+        Returns:
+            AIJob (an already active job for the same grade is reused, a
+            forced search reuses it only if it runs forced)
+
+        Raises:
+            JobQueueFullError: AI_JOB_QUEUE_SIZE jobs are already active
+        """
+        key = cache_key(grade) or grade
+
+        with self._lock:
+            self._prune()
+
+            forced = self._active_by_key.get((key, True))
+            if forced is not None:
+                return forced
+
+            active = self._active_by_key.get((key, False))
+            if active is not None:
+                if not force:
+                    return active
+                if active.upgrade_force():
+                    del self._active_by_key[(key, False)]
+                    self._active_by_key[(key, True)] = active
+                    return active
+
+            if len(self._active_by_key) >= self.queue_size:
+                raise JobQueueFullError(
+                    f"Too many AI searches in progress ({self.queue_size}), try again later"
+                )
+
+            job = AIJob(grade, force)
+            self._jobs[job.id] = job
+            self._active_by_key[(key, force)] = job
+
+        self._executor.submit(self._run, job, key)
+        return job
+
+    def _run(self, job: AIJob, key: str) -> None:
+        # job.force is final once the job started (see AIJob.upgrade_force)
+        deadline = job_deadline()
+        job.start(deadline)
+
+        try:
+            result = self.ai_search.search_steel(job.grade, force=job.force, progress=job.add_event,
+                                                 deadline=deadline)
+            job.finish(result=attach_result_token(result))
+        except Exception as e:
+            print(f"[AI Jobs] Job {job.id} for '{job.grade}' failed: {e}")
+            job.finish(error=str(e))
+        finally:
+            with self._lock:
+                for slot in ((key, False), (key, True)):
+                    if self._active_by_key.get(slot) is job:
+                        del self._active_by_key[slot]
+
+    def _prune(self) -> None:
+        """Drop finished jobs older than retention (caller holds _lock)"""
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[AIJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stream_events(self, job: AIJob, heartbeat: float = 15.0) -> Iterator[str]:
+        """
+        Server-Sent Events for a job: one 'progress' event per stage, then 'done'
+
+        Args:
+            job: Job to follow
+            heartbeat: Seconds between keep-alive comments while nothing happens
+        """
+        seen = 0
+        while True:
+            count = job.wait_for_events(seen, heartbeat)
+            if count == seen and not job.finished:
+                yield ": keep-alive\n\n"
+                continue
+
+            for event in list(job.events[seen:count]):
+                yield f"event: progress\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            seen = count
+
+            if job.finished and seen >= len(job.events):
+                yield f"event: done\ndata: {json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = list(self._active_by_key.values())
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'running': sum(1 for job in active if job.status == 'running'),
+                'queued': sum(1 for job in active if job.status == 'queued'),
+                'retained': len(self._jobs)
+            }
+
+
+# Singleton instance
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> AIJobManager:
+    """Get or create AIJobManager singleton instance"""
+    global _job_manager
+
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                from ai_search import get_ai_search
+                _job_manager = AIJobManager(get_ai_search())
+
+    return _job_manager
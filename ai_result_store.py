@@ -0,0 +1,139 @@
+"""
+Short-lived store of AI search results shown to users
+
+Adding an AI result to the database used to send the grade back to the
+search endpoint: without a cached result that ran the whole 20-60 s
+Perplexity + PDF pipeline again, and could insert different data than the
+user had seen. Every AI result returned by the API now carries a
+result_token; POST /api/steels/add with {"result_token": ...} inserts the
+stored result at once.
+
+Results are kept in memory for AI_RESULT_TTL seconds (at most
+AI_RESULT_STORE_SIZE entries, oldest dropped first). Tokens are random and
+short enough for Telegram callback data (64 bytes).
+
+Settings (.env):
+    AI_RESULT_TTL=3600          # seconds a result can be added
+    AI_RESULT_STORE_SIZE=1000
+
+Usage:
+    token = get_ai_result_store().put(result)
+    result = get_ai_result_store().get(token)   # None if unknown or expired
+"""
+
+import os
+import copy
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+
+class AIResultStore:
+    """In-memory token → AI result map with TTL and size bound"""
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        """
+        Args:
+            ttl: Entry lifetime in seconds (default: AI_RESULT_TTL)
+            max_entries: Max stored results (default: AI_RESULT_STORE_SIZE)
+        """
+        self.ttl = ttl if ttl is not None else float(os.getenv('AI_RESULT_TTL', '3600'))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('AI_RESULT_STORE_SIZE', '1000'))
+
+        # token -> (expires_at monotonic, result)
+        self._results: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._stats = {
+            'stored': 0,
+            'hits': 0,
+            'expired': 0,
+            'unknown': 0,
+            'evicted': 0
+        }
+
+    def _prune(self, now: float) -> None:
+        """Drop expired entries (insertion order = expiry order; caller holds _lock)"""
+        while self._results:
+            token, (expires_at, _) = next(iter(self._results.items()))
+            if expires_at > now:
+                break
+            del self._results[token]
+
+    def put(self, result: Dict[str, Any]) -> str:
+        """
+        Store a copy of result
+
+        Returns:
+            Token for get() (16 URL-safe characters)
+        """
+        token = secrets.token_urlsafe(12)
+        stored = copy.deepcopy(result)
+        stored.pop('result_token', None)
+
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            self._results[token] = (now + self.ttl, stored)
+            self._stats['stored'] += 1
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+                self._stats['evicted'] += 1
+        return token
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the result stored under token
+
+        Returns:
+            Copy of the result, or None if the token is unknown or expired
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._results.get(token)
+            if entry is None:
+                self._stats['unknown'] += 1
+                return None
+            expires_at, result = entry
+            if expires_at <= now:
+                del self._results[token]
+                self._stats['expired'] += 1
+                return None
+            self._stats['hits'] += 1
+            return copy.deepcopy(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count and counters"""
+        with self._lock:
+            self._prune(time.monotonic())
+            stats = dict(self._stats)
+            stats['entries'] = len(self._results)
+        stats['ttl'] = self.ttl
+        stats['max_entries'] = self.max_entries
+        return stats
+
+
+# Singleton instance
+_ai_result_store = None
+_ai_result_store_lock = threading.Lock()
+
+
+def get_ai_result_store() -> AIResultStore:
+    """Get or create AIResultStore singleton instance"""
+    global _ai_result_store
+
+    if _ai_result_store is None:
+        with _ai_result_store_lock:
+            if _ai_result_store is None:
+                _ai_result_store = AIResultStore()
+
+    return _ai_result_store
+
+
+def attach_result_token(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Store result and add its 'result_token' (no-op for None); returns result"""
+    if result:
+        result['result_token'] = get_ai_result_store().put(result)
+    return result
@@ -9,9 +9,18 @@ import time
 import sys
 import re
 from pathlib import Path
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
-from database_schema import get_connection
+from contextlib import ExitStack
+from typing import Optional, Dict, Any, Callable
+from datetime import datetime
+from ai_cache import AICache, cache_key
+from ai_concurrency import SingleFlight, ProviderBusyError, get_provider_limiter, get_circuit_breaker
+from ai_deadline import Deadline, DeadlineExceeded, stage_budget
+from ai_telemetry import SearchTrace, get_ai_telemetry
+from ai_clients import get_openai_client, get_perplexity_client, create_completion
+from utils.pdf_cache import get_pdf_cache
+
+# Progress callback: progress(stage, message) - see ai_jobs.AIJob.add_event
+ProgressCallback = Optional[Callable[[str, Optional[str]], None]]
 
 # Add utils directory to path
 sys.path.append(str(Path(__file__).parent / 'utils'))
@@ -24,6 +33,10 @@ except ImportError:
     print("WARNING: PDF parser not available. Install pdfplumber: pip install pdfplumber PyPDF2")
 
 
+class AIUpstreamError(Exception):
+    """AI provider call failed (as opposed to the grade not being found)"""
+
+
 class AISearch:
     """AI-powered search for steel grades using OpenAI API"""
 
@@ -59,42 +72,142 @@ class AISearch:
         # Initialize PDF parser
         self.pdf_parser = PDFParser() if PDF_PARSER_AVAILABLE else None
 
-    def search_steel(self, grade_name: str) -> Optional[Dict[str, Any]]:
+        # Downloaded datasheets and their parse results, shared by all searches
+        self.pdf_cache = get_pdf_cache() if self.pdf_parser else None
+
+        # Two-tier result cache (memory LRU + ai_searches table)
+        self.cache = AICache(ttl=self.cache_ttl)
+
+        # Concurrent searches for the same grade share one upstream call
+        self.flights = SingleFlight()
+
+        # Per-search stage timings, tokens and outcomes (ai_telemetry table)
+        self.telemetry = get_ai_telemetry()
+
+    def search_steel(self, grade_name: str, force: bool = False,
+                     progress: ProgressCallback = None,
+                     raise_errors: bool = False,
+                     deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
         """
         Search for steel grade information using Perplexity AI ONLY.
         OpenAI removed as fallback to ensure 100% accuracy.
 
         Workflow:
-        1. Check cache
-        2. Try Perplexity (ONLY source - internet access, accurate)
-        3. If not found - return None (better than false information)
+        1. Check cache (memory, then database) and recent "not found" answers
+        2. Join an in-flight search for the same grade, if any
+        3. Try Perplexity (ONLY source - internet access, accurate)
+        4. If not found - return None (better than false information)
+        5. Cache result if its confidence meets AI_CACHE_MIN_CONFIDENCE
+           (or remember "not found" for AI_NEGATIVE_CACHE_TTL)
 
         Args:
             grade_name: Name of the steel grade to search
+            force: Skip cached results and "not found" answers, query AI again
+            progress: Called with (stage, message) as the search advances
+                      (cache, waiting, perplexity, pdf, scoring)
+            raise_errors: Raise AIUpstreamError on provider failures instead
+                          of returning None (callers that retry, e.g. bulk_enrich)
+            deadline: Time budget of the caller; stages that do not fit are
+                      skipped or cut short (default: unlimited)
 
         Returns:
             Dictionary with steel information or None if not found
+
+        Raises:
+            ProviderBusyError: Provider admission rejected or circuit open
+            DeadlineExceeded: Not enough time left for the Perplexity call
         """
         if not self.enabled:
             return None
 
-        # CACHE DISABLED - always fetch fresh results to avoid storing incorrect data
-        # cached_result = self._get_from_cache(grade_name)
-        # if cached_result:
-        #     print(f"[CACHE] Found cached result for '{grade_name}' (age: {cached_result.get('cache_age', 0):.0f}s)")
-        #     return cached_result
+        deadline = deadline or Deadline()
+        trace = SearchTrace(grade_name)
+
+        if progress:
+            progress('cache', 'Проверка кэша')
+
+        if not force:
+            cached_result = self.cache.get(grade_name)
+            if cached_result:
+                print(f"[CACHE] Found cached result for '{grade_name}' "
+                      f"({cached_result['cache_tier']}, age: {cached_result.get('cache_age', 0):.0f}s)")
+                self.telemetry.record(trace.finish('cache_hit', cached_result))
+                return cached_result
+
+            miss_age = self.cache.get_miss(grade_name)
+            if miss_age is not None:
+                print(f"[CACHE] '{grade_name}' was not found by AI {miss_age:.0f}s ago "
+                      f"(use force to search again)")
+                self.telemetry.record(trace.finish('miss_cached'))
+                return None
+
+        key = cache_key(grade_name) or grade_name
+        if progress and self.flights.is_in_flight(key):
+            progress('waiting', 'Ожидание уже запущенного поиска этой марки')
+
+        try:
+            result, shared = self.flights.do(
+                key,
+                lambda: self._search_uncached(grade_name, progress, deadline, trace),
+                timeout=deadline.timeout()
+            )
+        except TimeoutError:
+            error = DeadlineExceeded('waiting', f"Deadline: concurrent search of '{grade_name}' did not finish in time")
+            self.telemetry.record(trace.finish('deadline', error=error))
+            raise error
+        except DeadlineExceeded as e:
+            self.telemetry.record(trace.finish('deadline', error=e))
+            raise
+        except ProviderBusyError as e:
+            self.telemetry.record(trace.finish('busy', error=e))
+            raise
+        except AIUpstreamError as e:
+            self.telemetry.record(trace.finish('error', error=e))
+            if raise_errors:
+                raise
+            return None
+        if shared:
+            print(f"[AI Search] '{grade_name}' served by a concurrent search of the same grade")
+            self.telemetry.record(trace.finish('coalesced', result))
+        else:
+            self.telemetry.record(trace.finish('found' if result else 'not_found', result))
+
+        return result
+
+    def _search_uncached(self, grade_name: str, progress: ProgressCallback = None,
+                         deadline: Optional[Deadline] = None,
+                         trace: Optional[SearchTrace] = None) -> Optional[Dict[str, Any]]:
+        """
+        Run the upstream search, score the result and cache it (steps 3-5 of search_steel)
+
+        Args:
+            grade_name: Name of the steel grade to search
+            progress: Stage progress callback (see search_steel)
+            deadline: Time budget (see search_steel)
+            trace: Telemetry of this search (stage timings, tokens, PDF stage)
 
+        Returns:
+            Dictionary with steel information or None if not found
+        """
+        started = time.perf_counter()
         result = None
+        upstream_error = None
 
         # Try Perplexity ONLY (no fallback to OpenAI for 100% accuracy)
         if self.perplexity_key:
             try:
                 print(f"[Perplexity] Searching for '{grade_name}' with internet access...")
-                result = self._search_with_perplexity(grade_name)
+                if progress:
+                    progress('perplexity', 'Поиск через Perplexity AI')
+                result = self._search_with_perplexity(grade_name, progress, deadline, trace)
                 if result:
                     result['ai_source'] = 'perplexity'
                     print(f"[Perplexity] Found result for '{grade_name}'")
+            except (ProviderBusyError, DeadlineExceeded):
+                # Surfaced to the caller as "busy, retry later" (HTTP 429) / timeout (HTTP 504)
+                raise
             except Exception as e:
+                upstream_error = f"Perplexity error: {e}"
                 print(f"[Perplexity] Search error for '{grade_name}': {e}")
         else:
             print(f"[WARNING] Perplexity API key not configured. AI search disabled.")
@@ -103,8 +216,15 @@ class AISearch:
         if not result:
             print(f"[AI Search] Марка '{grade_name}' не найдена через Perplexity")
             print(f"[INFO] OpenAI fallback отключен для обеспечения достоверности на 100%")
+            # Remember only real "not found" answers, not API failures
+            if upstream_error:
+                raise AIUpstreamError(upstream_error)
+            self.cache.put_miss(grade_name, time.perf_counter() - started)
             return None
 
+        if progress:
+            progress('scoring', 'Проверка химического состава')
+
         # Validation (SOFTENED: allow partial data with warning)
         is_valid = self._validate_composition(result)
         result['validated'] = is_valid
@@ -124,9 +244,9 @@ class AISearch:
             print(f"[OK] Найдено {result.get('_valid_elements_count', 0)} валидных элементов")
             print(f"[INFO] Confidence: {confidence_score['level']} ({confidence_score['score']}/100)")
 
-        # CACHE DISABLED - do not save AI results to avoid storing incorrect data
-        # self._save_to_cache(grade_name, result)
-        # print(f"[CACHE] Результат сохранен в кэш на 7 дней")
+        # Only confident results are cached (incorrect data must not be served for days)
+        if self.cache.put(grade_name, result, time.perf_counter() - started):
+            print(f"[CACHE] Результат сохранен в кэш ({self.cache.ttl // 3600} ч)")
 
         return result
 
@@ -141,32 +261,31 @@ class AISearch:
             Dictionary with steel information
         """
         try:
-            # Import OpenAI only when needed
-            from openai import OpenAI
-
-            client = OpenAI(api_key=self.api_key)
+            # Shared pooled client (openai imported on first use)
+            client = get_openai_client(self.api_key)
 
             # Create prompt
             prompt = self._create_prompt(grade_name)
 
-            # Call OpenAI API
-            response = client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert metallurgist and steel database specialist. "
-                                   "Provide accurate, factual information about steel grades. "
-                                   "Return information in valid JSON format only."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
+            # Call OpenAI API (within provider concurrency/rate limits)
+            with get_provider_limiter('openai').slot():
+                response = client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "You are an expert metallurgist and steel database specialist. "
+                                       "Provide accurate, factual information about steel grades. "
+                                       "Return information in valid JSON format only."
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens
+                )
 
             # Parse response
             content = response.choices[0].message.content
@@ -184,25 +303,33 @@ class AISearch:
             print(f"OpenAI API error: {e}")
             return None
 
-    def _search_with_perplexity(self, grade_name: str) -> Optional[Dict[str, Any]]:
+    def _search_with_perplexity(self, grade_name: str, progress: ProgressCallback = None,
+                                deadline: Optional[Deadline] = None,
+                                trace: Optional[SearchTrace] = None) -> Optional[Dict[str, Any]]:
         """
         Search for steel using Perplexity API (with internet access)
 
         Args:
             grade_name: Steel grade name
+            progress: Stage progress callback (see search_steel)
+            deadline: Time budget (see search_steel)
+            trace: Telemetry of this search (see _search_uncached)
 
         Returns:
-            Dictionary with steel information
+            Dictionary with steel information, or None if AI did not find the grade
+
+        Raises:
+            DeadlineExceeded: Less than AI_MIN_PERPLEXITY_BUDGET left
+            Exception: On API errors (caller must not treat them as "not found")
         """
-        try:
-            # Import OpenAI (Perplexity uses compatible API)
-            from openai import OpenAI
+        deadline = deadline or Deadline()
+        trace = trace or SearchTrace(grade_name)
+        budget = stage_budget('perplexity')
+        deadline.require(budget, 'perplexity')
 
-            # Create Perplexity client
-            client = OpenAI(
-                api_key=self.perplexity_key,
-                base_url="https://api.perplexity.ai"
-            )
+        try:
+            # Shared pooled Perplexity client (OpenAI-compatible API)
+            client = get_perplexity_client(self.perplexity_key)
 
             # Create prompt
             prompt = self._create_prompt(grade_name)
@@ -258,22 +385,35 @@ class AISearch:
                 "  ✗ https://www.ssab.com/certificates/hardox-400 (certificates, not composition)"
             )
 
-            # Call Perplexity API
-            response = client.chat.completions.create(
-                model=self.perplexity_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_message
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
+            # Call Perplexity API (circuit breaker, provider concurrency/rate limits,
+            # queue wait and request cut to the deadline)
+            with ExitStack() as call_slot:
+                with trace.stage('perplexity_wait'):
+                    guard = call_slot.enter_context(get_circuit_breaker('perplexity').call())
+                    call_slot.enter_context(
+                        get_provider_limiter('perplexity').slot(max_wait=deadline.timeout(reserve=budget)))
+
+                # Timeouts (also of retries) from what is left after the queue wait;
+                # a timeout cut by the deadline does not count against the provider's circuit
+                with trace.stage('perplexity'):
+                    response = create_completion(
+                        client, deadline, guard,
+                        model=self.perplexity_model,
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": system_message
+                            },
+                            {
+                                "role": "user",
+                                "content": prompt
+                            }
+                        ],
+                        temperature=self.temperature,
+                        max_tokens=self.max_tokens
+                    )
+
+            trace.add_usage('perplexity', getattr(response, 'usage', None))
 
             # Parse response
             content = response.choices[0].message.content
@@ -285,18 +425,23 @@ class AISearch:
             # Now searches for "Typical Composition" table specifically
             # Validates values before replacing Perplexity data
             if result and self.pdf_parser:
-                result = self._enhance_with_pdf(result, content, grade_name)
+                if progress:
+                    progress('pdf', 'Загрузка и анализ PDF')
+                result = self._enhance_with_pdf(result, content, grade_name, deadline, trace)
 
             return result
 
         except ImportError:
             print("ERROR: openai package not installed. Run: pip install openai")
-            return None
+            raise
         except Exception as e:
+            # Propagated so that API failures are not remembered as "not found"
             print(f"Perplexity API error: {e}")
-            return None
+            raise
 
-    def _enhance_with_pdf(self, result: Dict[str, Any], full_content: str, grade_name: str) -> Dict[str, Any]:
+    def _enhance_with_pdf(self, result: Dict[str, Any], full_content: str, grade_name: str,
+                          deadline: Optional[Deadline] = None,
+                          trace: Optional[SearchTrace] = None) -> Dict[str, Any]:
         """
         Enhance AI result with data from PDF datasheets
 
@@ -304,6 +449,10 @@ class AISearch:
             result: AI search result dictionary
             full_content: Full AI response text
             grade_name: Steel grade name
+            deadline: Time budget; the PDF stage (AI_MIN_PDF_BUDGET) and the
+                      AI extraction (AI_MIN_EXTRACTION_BUDGET) are skipped when
+                      less time remains
+            trace: Telemetry of this search (see _search_uncached)
 
         Returns:
             Enhanced result dictionary
@@ -311,6 +460,12 @@ class AISearch:
         if not self.pdf_parser:
             return result
 
+        deadline = deadline or Deadline()
+        trace = trace or SearchTrace(grade_name)
+        if not deadline.allows(stage_budget('pdf')):
+            print(f"[AI Search] PDF enhancement skipped, {deadline}")
+            return result
+
         try:
             # Check if PDF URL is in result
             pdf_url = result.get('pdf_url')
@@ -326,31 +481,56 @@ class AISearch:
 
             print(f"Found PDF datasheet: {pdf_url}")
             print("Downloading and parsing PDF...")
-
-            # Parse PDF
-            pdf_data = self.pdf_parser.parse_pdf_from_url(pdf_url)
+            trace.pdf['found'] = True
+
+            # Parse PDF (downloaded and parsed once per document content),
+            # leaving time for the AI extraction
+            extraction_budget = stage_budget('extraction')
+            with trace.stage('pdf'):
+                if self.pdf_cache and self.pdf_cache.enabled:
+                    pdf_data = self.pdf_cache.fetch(
+                        pdf_url,
+                        lambda path: self.pdf_parser.parse_pdf_file(
+                            path, timeout=deadline.timeout(reserve=extraction_budget)),
+                        parser_version=PDFParser.VERSION,
+                        timeout=deadline.timeout(reserve=extraction_budget)
+                    )
+                else:
+                    pdf_data = self.pdf_parser.parse_pdf_from_url(
+                        pdf_url, timeout=deadline.timeout(reserve=extraction_budget))
 
             if not pdf_data:
                 print("Failed to parse PDF")
                 return result
 
+            trace.pdf['pages'] = pdf_data.get('pages_parsed')
+            trace.pdf['parse_cached'] = pdf_data.get('parse_cached')
+
             # Try to extract composition using AI (more accurate)
             composition = None
-            if self.api_key and 'text' in pdf_data:
+            if self.api_key and 'text' in pdf_data and not deadline.allows(extraction_budget):
+                print(f"[AI Search] AI extraction skipped, {deadline}")
+            elif self.api_key and 'text' in pdf_data:
+                usage = {}
                 try:
-                    from openai import OpenAI
-                    client = OpenAI(api_key=self.api_key)
-                    composition = self.pdf_parser.extract_composition_with_ai(pdf_data['text'], client)
+                    client = get_openai_client(self.api_key)
+                    with trace.stage('extraction'), get_circuit_breaker('openai').call() as guard, \
+                            get_provider_limiter('openai').slot(max_wait=deadline.timeout()):
+                        composition = self.pdf_parser.extract_composition_with_ai(
+                            pdf_data['text'], client, deadline=deadline, guard=guard, usage=usage)
                     if composition:
                         print("Extracted chemical composition from PDF using AI")
+                        trace.pdf['method'] = 'ai'
                 except Exception as e:
                     print(f"AI extraction error: {e}")
+                trace.add_usage('openai', usage or None)
 
             # Fallback to regex extraction
             if not composition and 'composition' in pdf_data:
                 composition = pdf_data['composition']
                 if composition:
                     print("Extracted chemical composition from PDF using regex")
+                    trace.pdf['method'] = 'regex'
 
             # Update result with PDF data (with minimal validation - only critical errors)
             if composition:
@@ -397,6 +577,7 @@ class AISearch:
                             print(f"  ✗ REJECTED {element.upper()}: {composition[element]} (cannot parse)")
                             rejected_count += 1
 
+                trace.pdf['updated'] = updated_count
                 if updated_count > 0:
                     # Add metadata
                     result['pdf_source'] = pdf_url
@@ -808,115 +989,6 @@ Example result for proprietary grade K888:
             print(f"Response: {content[:200]}...")
             return None
 
-    def _get_from_cache(self, grade_name: str) -> Optional[Dict[str, Any]]:
-        """
-        Get cached AI search result from database
-
-        Args:
-            grade_name: Steel grade name
-
-        Returns:
-            Cached result or None
-        """
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            # Check if ai_searches table exists
-            cursor.execute("""
-                SELECT name FROM sqlite_master
-                WHERE type='table' AND name='ai_searches'
-            """)
-
-            if not cursor.fetchone():
-                # Create table if it doesn't exist
-                self._create_cache_table()
-
-            # Get cached result
-            cursor.execute("""
-                SELECT result, created_at
-                FROM ai_searches
-                WHERE grade_name = ?
-                ORDER BY created_at DESC
-                LIMIT 1
-            """, (grade_name,))
-
-            row = cursor.fetchone()
-            conn.close()
-
-            if row:
-                result_json, created_at = row
-                created_time = datetime.fromisoformat(created_at)
-
-                # Check if cache is still valid
-                if datetime.now() - created_time < timedelta(seconds=self.cache_ttl):
-                    result = json.loads(result_json)
-                    result['cached'] = True
-                    result['cache_age'] = (datetime.now() - created_time).total_seconds()
-                    return result
-
-            return None
-
-        except Exception as e:
-            print(f"Cache read error: {e}")
-            return None
-
-    def _save_to_cache(self, grade_name: str, result: Dict[str, Any]) -> None:
-        """
-        Save AI search result to cache
-
-        Args:
-            grade_name: Steel grade name
-            result: Search result dictionary
-        """
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            # Ensure table exists
-            self._create_cache_table()
-
-            # Save result
-            result_json = json.dumps(result)
-            created_at = datetime.now().isoformat()
-
-            cursor.execute("""
-                INSERT INTO ai_searches (grade_name, result, created_at)
-                VALUES (?, ?, ?)
-            """, (grade_name, result_json, created_at))
-
-            conn.commit()
-            conn.close()
-
-        except Exception as e:
-            print(f"Cache save error: {e}")
-
-    def _create_cache_table(self) -> None:
-        """Create ai_searches cache table"""
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS ai_searches (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    grade_name TEXT NOT NULL,
-                    result TEXT NOT NULL,
-                    created_at TEXT NOT NULL
-                )
-            """)
-
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_ai_grade
-                ON ai_searches(grade_name)
-            """)
-
-            conn.commit()
-            conn.close()
-
-        except Exception as e:
-            print(f"Failed to create cache table: {e}")
-
 
 # Singleton instance
 _ai_search_instance = None
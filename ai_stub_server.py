@@ -0,0 +1,373 @@
+"""
+Local stub of the Perplexity / OpenAI chat completions API
+
+Serves the subset of POST /chat/completions used by AISearch (grade search,
+PDF composition extraction) and the bot's ContextAnalyzer, with configurable
+latency, error rates and canned answers. Point the clients at it to run and
+benchmark the whole AI path (cache, single-flight, provider limiters,
+deadlines, circuit breakers) offline and without provider costs:
+
+    python ai_stub_server.py --latency perplexity=lognormal:8,25 --latency openai=fixed:1 \\
+        --error-rate perplexity=0.05 --answers answers.json
+
+    PERPLEXITY_BASE_URL=http://localhost:5055/perplexity
+    OPENAI_BASE_URL=http://localhost:5055/openai
+    PERPLEXITY_API_KEY=stub                # any value enables AI search
+
+The first path segment names a profile (any name; without it the 'default'
+profile is used). Options taking PROFILE=VALUE apply to that profile, a bare
+VALUE to all profiles without their own setting.
+
+Latency distributions (seconds):
+    fixed:S                 always S
+    uniform:A,B             uniformly between A and B
+    normal:MEAN,SD          normal, cut at 0
+    lognormal:MEDIAN,P95    long-tailed, like real LLM answers
+
+Failures (per request, independent):
+    --error-rate            HTTP 500
+    --rate-limit-rate       HTTP 429 with Retry-After
+    --stall-rate            answer only after --stall-seconds (client timeouts)
+
+Note that the openai client retries 429/500 answers itself (AI_HTTP_MAX_RETRIES).
+
+Answers: a grade in --answers ({"grades": {"HARDOX 500": {...}}, "pdf": {...}})
+is answered with its entry (found: true is added). Other grades get a
+generated answer with a composition derived from the grade name (stable
+between runs), or found: false for --not-found-rate of them. PDF extraction
+requests get answers["pdf"] or a fixed composition; ContextAnalyzer requests
+get intent "search" with the message as grade.
+
+GET /stats returns request counts, failures and peak concurrency per profile.
+"""
+
+import re
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from typing import Optional, Dict, Any, List
+
+from flask import Flask, jsonify, request
+
+from grade_index import normalize_grade_name
+
+
+GRADE_PROMPT = re.compile(r'Find detailed information about steel grade "(.+?)"')
+CONTEXT_PROMPT = re.compile(r'User message: "(.*?)"', re.DOTALL)
+PDF_PROMPT = 'Extract the chemical composition'
+
+# Element ranges for generated answers: (min, max) weight %
+_GENERATED_RANGES = {
+    'c': (0.05, 1.5), 'cr': (0.5, 18.0), 'mo': (0.1, 3.0), 'v': (0.05, 2.0),
+    'mn': (0.2, 1.5), 'si': (0.1, 1.2), 's': (0.005, 0.03), 'p': (0.005, 0.03)
+}
+
+_DEFAULT_PDF_COMPOSITION = {'c': '0.40', 'cr': '5.00', 'mo': '1.30', 'v': '1.00', 'si': '1.00', 'mn': '0.40'}
+
+
+class LatencyDistribution:
+    """Response delay parsed from a spec like 'lognormal:8,25'"""
+
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal')
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(':')
+        try:
+            values = [float(value) for value in params.split(',')] if params else []
+        except ValueError:
+            raise ValueError(f"Invalid latency spec '{spec}'")
+
+        expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}.get(kind)
+        if expected is None or len(values) != expected:
+            raise ValueError(f"Invalid latency spec '{spec}' (use {', '.join(self.KINDS)})")
+        if kind == 'lognormal' and not 0 < values[0] <= values[1]:
+            raise ValueError(f"Invalid latency spec '{spec}' (need 0 < median <= p95)")
+
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == 'fixed':
+            return self.values[0]
+        if self.kind == 'uniform':
+            return rng.uniform(*self.values)
+        if self.kind == 'normal':
+            return max(0.0, rng.gauss(*self.values))
+        median, p95 = self.values
+        sigma = (math.log(p95) - math.log(median)) / 1.645
+        return rng.lognormvariate(math.log(median), sigma)
+
+
+class StubProfile:
+    """Behaviour of one stubbed provider"""
+
+    def __init__(self, name: str, latency: LatencyDistribution, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, stall_rate: float = 0.0, stall_seconds: float = 300.0):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {
+            'requests': 0,
+            'ok': 0,
+            'errors': 0,
+            'rate_limited': 0,
+            'stalled': 0,
+            'peak_concurrency': 0,
+            'delay_seconds': 0.0
+        }
+
+    def enter(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.stats['requests'] += 1
+            self.stats['peak_concurrency'] = max(self.stats['peak_concurrency'], self.in_flight)
+
+    def leave(self, outcome: str, delay: float) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.stats[outcome] += 1
+            self.stats['delay_seconds'] += delay
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = self.in_flight
+        stats['delay_seconds'] = round(stats['delay_seconds'], 2)
+        stats['latency'] = self.latency.spec
+        stats['error_rate'] = self.error_rate
+        stats['rate_limit_rate'] = self.rate_limit_rate
+        stats['stall_rate'] = self.stall_rate
+        return stats
+
+
+def _stable_fraction(text: str, salt: str = '') -> float:
+    """Deterministic number in [0, 1) for text (same answer for the same grade)"""
+    digest = hashlib.sha256(f"{salt}:{text}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+
+def generated_answer(grade: str, not_found_rate: float = 0.0) -> Dict[str, Any]:
+    """Plausible search answer for a grade without a canned entry"""
+    key = normalize_grade_name(grade) or grade
+    if _stable_fraction(key, 'found') < not_found_rate:
+        return {'grade': grade, 'found': False}
+
+    answer = {
+        'grade': grade,
+        'found': True,
+        'analogues': None,
+        'base': 'Fe',
+        'standard': 'STUB',
+        'application': 'Тестовая марка (ответ заглушки AI)',
+        'properties': 'Сгенерированный состав',
+        'manufacturer': None,
+        'manufacturer_country': None,
+        'source_url': f"https://stub.invalid/steels/{key.lower()}",
+        'source_tier': 'tier2',
+        'verification_sources': [
+            {'url': f"https://stub.invalid/a/{key.lower()}", 'type': 'standard', 'verified_fields': ['c', 'cr']},
+            {'url': f"https://stub.invalid/b/{key.lower()}", 'type': 'database', 'verified_fields': ['c', 'mo']}
+        ]
+    }
+    for element, (low, high) in _GENERATED_RANGES.items():
+        value = low + (high - low) * _stable_fraction(key, element)
+        answer[element] = f"{value:.3f}" if high < 0.1 else f"{value:.2f}"
+    return answer
+
+
+def create_stub_app(profiles: Dict[str, StubProfile], answers: Optional[Dict[str, Any]] = None,
+                    not_found_rate: float = 0.0, seed: Optional[int] = None) -> Flask:
+    """
+    Create the stub Flask app
+
+    Args:
+        profiles: Profile name → behaviour; 'default' serves unknown names
+        answers: Canned answers ({"grades": {...}, "pdf": {...}})
+        not_found_rate: Fraction of generated answers with found: false
+        seed: Random seed for latency and failures (None = random)
+    """
+    app = Flask(__name__)
+    answers = answers or {}
+    canned = {normalize_grade_name(grade): answer for grade, answer in (answers.get('grades') or {}).items()}
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def draw(profile: StubProfile) -> Dict[str, float]:
+        with rng_lock:
+            return {
+                'delay': profile.latency.sample(rng),
+                'error': rng.random(),
+                'rate_limit': rng.random(),
+                'stall': rng.random()
+            }
+
+    def answer_for(messages: List[Dict[str, Any]]) -> str:
+        prompt = '\n'.join(str(message.get('content') or '') for message in messages)
+
+        match = GRADE_PROMPT.search(prompt)
+        if match:
+            grade = match.group(1)
+            answer = canned.get(normalize_grade_name(grade))
+            if answer is not None:
+                answer = dict(answer, grade=answer.get('grade', grade))
+                answer.setdefault('found', True)
+            else:
+                answer = generated_answer(grade, not_found_rate)
+            return json.dumps(answer, ensure_ascii=False, indent=2)
+
+        if PDF_PROMPT in prompt:
+            return json.dumps(answers.get('pdf') or _DEFAULT_PDF_COMPOSITION)
+
+        match = CONTEXT_PROMPT.search(prompt)
+        if match:
+            message = match.group(1).strip()
+            return json.dumps({'intent': 'search', 'grade': message or None, 'grades': None,
+                               'tolerance': None, 'max_results': None, 'confidence': 0.9},
+                              ensure_ascii=False)
+
+        return "Stub answer"
+
+    def completions(profile_name: str):
+        profile = profiles.get(profile_name) or profiles['default']
+        data = request.get_json(silent=True) or {}
+        messages = data.get('messages') or []
+        if not messages:
+            return jsonify({'error': {'message': 'messages is required', 'type': 'invalid_request_error'}}), 400
+
+        chance = draw(profile)
+        profile.enter()
+        outcome, delay = 'ok', chance['delay']
+        try:
+            if chance['stall'] < profile.stall_rate:
+                outcome, delay = 'stalled', profile.stall_seconds
+                time.sleep(delay)
+                return jsonify({'error': {'message': 'Stub stall', 'type': 'timeout'}}), 504
+
+            if chance['rate_limit'] < profile.rate_limit_rate:
+                outcome, delay = 'rate_limited', 0.0
+                response = jsonify({'error': {'message': 'Stub rate limit', 'type': 'rate_limit_error'}})
+                response.headers['Retry-After'] = '1'
+                return response, 429
+
+            time.sleep(delay)
+            if chance['error'] < profile.error_rate:
+                outcome = 'errors'
+                return jsonify({'error': {'message': 'Stub server error', 'type': 'server_error'}}), 500
+
+            content = answer_for(messages)
+            prompt_tokens = sum(len(str(message.get('content') or '')) for message in messages) // 4
+            return jsonify({
+                'id': f"stub-{time.monotonic_ns()}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': data.get('model', 'stub'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': len(content) // 4,
+                    'total_tokens': prompt_tokens + len(content) // 4
+                },
+                'citations': []
+            })
+        finally:
+            profile.leave(outcome, delay)
+
+    @app.route('/chat/completions', methods=['POST'])
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def default_completions():
+        return completions('default')
+
+    @app.route('/<profile_name>/chat/completions', methods=['POST'])
+    @app.route('/<profile_name>/v1/chat/completions', methods=['POST'])
+    def profile_completions(profile_name):
+        return completions(profile_name)
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        return jsonify({name: profile.snapshot() for name, profile in profiles.items()})
+
+    return app
+
+
+def _per_profile(values: List[str], default: str, convert) -> Dict[str, Any]:
+    """Parse repeated [PROFILE=]VALUE options into {profile: value}"""
+    result = {'default': convert(default)}
+    for value in values or []:
+        name, sep, setting = value.partition('=')
+        if sep:
+            result[name] = convert(setting)
+        else:
+            result['default'] = convert(value)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible chat completions server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--latency', action='append', metavar='[PROFILE=]SPEC',
+                        help="fixed:S | uniform:A,B | normal:MEAN,SD | lognormal:MEDIAN,P95 (default fixed:0.5)")
+    parser.add_argument('--error-rate', action='append', metavar='[PROFILE=]RATE', help="HTTP 500 fraction")
+    parser.add_argument('--rate-limit-rate', action='append', metavar='[PROFILE=]RATE', help="HTTP 429 fraction")
+    parser.add_argument('--stall-rate', action='append', metavar='[PROFILE=]RATE',
+                        help="fraction answered after --stall-seconds")
+    parser.add_argument('--stall-seconds', type=float, default=300.0)
+    parser.add_argument('--answers', help="JSON file with canned answers")
+    parser.add_argument('--not-found-rate', type=float, default=0.0,
+                        help="fraction of generated answers with found: false")
+    parser.add_argument('--seed', type=int, help="random seed (reproducible latency and failures)")
+    args = parser.parse_args()
+
+    try:
+        latencies = _per_profile(args.latency, 'fixed:0.5', LatencyDistribution)
+    except ValueError as e:
+        parser.error(str(e))
+    error_rates = _per_profile(args.error_rate, '0', float)
+    rate_limit_rates = _per_profile(args.rate_limit_rate, '0', float)
+    stall_rates = _per_profile(args.stall_rate, '0', float)
+
+    names = set(latencies) | set(error_rates) | set(rate_limit_rates) | set(stall_rates)
+    profiles = {
+        name: StubProfile(
+            name,
+            latencies.get(name, latencies['default']),
+            error_rate=error_rates.get(name, error_rates['default']),
+            rate_limit_rate=rate_limit_rates.get(name, rate_limit_rates['default']),
+            stall_rate=stall_rates.get(name, stall_rates['default']),
+            stall_seconds=args.stall_seconds
+        )
+        for name in names
+    }
+
+    answers = None
+    if args.answers:
+        with open(args.answers, 'r', encoding='utf-8') as f:
+            answers = json.load(f)
+
+    for name, profile in sorted(profiles.items()):
+        print(f"[AI Stub] Profile '{name}': latency {profile.latency.spec}, errors {profile.error_rate:g}, "
+              f"429 {profile.rate_limit_rate:g}, stalls {profile.stall_rate:g}")
+    print(f"[AI Stub] Listening on http://{args.host}:{args.port}/<profile>/chat/completions")
+
+    app = create_stub_app(profiles, answers, not_found_rate=args.not_found_rate, seed=args.seed)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,406 @@
+"""
+Telemetry of AI searches
+
+Every AISearch.search_steel call is recorded as one row of ai_telemetry:
+outcome (found / not_found / cache_hit / miss_cached / coalesced / busy /
+deadline / error), stage timings, token usage reported by the providers,
+the PDF stage (datasheet found, parse cached, values taken from it) and the
+confidence of the result (see AISearch._calculate_confidence_score).
+
+The summary (GET /api/steels/ai-telemetry?hours=24) answers capacity
+questions: p50/p95 per stage, tokens per upstream search, cache hit rate,
+how often the PDF stage changes the result, confidence distribution.
+
+Recording never fails a search and never waits for the database: rows are
+buffered in memory and a daemon thread inserts them in batches (one
+transaction per batch) every AI_TELEMETRY_FLUSH_INTERVAL seconds, or as soon
+as AI_TELEMETRY_BATCH_SIZE rows are pending. Pending rows are flushed at
+interpreter exit and before a summary. Database errors are printed and
+ignored; if the database stays unavailable, the oldest buffered rows are
+dropped beyond MAX_BUFFERED_BATCHES batches.
+
+Settings (.env):
+    AI_TELEMETRY_ENABLED=True
+    AI_TELEMETRY_RETENTION_DAYS=30  # older rows are deleted
+    AI_TELEMETRY_FLUSH_INTERVAL=2   # seconds between batch inserts
+    AI_TELEMETRY_BATCH_SIZE=100     # pending rows that trigger an insert right away
+
+Usage:
+    trace = SearchTrace(grade_name)
+    with trace.stage('perplexity'):
+        response = client.chat.completions.create(...)
+    trace.add_usage('perplexity', response.usage)
+    get_ai_telemetry().record(trace.finish('found', result))
+"""
+
+import os
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Iterator, List
+
+from database_schema import get_connection, create_ai_telemetry_table
+from ai_cache import cache_key
+
+
+# Stages timed per search (milliseconds, see SearchTrace.stage)
+STAGES = ('perplexity_wait', 'perplexity', 'pdf', 'extraction')
+
+# Outcomes that ran the upstream pipeline (as opposed to cache hits and joins)
+UPSTREAM_OUTCOMES = ('found', 'not_found', 'error', 'deadline')
+
+# Providers with token accounting
+PROVIDERS = ('perplexity', 'openai')
+
+INSERT_SQL = """
+    INSERT INTO ai_telemetry (
+        created_at, grade, cache_key, outcome, cache_tier, error, total_ms,
+        perplexity_wait_ms, perplexity_ms, pdf_ms, extraction_ms,
+        perplexity_prompt_tokens, perplexity_completion_tokens,
+        openai_prompt_tokens, openai_completion_tokens,
+        pdf_found, pdf_parse_cached, pdf_pages, pdf_method, pdf_updated,
+        confidence, confidence_score, validated
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+class SearchTrace:
+    """Measurements of one search, filled as it runs (one thread at a time)"""
+
+    def __init__(self, grade_name: str):
+        self.grade = grade_name
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.tokens: Dict[str, List[int]] = {}
+        self.pdf: Dict[str, Any] = {}
+        self.outcome: Optional[str] = None
+        self.cache_tier: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.total_ms = 0
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Add the duration of the block to stage name (also on exceptions)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+    def add_usage(self, provider: str, usage: Any) -> None:
+        """
+        Add token usage of a chat completion response
+
+        Args:
+            provider: 'perplexity' or 'openai'
+            usage: response.usage (object or dict with prompt_tokens /
+                   completion_tokens), None if the provider did not report it
+        """
+        if usage is None:
+            return
+        if isinstance(usage, dict):
+            prompt, completion = usage.get('prompt_tokens'), usage.get('completion_tokens')
+        else:
+            prompt, completion = getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None)
+
+        totals = self.tokens.setdefault(provider, [0, 0])
+        totals[0] += int(prompt or 0)
+        totals[1] += int(completion or 0)
+
+    def finish(self, outcome: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[BaseException] = None) -> 'SearchTrace':
+        """Set outcome and total time; returns self for record()"""
+        self.outcome = outcome
+        self.result = result
+        if result:
+            self.cache_tier = result.get('cache_tier')
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"[:300]
+        self.total_ms = int((time.perf_counter() - self.started) * 1000)
+        return self
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _rate(part: int, whole: int) -> Optional[float]:
+    return round(part / whole, 3) if whole else None
+
+
+class AITelemetry:
+    """Buffers SearchTrace rows, writes them to ai_telemetry in batches and summarizes them"""
+
+    # Old rows are deleted every PRUNE_EVERY records
+    PRUNE_EVERY = 500
+
+    # Buffered rows kept while the database is unavailable (in batches)
+    MAX_BUFFERED_BATCHES = 50
+
+    def __init__(self, flush_interval: Optional[float] = None, batch_size: Optional[int] = None):
+        """
+        Args:
+            flush_interval: Seconds between batch inserts (default: AI_TELEMETRY_FLUSH_INTERVAL)
+            batch_size: Pending rows that trigger an insert (default: AI_TELEMETRY_BATCH_SIZE)
+        """
+        self.enabled = os.getenv('AI_TELEMETRY_ENABLED', 'True').lower() == 'true'
+        self.retention_days = int(os.getenv('AI_TELEMETRY_RETENTION_DAYS', '30'))
+        self.flush_interval = flush_interval if flush_interval is not None else float(
+            os.getenv('AI_TELEMETRY_FLUSH_INTERVAL', '2'))
+        self.batch_size = batch_size if batch_size is not None else int(
+            os.getenv('AI_TELEMETRY_BATCH_SIZE', '100'))
+
+        self._lock = threading.Lock()
+        self._recorded = 0
+        self._failures = 0
+        self._dropped = 0
+        self._batches = 0
+
+        # Pending rows; the writer thread swaps the list out under _cond
+        self._cond = threading.Condition(self._lock)
+        self._pending: List[tuple] = []
+        self._thread = None
+        # Serializes batch inserts (writer thread and flush())
+        self._write_lock = threading.Lock()
+
+        if self.enabled:
+            self._create_table()
+
+    def _create_table(self) -> None:
+        try:
+            conn = get_connection()
+            try:
+                create_ai_telemetry_table(conn.cursor())
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[AI Telemetry] Failed to create telemetry table, telemetry disabled: {e}")
+            self.enabled = False
+
+    def record(self, trace: SearchTrace) -> None:
+        """Queue one search for the next batch insert (never blocks on the database)"""
+        if not self.enabled:
+            return
+
+        result = trace.result or {}
+        perplexity = trace.tokens.get('perplexity', [None, None])
+        openai = trace.tokens.get('openai', [None, None])
+        stages = {name: int(trace.stages[name]) if name in trace.stages else None for name in STAGES}
+
+        def flag(name):
+            return int(trace.pdf[name]) if trace.pdf.get(name) is not None else None
+
+        row = (
+            datetime.now().isoformat(), trace.grade, cache_key(trace.grade), trace.outcome,
+            trace.cache_tier, trace.error, trace.total_ms,
+            stages['perplexity_wait'], stages['perplexity'], stages['pdf'], stages['extraction'],
+            perplexity[0], perplexity[1], openai[0], openai[1],
+            flag('found'), flag('parse_cached'), trace.pdf.get('pages'),
+            trace.pdf.get('method'), trace.pdf.get('updated'),
+            result.get('confidence'), result.get('confidence_score'),
+            int(result['validated']) if 'validated' in result else None
+        )
+
+        with self._cond:
+            self._pending.append(row)
+            overflow = len(self._pending) - self.batch_size * self.MAX_BUFFERED_BATCHES
+            if overflow > 0:
+                del self._pending[:overflow]
+                self._dropped += overflow
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ai-telemetry', daemon=True)
+                self._thread.start()
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                # Collect a batch for up to flush_interval, or less if it fills up
+                self._cond.wait_for(lambda: len(self._pending) >= self.batch_size, self.flush_interval)
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Insert all pending rows now (one transaction per batch)
+
+        Returns:
+            Number of rows written
+        """
+        written = 0
+        with self._write_lock:
+            while True:
+                with self._cond:
+                    batch = self._pending[:self.batch_size]
+                    del self._pending[:len(batch)]
+                if not batch:
+                    return written
+
+                try:
+                    conn = get_connection()
+                    try:
+                        conn.executemany(INSERT_SQL, batch)
+                        conn.commit()
+
+                        with self._lock:
+                            prune = (self._recorded // self.PRUNE_EVERY
+                                     != (self._recorded + len(batch)) // self.PRUNE_EVERY)
+                            self._recorded += len(batch)
+                            self._batches += 1
+                        if prune:
+                            self._prune(conn)
+                    finally:
+                        conn.close()
+                except Exception as e:
+                    # Keep the rows for the next flush (bounded in record)
+                    with self._cond:
+                        self._pending[:0] = batch
+                        self._failures += 1
+                    print(f"[AI Telemetry] Failed to write {len(batch)} searches: {e}")
+                    return written
+                written += len(batch)
+
+    def _prune(self, conn) -> None:
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+        deleted = conn.execute("DELETE FROM ai_telemetry WHERE created_at < ?", (cutoff,)).rowcount
+        conn.commit()
+        if deleted:
+            print(f"[AI Telemetry] Deleted {deleted} rows older than {self.retention_days} days")
+
+    def summary(self, hours: float = 24) -> Dict[str, Any]:
+        """
+        Aggregate the searches of the last hours
+
+        Returns:
+            Dict with searches, outcomes, cache, latency_ms (per stage:
+            count/p50/p95/max), tokens, pdf and confidence sections
+        """
+        since = (datetime.now() - timedelta(hours=hours)).isoformat()
+        if self.enabled:
+            self.flush()
+
+        conn = get_connection()
+        try:
+            cursor = conn.execute("SELECT * FROM ai_telemetry WHERE created_at >= ?", (since,))
+            columns = [description[0] for description in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+        outcomes: Dict[str, int] = {}
+        for row in rows:
+            outcomes[row['outcome']] = outcomes.get(row['outcome'], 0) + 1
+        upstream = [row for row in rows if row['outcome'] in UPSTREAM_OUTCOMES]
+        found = [row for row in upstream if row['outcome'] == 'found']
+
+        # Latency: total per outcome group, stages over the searches that ran them
+        latency = {}
+        for name, group in (('total_upstream', upstream),
+                            ('total_cache_hit', [row for row in rows if row['outcome'] == 'cache_hit']),
+                            ('total_coalesced', [row for row in rows if row['outcome'] == 'coalesced'])):
+            latency[name] = [row['total_ms'] for row in group if row['total_ms'] is not None]
+        for name in STAGES:
+            latency[name] = [row[f'{name}_ms'] for row in upstream if row[f'{name}_ms'] is not None]
+        latency = {
+            name: {
+                'count': len(values),
+                'p50': _percentile(values, 0.5),
+                'p95': _percentile(values, 0.95),
+                'max': max(values) if values else None
+            }
+            for name, values in latency.items()
+        }
+
+        tokens = {}
+        for provider in PROVIDERS:
+            prompt = [row[f'{provider}_prompt_tokens'] for row in upstream
+                      if row[f'{provider}_prompt_tokens'] is not None]
+            completion = sum(row[f'{provider}_completion_tokens'] or 0 for row in upstream)
+            tokens[provider] = {
+                'calls': len(prompt),
+                'prompt': sum(prompt),
+                'completion': completion,
+                'per_search': round((sum(prompt) + completion) / len(upstream), 1) if upstream else None
+            }
+
+        cache_hits = outcomes.get('cache_hit', 0) + outcomes.get('miss_cached', 0) + outcomes.get('coalesced', 0)
+        pdf_found = [row for row in found if row['pdf_found']]
+        pdf_parsed = [row for row in pdf_found if row['pdf_pages'] is not None]
+        pdf_updated = [row for row in pdf_found if row['pdf_updated']]
+        methods: Dict[str, int] = {}
+        for row in pdf_updated:
+            methods[row['pdf_method']] = methods.get(row['pdf_method'], 0) + 1
+
+        levels: Dict[str, int] = {'high': 0, 'medium': 0, 'low': 0}
+        scores: Dict[str, int] = {}
+        for row in found:
+            if row['confidence'] in levels:
+                levels[row['confidence']] += 1
+            if row['confidence_score'] is not None:
+                bucket = min(int(row['confidence_score']) // 10 * 10, 90)
+                label = f"{bucket}-{bucket + 9 if bucket < 90 else 100}"
+                scores[label] = scores.get(label, 0) + 1
+
+        with self._lock:
+            process = {
+                'recorded': self._recorded,
+                'record_failures': self._failures,
+                'dropped': self._dropped,
+                'batches': self._batches,
+                'pending': len(self._pending)
+            }
+
+        return {
+            'hours': hours,
+            'searches': len(rows),
+            'upstream_searches': len(upstream),
+            'outcomes': outcomes,
+            'cache': {
+                'hits': cache_hits,
+                'hit_rate': _rate(cache_hits, len(rows))
+            },
+            'latency_ms': latency,
+            'tokens': tokens,
+            'pdf': {
+                'datasheet_found': len(pdf_found),
+                'parsed': len(pdf_parsed),
+                'parse_cached': sum(1 for row in pdf_found if row['pdf_parse_cached']),
+                'improved_result': len(pdf_updated),
+                'found_rate': _rate(len(pdf_found), len(found)),
+                'hit_rate': _rate(len(pdf_updated), len(pdf_found)),
+                'methods': methods
+            },
+            'confidence': {
+                'levels': levels,
+                'scores': dict(sorted(scores.items(), key=lambda item: int(item[0].split('-')[0]))),
+                'validated_rate': _rate(sum(1 for row in found if row['validated']), len(found))
+            },
+            'process': process
+        }
+
+
+# Singleton instance
+_ai_telemetry = None
+_ai_telemetry_lock = threading.Lock()
+
+
+def get_ai_telemetry() -> AITelemetry:
+    """Get or create AITelemetry singleton instance (flushed at exit)"""
+    global _ai_telemetry
+
+    if _ai_telemetry is None:
+        with _ai_telemetry_lock:
+            if _ai_telemetry is None:
+                _ai_telemetry = AITelemetry()
+                atexit.register(_ai_telemetry.flush)
+
+    return _ai_telemetry
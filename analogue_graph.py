@@ -0,0 +1,433 @@
+"""
+Analogue graph: parsed, indexed analogue links between grades
+
+The analogues column of steel_grades is free text ("1.2379|D2|SKD11" or
+"1.2379 D2 SKD11"). This module keeps it parsed into steel_analogues edges
+(grade_id → analogue_name → resolved_grade_id) with indexes in both
+directions, so "analogues of X" and "who lists X as analogue" are single
+indexed queries instead of one exact-search request per analogue.
+
+Equivalence classes ("all equivalents of 1.2379 across AISI/GOST/JIS") are
+the connected components of the graph whose nodes are normalized names and
+whose edges are analogue links. They are computed with union-find and stored
+in grade_classes (grade_id → class_id), so a whole class is one indexed query.
+
+Edges and classes are maintained in the same transaction as add/delete
+(index_grade / unindex_grades) and rebuilt on startup if they are out of
+sync with steel_grades (e.g. after an import made outside the API).
+"""
+
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from database_schema import get_connection, create_analogue_tables
+from grade_index import normalize_grade_name, split_analogues
+
+
+class UnionFind:
+    """Disjoint sets with path halving and union by size"""
+
+    def __init__(self):
+        self._parent: Dict[str, str] = {}
+        self._size: Dict[str, int] = {}
+
+    def find(self, item: str) -> str:
+        parent = self._parent
+        if item not in parent:
+            parent[item] = item
+            self._size[item] = 1
+            return item
+
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a: str, b: str) -> str:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self._size[root_a] < self._size[root_b]:
+            root_a, root_b = root_b, root_a
+        self._parent[root_b] = root_a
+        self._size[root_a] += self._size[root_b]
+        return root_a
+
+
+def _grade_node(grade_id: int, grade_key: str) -> str:
+    # Grades without a usable name form their own class
+    return grade_key or f"#{grade_id}"
+
+
+def _compute_classes(grade_keys: Dict[int, str],
+                     edges: Iterable[Tuple[int, str]]) -> Dict[int, int]:
+    """
+    Connected components of grades linked by shared names or analogue links
+
+    Args:
+        grade_keys: {grade_id: normalized grade name}
+        edges: (grade_id, analogue_key) pairs
+
+    Returns:
+        {grade_id: class_id}, class_id = lowest grade id in the component
+    """
+    union_find = UnionFind()
+    for grade_id, grade_key in grade_keys.items():
+        union_find.find(_grade_node(grade_id, grade_key))
+    for grade_id, analogue_key in edges:
+        if grade_id in grade_keys:
+            union_find.union(_grade_node(grade_id, grade_keys[grade_id]), analogue_key)
+
+    class_of_root: Dict[str, int] = {}
+    for grade_id in sorted(grade_keys):
+        root = union_find.find(_grade_node(grade_id, grade_keys[grade_id]))
+        class_of_root.setdefault(root, grade_id)
+
+    return {
+        grade_id: class_of_root[union_find.find(_grade_node(grade_id, grade_key))]
+        for grade_id, grade_key in grade_keys.items()
+    }
+
+
+def _resolve_grade_id(conn: sqlite3.Connection, grade_key: str) -> Optional[int]:
+    """Lowest grade id with this normalized name (or None)"""
+    row = conn.execute(
+        "SELECT MIN(grade_id) FROM grade_keys WHERE grade_key = ?", (grade_key,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _insert_edges(conn: sqlite3.Connection, grade_id: int, grade: str,
+                  analogues: Optional[str], resolve: bool) -> int:
+    """Insert edges for one grade. Returns number of edges inserted."""
+    grade_key = normalize_grade_name(grade)
+    count = 0
+
+    for analogue in split_analogues(analogues):
+        analogue_key = normalize_grade_name(analogue)
+        if not analogue_key or analogue_key == grade_key:
+            continue
+        resolved_id = _resolve_grade_id(conn, analogue_key) if resolve else None
+        cursor = conn.execute("""
+            INSERT OR IGNORE INTO steel_analogues
+                (grade_id, analogue_name, analogue_key, resolved_grade_id)
+            VALUES (?, ?, ?, ?)
+        """, (grade_id, analogue, analogue_key, resolved_id))
+        count += cursor.rowcount
+
+    return count
+
+
+def rebuild_analogue_graph(conn: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Rebuild grade_keys and steel_analogues from steel_grades (caller commits)
+
+    Returns:
+        {'grades': N, 'edges': N, 'resolved': N, 'classes': N}
+    """
+    cursor = conn.cursor()
+    create_analogue_tables(cursor)
+
+    cursor.execute("DELETE FROM steel_analogues")
+    cursor.execute("DELETE FROM grade_keys")
+    cursor.execute("DELETE FROM grade_classes")
+
+    rows = cursor.execute("SELECT id, grade, analogues FROM steel_grades").fetchall()
+
+    cursor.executemany(
+        "INSERT INTO grade_keys (grade_id, grade_key) VALUES (?, ?)",
+        [(grade_id, normalize_grade_name(grade) or '') for grade_id, grade, _ in rows]
+    )
+
+    edges = 0
+    for grade_id, grade, analogues in rows:
+        edges += _insert_edges(conn, grade_id, grade or '', analogues, resolve=False)
+
+    # Resolve all edges in one statement (uses idx_grade_key)
+    cursor.execute("""
+        UPDATE steel_analogues
+        SET resolved_grade_id = (
+            SELECT MIN(grade_id) FROM grade_keys
+            WHERE grade_key = steel_analogues.analogue_key
+        )
+    """)
+
+    resolved = cursor.execute(
+        "SELECT COUNT(*) FROM steel_analogues WHERE resolved_grade_id IS NOT NULL"
+    ).fetchone()[0]
+
+    classes = _compute_classes(
+        dict(cursor.execute("SELECT grade_id, grade_key FROM grade_keys").fetchall()),
+        cursor.execute("SELECT grade_id, analogue_key FROM steel_analogues").fetchall()
+    )
+    cursor.executemany(
+        "INSERT INTO grade_classes (grade_id, class_id) VALUES (?, ?)",
+        classes.items()
+    )
+
+    return {
+        'grades': len(rows),
+        'edges': edges,
+        'resolved': resolved,
+        'classes': len(set(classes.values()))
+    }
+
+
+def index_grade(conn: sqlite3.Connection, grade_id: int, grade: str,
+                analogues: Optional[str]) -> None:
+    """
+    Add a newly inserted grade to the graph (inside the caller's transaction)
+
+    Inserts its edges, resolves existing dangling edges that name it and
+    merges the equivalence classes it links together.
+    """
+    grade_key = normalize_grade_name(grade) or ''
+    create_analogue_tables(conn.cursor())
+
+    conn.execute(
+        "INSERT OR REPLACE INTO grade_keys (grade_id, grade_key) VALUES (?, ?)",
+        (grade_id, grade_key)
+    )
+    _insert_edges(conn, grade_id, grade, analogues, resolve=True)
+
+    # Other grades that list this one as analogue
+    conn.execute("""
+        UPDATE steel_analogues
+        SET resolved_grade_id = ?
+        WHERE analogue_key = ? AND resolved_grade_id IS NULL
+    """, (grade_id, grade_key))
+
+    # Union with every class sharing one of its names: grades with the same
+    # name and grades listing (or listed as) the same analogue
+    nodes = {_grade_node(grade_id, grade_key)}
+    nodes.update(normalize_grade_name(a) for a in split_analogues(analogues))
+    nodes.discard('')
+    nodes = list(nodes)
+    placeholders = ', '.join('?' for _ in nodes)
+
+    linked_classes = [row[0] for row in conn.execute(f"""
+        SELECT DISTINCT c.class_id FROM grade_classes c
+        WHERE c.grade_id IN (
+            SELECT grade_id FROM grade_keys WHERE grade_key IN ({placeholders})
+            UNION
+            SELECT grade_id FROM steel_analogues WHERE analogue_key IN ({placeholders})
+        )
+    """, nodes + nodes)]
+
+    class_id = min(linked_classes + [grade_id])
+    if linked_classes:
+        conn.execute(
+            f"UPDATE grade_classes SET class_id = ? "
+            f"WHERE class_id IN ({', '.join('?' for _ in linked_classes)})",
+            [class_id] + linked_classes
+        )
+    conn.execute(
+        "INSERT OR REPLACE INTO grade_classes (grade_id, class_id) VALUES (?, ?)",
+        (grade_id, class_id)
+    )
+
+
+def unindex_grades(conn: sqlite3.Connection, grade_ids: Iterable[int]) -> None:
+    """
+    Remove deleted grades from the graph (inside the caller's transaction)
+
+    Drops their edges, re-resolves edges that pointed to them (to another
+    grade with the same normalized name, or NULL) and splits their former
+    equivalence classes by recomputing only those components.
+    """
+    grade_ids = list(grade_ids)
+    if not grade_ids:
+        return
+
+    placeholders = ', '.join('?' for _ in grade_ids)
+    affected_classes = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT class_id FROM grade_classes WHERE grade_id IN ({placeholders})",
+        grade_ids
+    )]
+
+    conn.execute(f"DELETE FROM steel_analogues WHERE grade_id IN ({placeholders})", grade_ids)
+    conn.execute(f"DELETE FROM grade_keys WHERE grade_id IN ({placeholders})", grade_ids)
+    conn.execute(f"""
+        UPDATE steel_analogues
+        SET resolved_grade_id = (
+            SELECT MIN(grade_id) FROM grade_keys
+            WHERE grade_key = steel_analogues.analogue_key
+        )
+        WHERE resolved_grade_id IN ({placeholders})
+    """, grade_ids)
+    conn.execute(f"DELETE FROM grade_classes WHERE grade_id IN ({placeholders})", grade_ids)
+
+    if affected_classes:
+        _recompute_classes(conn, affected_classes)
+
+
+def _recompute_classes(conn: sqlite3.Connection, class_ids: List[int]) -> None:
+    """Recompute components of the remaining members of class_ids"""
+    class_placeholders = ', '.join('?' for _ in class_ids)
+    members = f"SELECT grade_id FROM grade_classes WHERE class_id IN ({class_placeholders})"
+
+    grade_keys = dict(conn.execute(
+        f"SELECT grade_id, grade_key FROM grade_keys WHERE grade_id IN ({members})",
+        class_ids
+    ).fetchall())
+    edges = conn.execute(
+        f"SELECT grade_id, analogue_key FROM steel_analogues WHERE grade_id IN ({members})",
+        class_ids
+    ).fetchall()
+
+    conn.executemany(
+        "UPDATE grade_classes SET class_id = ? WHERE grade_id = ?",
+        [(class_id, grade_id) for grade_id, class_id in _compute_classes(grade_keys, edges).items()]
+    )
+
+
+def ensure_analogue_graph() -> None:
+    """Build analogue graph if missing or out of sync with steel_grades"""
+    conn = get_connection()
+    try:
+        create_analogue_tables(conn.cursor())
+
+        grades = conn.execute("SELECT COUNT(*) FROM steel_grades").fetchone()[0]
+        indexed = conn.execute("""
+            SELECT COUNT(*) FROM grade_keys k
+            JOIN steel_grades g ON g.id = k.grade_id
+        """).fetchone()[0]
+        total_keys = conn.execute("SELECT COUNT(*) FROM grade_keys").fetchone()[0]
+        classified = conn.execute("SELECT COUNT(*) FROM grade_classes").fetchone()[0]
+
+        if grades == indexed == total_keys == classified:
+            conn.commit()
+            return
+
+        stats = rebuild_analogue_graph(conn)
+        conn.commit()
+        print(f"[Analogues] Graph rebuilt: {stats['grades']} grades, "
+              f"{stats['edges']} edges ({stats['resolved']} resolved), "
+              f"{stats['classes']} equivalence classes")
+    except sqlite3.OperationalError as e:
+        print(f"[Analogues] Graph not available: {e}")
+    finally:
+        conn.close()
+
+
+# Grade by exact name, else by normalized name (lowest id wins)
+_TARGET_CTE = """
+    target AS (
+        SELECT id FROM (
+            SELECT id, 0 AS exact_rank FROM steel_grades WHERE grade = ?
+            UNION ALL
+            SELECT grade_id, 1 FROM grade_keys WHERE grade_key = ?
+        )
+        ORDER BY exact_rank, id
+        LIMIT 1
+    )
+"""
+
+
+def get_analogues(conn: sqlite3.Connection, grade: str) -> Optional[Dict[str, Any]]:
+    """
+    Grade with fully resolved analogue records (single query)
+
+    Args:
+        conn: Database connection
+        grade: Grade name (exact, or matching after normalization)
+
+    Returns:
+        {
+            'reference': {...steel_grades row...},
+            'analogues': [{'name': 'D2', 'data': {...row...} or None}, ...],
+            'listed_by': [{...row...}, ...]   # grades listing this one as analogue
+        }
+        or None if grade not found
+    """
+    cursor = conn.execute(f"""
+        WITH {_TARGET_CTE}
+        SELECT 'reference' AS relation, NULL AS analogue_name, g.*
+        FROM target t JOIN steel_grades g ON g.id = t.id
+        UNION ALL
+        SELECT 'analogue', e.analogue_name, g.*
+        FROM target t
+        JOIN steel_analogues e ON e.grade_id = t.id
+        LEFT JOIN steel_grades g ON g.id = e.resolved_grade_id
+        UNION ALL
+        SELECT 'listed_by', NULL, g.*
+        FROM target t
+        JOIN steel_analogues e ON e.resolved_grade_id = t.id
+        JOIN steel_grades g ON g.id = e.grade_id
+    """, (grade, normalize_grade_name(grade)))
+
+    columns = [description[0] for description in cursor.description]
+    reference = None
+    analogues: List[Dict[str, Any]] = []
+    listed_by: List[Dict[str, Any]] = []
+
+    for row in cursor.fetchall():
+        relation, analogue_name = row[0], row[1]
+        data = dict(zip(columns[2:], row[2:]))
+        if relation == 'reference':
+            reference = data
+        elif relation == 'analogue':
+            analogues.append({
+                'name': analogue_name,
+                'data': data if data.get('id') is not None else None
+            })
+        else:
+            listed_by.append(data)
+
+    if reference is None:
+        return None
+
+    return {
+        'reference': reference,
+        'analogues': analogues,
+        'listed_by': listed_by
+    }
+
+
+def get_equivalents(conn: sqlite3.Connection, grade: str) -> Optional[Dict[str, Any]]:
+    """
+    Whole equivalence class of a grade (single indexed query)
+
+    Args:
+        conn: Database connection
+        grade: Grade name (exact, or matching after normalization)
+
+    Returns:
+        {
+            'reference': {...steel_grades row...},
+            'class_id': 17,
+            'equivalents': [{...row...}, ...]   # other grades of the class
+        }
+        or None if grade not found
+    """
+    cursor = conn.execute(f"""
+        WITH {_TARGET_CTE}
+        SELECT t.id AS target_id, c.class_id, g.*
+        FROM target t
+        JOIN grade_classes tc ON tc.grade_id = t.id
+        JOIN grade_classes c ON c.class_id = tc.class_id
+        JOIN steel_grades g ON g.id = c.grade_id
+        ORDER BY g.grade, g.id
+    """, (grade, normalize_grade_name(grade)))
+
+    columns = [description[0] for description in cursor.description]
+    reference = None
+    class_id = None
+    equivalents: List[Dict[str, Any]] = []
+
+    for row in cursor.fetchall():
+        target_id, class_id = row[0], row[1]
+        data = dict(zip(columns[2:], row[2:]))
+        if data['id'] == target_id:
+            reference = data
+        else:
+            equivalents.append(data)
+
+    if reference is None:
+        return None
+
+    return {
+        'reference': reference,
+        'class_id': class_id,
+        'equivalents': equivalents
+    }
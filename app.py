@@ -1,22 +1,37 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 import sqlite3
 import json
 import os
 from dotenv import load_dotenv
-import config
-from database_schema import get_connection
-from ai_search import get_ai_search
-from fuzzy_search import get_composition_matcher, classify_steel, get_steel_groups
-from database.backup_manager import backup_before_modification
 
-# Load environment variables
+# Load environment variables (before config, which reads feature flags from env)
 load_dotenv()
 
+import config
+from database_schema import get_connection, bump_write_generation
+from read_snapshot import get_read_connection, notify_write_committed
+from ai_search import get_ai_search
+from ai_jobs import get_job_manager, JobQueueFullError
+from ai_concurrency import ProviderBusyError, limiter_stats, breaker_stats
+from ai_deadline import DeadlineExceeded, request_deadline
+from ai_result_store import get_ai_result_store, attach_result_token
+from utils.pdf_worker import pdf_worker_stats
+from grade_index import get_grade_index, normalize_grade_name
+from grade_suggest import get_grade_suggester
+from analogue_graph import ensure_analogue_graph, index_grade, unindex_grades, get_analogues, get_equivalents
+from fuzzy_search import get_composition_matcher, classify_steel, get_steel_groups, composition_diff_matrix
+from database.backup_scheduler import request_backup, get_backup_scheduler
+from database.change_journal import get_change_journal
+
 app = Flask(__name__)
 
 # Initialize AI search
 ai_search = get_ai_search()
 
+# Parse analogues into the edge table if it is missing or stale
+if os.path.exists(config.DB_FILE):
+    ensure_analogue_graph()
+
 
 @app.route('/')
 def index():
@@ -24,6 +39,40 @@ def index():
     return render_template('index.html')
 
 
+def provider_busy_response(error: ProviderBusyError):
+    """429 "busy, retry later" for AI provider admission rejections"""
+    response = jsonify({
+        'error': str(error),
+        'provider': error.provider,
+        'retry_after': round(error.retry_after)
+    })
+    response.headers['Retry-After'] = str(max(1, round(error.retry_after)))
+    return response, 429
+
+
+def client_deadline():
+    """
+    Deadline of a synchronous AI request
+
+    The client may announce its own budget (?deadline=seconds or
+    X-Request-Timeout header); it is capped at AI_REQUEST_DEADLINE.
+    """
+    value = request.args.get('deadline') or request.headers.get('X-Request-Timeout')
+    try:
+        seconds = float(value) if value else None
+    except ValueError:
+        seconds = None
+    return request_deadline(seconds)
+
+
+def deadline_exceeded_response(error: DeadlineExceeded):
+    """504 for AI searches that could not finish within the request deadline"""
+    return jsonify({
+        'error': str(error),
+        'stage': error.stage
+    }), 504
+
+
 @app.route('/api/steels', methods=['GET'])
 def get_steels():
     """Get steel grades with optional filtering and AI fallback"""
@@ -36,16 +85,11 @@ def get_steels():
     exact_search = request.args.get('exact', 'false').lower() == 'true'
     standard_filter = request.args.get('standard', '').strip()
 
-    # Normalize grade name for fuzzy matching (remove spaces, hyphens, dots)
-    # Example: "ШХ 15" → "ШХ15", "X-30" → "X30", "1.2379" → "12379"
-    def normalize_grade_name(name):
-        if not name:
-            return name
-        return name.replace(' ', '').replace('-', '').replace('.', '').upper()
-
     # AI Search enabled ONLY for explicit request from Telegram Bot
     # Web Exact Search (🔍) searches ONLY in database (exact match, no AI fallback)
     use_ai = request.args.get('ai', 'false').lower() == 'true'
+    # force=true: skip cached AI results and recent "not found" answers
+    force_ai = request.args.get('force', 'false').lower() == 'true'
     
     # Element filters
     element_filters = {}
@@ -119,7 +163,7 @@ def get_steels():
     
     query += " ORDER BY grade"  # Remove LIMIT to show all results
     
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     
     try:
@@ -133,16 +177,35 @@ def get_steels():
 
         # If no results and AI is enabled, try AI search
         if len(results) == 0 and grade_filter and use_ai and ai_search.enabled:
-            ai_result = ai_search.search_steel(grade_filter)
+            try:
+                ai_result = ai_search.search_steel(grade_filter, force=force_ai,
+                                                   deadline=client_deadline())
+            except ProviderBusyError as e:
+                return provider_busy_response(e)
+            except DeadlineExceeded as e:
+                return deadline_exceeded_response(e)
             if ai_result:
                 # Format AI result to match database schema
                 ai_result['id'] = 'AI'
                 # Keep the link field from AI result (don't override)
                 if 'link' not in ai_result:
                     ai_result['link'] = None
+                # "Add to DB" inserts exactly this result (POST /api/steels/add with result_token)
+                attach_result_token(ai_result)
                 results = [ai_result]
 
-        return jsonify(results)
+        response = jsonify(results)
+
+        # "Did you mean": near-miss grade names for exact searches that found nothing
+        # (header keeps the list response format unchanged). Only grades in the
+        # database: an exact search for an analogue-only name finds nothing again.
+        if len(results) == 0 and grade_filter and exact_search:
+            suggestions = [item['grade'] for item in get_grade_suggester().suggest(grade_filter, limit=10)
+                           if item['in_database']][:5]
+            if suggestions:
+                response.headers['X-Did-You-Mean'] = json.dumps(suggestions)
+
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
@@ -160,17 +223,20 @@ def ai_search_endpoint():
     # Get grade name from query parameter or JSON body
     if request.method == 'GET':
         grade_name = request.args.get('grade', '').strip()
+        force = request.args.get('force', 'false').lower() == 'true'
     else:
         data = request.get_json() or {}
         grade_name = data.get('grade', '').strip()
+        force = str(data.get('force', False)).lower() == 'true'
 
     if not grade_name:
         return jsonify({'error': 'Grade name is required'}), 400
 
     try:
-        result = ai_search.search_steel(grade_name)
+        result = ai_search.search_steel(grade_name, force=force, deadline=client_deadline())
 
         if result:
+            attach_result_token(result)
             return jsonify({
                 'success': True,
                 'grade': grade_name,
@@ -186,12 +252,107 @@ def ai_search_endpoint():
                 'source': 'ai'
             }), 404
 
+    except ProviderBusyError as e:
+        return provider_busy_response(e)
+    except DeadlineExceeded as e:
+        return deadline_exceeded_response(e)
     except Exception as e:
         return jsonify({
             'error': f'AI search failed: {str(e)}'
         }), 500
 
 
+@app.route('/api/steels/ai-search/jobs', methods=['POST'])
+def create_ai_search_job():
+    """Start AI search in the background (returns job id immediately)"""
+    if not ai_search.enabled:
+        return jsonify({
+            'error': 'AI search is not enabled. Please set PERPLEXITY_API_KEY in .env file'
+        }), 503
+
+    data = request.get_json(silent=True) or {}
+    grade_name = (data.get('grade') or '').strip()
+    force = str(data.get('force', False)).lower() == 'true'
+
+    if not grade_name:
+        return jsonify({'error': 'Grade name is required'}), 400
+
+    try:
+        job = get_job_manager().submit(grade_name, force=force)
+    except JobQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/api/steels/ai-search/jobs/{job.id}',
+        'events_url': f'/api/steels/ai-search/jobs/{job.id}/events'
+    }), 202
+
+
+@app.route('/api/steels/ai-search/jobs/<job_id>', methods=['GET'])
+def get_ai_search_job(job_id):
+    """AI search job status, stage progress and result (when finished)"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/steels/ai-search/jobs/<job_id>/events', methods=['GET'])
+def stream_ai_search_job(job_id):
+    """AI search job progress as Server-Sent Events"""
+    manager = get_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+
+    return Response(
+        stream_with_context(manager.stream_events(job)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/steels/ai-cache/purge', methods=['POST'])
+def purge_ai_cache():
+    """Remove cached AI results (one grade, expired entries, or everything)"""
+    data = request.get_json(silent=True) or {}
+    grade_name = (data.get('grade') or '').strip() or None
+    expired_only = bool(data.get('expired_only', False))
+
+    try:
+        removed = ai_search.cache.purge(grade_name, expired_only=expired_only)
+
+        return jsonify({
+            'success': True,
+            'grade': grade_name,
+            'expired_only': expired_only,
+            'removed': removed
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/steels/ai-telemetry', methods=['GET'])
+def ai_telemetry_summary():
+    """AI search telemetry of the last hours (?hours=24): stage p50/p95, tokens, cache/PDF rates"""
+    try:
+        hours = float(request.args.get('hours', 24))
+    except ValueError:
+        return jsonify({'error': 'hours must be a number'}), 400
+
+    if not ai_search.telemetry.enabled:
+        return jsonify({'error': 'AI telemetry is disabled (AI_TELEMETRY_ENABLED)'}), 503
+
+    try:
+        return jsonify(ai_search.telemetry.summary(hours))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/steels/fuzzy-search', methods=['POST'])
 def fuzzy_search_endpoint():
     """Find steel grades with similar chemical composition"""
@@ -261,7 +422,7 @@ def fuzzy_search_endpoint():
 def get_grades_list():
     """Get list of all grade names for autocomplete in Compare module"""
     try:
-        conn = get_connection()
+        conn = get_read_connection()
         cursor = conn.cursor()
 
         cursor.execute("SELECT DISTINCT grade FROM steel_grades ORDER BY grade")
@@ -278,6 +439,102 @@ def get_grades_list():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/steels/autocomplete', methods=['GET'])
+def autocomplete_grades():
+    """Grade names starting with ?q= (served from in-memory sorted index)"""
+    query = request.args.get('q', '').strip()
+
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit must be an integer'}), 400
+
+    try:
+        grades = get_grade_index().autocomplete(query, limit)
+
+        return jsonify({
+            'success': True,
+            'query': query,
+            'count': len(grades),
+            'grades': grades
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/steels/suggest', methods=['GET'])
+def suggest_grades():
+    """Typo-tolerant "did you mean" suggestions for ?q= (grade names and analogues)"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'error': 'q is required'}), 400
+
+    try:
+        limit = min(max(int(request.args.get('limit', 5)), 1), 20)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit must be an integer'}), 400
+
+    try:
+        suggestions = get_grade_suggester().suggest(query, limit)
+
+        return jsonify({
+            'success': True,
+            'query': query,
+            'count': len(suggestions),
+            'suggestions': suggestions
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/steels/<path:grade>/analogues', methods=['GET'])
+def get_grade_analogues(grade):
+    """Grade with its analogues resolved to full DB records (single query)"""
+    conn = get_read_connection()
+
+    try:
+        result = get_analogues(conn, grade)
+        if result is None:
+            return jsonify({'success': False, 'error': f'Grade {grade} not found'}), 404
+
+        return jsonify({
+            'success': True,
+            'grade': result['reference']['grade'],
+            'reference': result['reference'],
+            'analogues': result['analogues'],
+            'listed_by': result['listed_by'],
+            'resolved': sum(1 for a in result['analogues'] if a['data'] is not None)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        conn.close()
+
+
+@app.route('/api/steels/<path:grade>/equivalents', methods=['GET'])
+def get_grade_equivalents(grade):
+    """All grades transitively linked to grade by analogues (equivalence class)"""
+    conn = get_read_connection()
+
+    try:
+        result = get_equivalents(conn, grade)
+        if result is None:
+            return jsonify({'success': False, 'error': f'Grade {grade} not found'}), 404
+
+        return jsonify({
+            'success': True,
+            'grade': result['reference']['grade'],
+            'class_id': result['class_id'],
+            'reference': result['reference'],
+            'count': len(result['equivalents']),
+            'equivalents': result['equivalents']
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        conn.close()
+
+
 @app.route('/api/steels/compare', methods=['POST'])
 def compare_grades_endpoint():
     """Compare specific steel grades side-by-side (supports AI results)"""
@@ -297,73 +554,69 @@ def compare_grades_endpoint():
         if not compare_grades or len(compare_grades) == 0:
             return jsonify({'error': 'compare_grades list is required'}), 400
 
-        # Get data from DB or use provided data (for AI grades)
-        conn = get_connection()
-        cursor = conn.cursor()
-
         columns = ['grade', 'c', 'cr', 'ni', 'mo', 'v', 'w', 'co', 'mn', 'si',
                    'cu', 'nb', 'n', 's', 'p', 'standard', 'manufacturer',
                    'analogues', 'link', 'base', 'tech', 'other']
 
+        # Создаем словарь AI марок для быстрого поиска
+        ai_grades_dict = {}
+        for ai_grade in compare_data_provided:
+            if ai_grade.get('grade'):
+                ai_grades_dict[ai_grade['grade']] = ai_grade
+
+        # Марки, которые нужно взять из БД (эталон + все не-AI марки)
+        db_grade_names = [g for g in compare_grades if g not in ai_grades_dict]
+        if not reference_data_provided:
+            db_grade_names.append(reference_grade)
+        db_grade_names = list(dict.fromkeys(db_grade_names))
+
+        # Одним запросом по индексу idx_grade (вместо SELECT на каждую марку)
+        db_rows = {}
+        if db_grade_names:
+            conn = get_read_connection()
+            try:
+                placeholders = ', '.join('?' for _ in db_grade_names)
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    SELECT {', '.join(columns)}
+                    FROM steel_grades
+                    WHERE grade IN ({placeholders})
+                    ORDER BY id
+                """, db_grade_names)
+                for row in cursor.fetchall():
+                    # Первая запись для марки (как раньше fetchone)
+                    db_rows.setdefault(row[0], dict(zip(columns, row)))
+            finally:
+                conn.close()
+
         # Reference grade - проверяем сначала переданные данные, потом БД
         if reference_data_provided:
             # AI марка - используем переданные данные
             ref_dict = {key: reference_data_provided.get(key) for key in columns}
-            print(f"[Compare] Using AI data for reference grade: {reference_grade}")
         else:
-            # Обычная марка - ищем в БД
-            cursor.execute("""
-                SELECT grade, c, cr, ni, mo, v, w, co, mn, si, cu, nb, n, s, p,
-                       standard, manufacturer, analogues, link, base, tech, other
-                FROM steel_grades
-                WHERE grade = ?
-            """, (reference_grade,))
-
-            ref_data = cursor.fetchone()
-            if not ref_data:
-                conn.close()
+            ref_dict = db_rows.get(reference_grade)
+            if not ref_dict:
                 return jsonify({'error': f'Reference grade "{reference_grade}" not found'}), 404
 
-            ref_dict = dict(zip(columns, ref_data))
-
-        # Compare grades - проверяем AI данные и БД
+        # Compare grades - AI данные или БД (в порядке запроса)
         results = []
-
-        # Создаем словарь AI марок для быстрого поиска
-        ai_grades_dict = {}
-        for ai_grade in compare_data_provided:
-            if ai_grade.get('grade'):
-                ai_grades_dict[ai_grade['grade']] = ai_grade
-
         for grade_name in compare_grades:
-            # Сначала проверяем AI данные
             if grade_name in ai_grades_dict:
                 ai_data = ai_grades_dict[grade_name]
-                grade_dict = {key: ai_data.get(key) for key in columns}
-                results.append(grade_dict)
-                print(f"[Compare] Using AI data for: {grade_name}")
-            else:
-                # Ищем в БД
-                cursor.execute("""
-                    SELECT grade, c, cr, ni, mo, v, w, co, mn, si, cu, nb, n, s, p,
-                           standard, manufacturer, analogues, link, base, tech, other
-                    FROM steel_grades
-                    WHERE grade = ?
-                """, (grade_name,))
-
-                row = cursor.fetchone()
-                if row:
-                    results.append(dict(zip(columns, row)))
-                    print(f"[Compare] Using DB data for: {grade_name}")
+                results.append({key: ai_data.get(key) for key in columns})
+            elif grade_name in db_rows:
+                results.append(db_rows[grade_name])
 
-        conn.close()
+        print(f"[Compare] {reference_grade} vs {len(results)} grades "
+              f"({len(db_rows)} from DB, {len(ai_grades_dict)} AI)")
 
         return jsonify({
             'success': True,
             'reference_grade': reference_grade,
             'reference_data': ref_dict,
             'compare_count': len(results),
-            'results': results
+            'results': results,
+            'diff_matrix': composition_diff_matrix(ref_dict, results)
         })
 
     except Exception as e:
@@ -371,16 +624,42 @@ def compare_grades_endpoint():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# Body fields of /api/steels/add stored in steel_grades
+STEEL_FIELDS = ['base', 'c', 'cr', 'mo', 'v', 'w', 'co', 'ni', 'mn', 'si', 's', 'p', 'cu', 'nb', 'n',
+                'application', 'tech', 'standard', 'manufacturer', 'analogues', 'link', 'source_url', 'pdf_url']
+
+
 @app.route('/api/steels/add', methods=['POST'])
 def add_steel():
-    """Add AI search result to main database"""
-    # Create backup before adding new grade
-    backup_before_modification(reason="api_add_steel")
-
+    """
+    Add AI search result to main database
+
+    Body: {"result_token": ...} of an AI result (inserted exactly as the user
+    saw it, no new AI search), or the result fields themselves. The web page
+    sends both: if the token expired (TTL, app restart) the fields are used,
+    only a token-only request (the bot's add:<token>) gets 410.
+    """
     data = request.get_json() or {}
+    source = 'api'
+
+    if data.get('result_token'):
+        stored = get_ai_result_store().get(str(data['result_token']))
+        if stored is not None:
+            source = 'ai'
+            data = stored
+        elif not data.get('grade'):
+            return jsonify({
+                'error': 'AI result expired or unknown. Please run the AI search again.'
+            }), 410
 
-    if not data.get('grade'):
+    if not data.get('grade') or not isinstance(data['grade'], str):
         return jsonify({'error': 'Grade is required'}), 400
+    if source != 'ai':
+        # Client-supplied fields: scalar values only (ranges are strings like "0.35-0.42")
+        invalid = [key for key in STEEL_FIELDS
+                   if data.get(key) is not None and not isinstance(data[key], (str, int, float))]
+        if invalid:
+            return jsonify({'error': f"Invalid values for: {', '.join(invalid)}"}), 400
 
     conn = get_connection()
     cursor = conn.cursor()
@@ -392,41 +671,49 @@ def add_steel():
             return jsonify({'error': 'Grade already exists in database'}), 409
 
         # Insert new record
-        cursor.execute("""
-            INSERT INTO steel_grades (
-                grade, base, c, cr, mo, v, w, co, ni, mn, si, s, p, cu, nb, n,
-                tech, standard, manufacturer, analogues, link
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data.get('grade'),
-            data.get('base', 'Fe'),
-            data.get('c'),
-            data.get('cr'),
-            data.get('mo'),
-            data.get('v'),
-            data.get('w'),
-            data.get('co'),
-            data.get('ni'),
-            data.get('mn'),
-            data.get('si'),
-            data.get('s'),
-            data.get('p'),
-            data.get('cu'),
-            data.get('nb'),
-            data.get('n'),
-            data.get('application') or data.get('tech'),
-            data.get('standard'),
-            data.get('manufacturer'),
-            data.get('analogues'),
-            data.get('link') or data.get('source_url') or data.get('pdf_url')
-        ))
-
+        row = {
+            'grade': data.get('grade'),
+            'base': data.get('base', 'Fe'),
+            'c': data.get('c'),
+            'cr': data.get('cr'),
+            'mo': data.get('mo'),
+            'v': data.get('v'),
+            'w': data.get('w'),
+            'co': data.get('co'),
+            'ni': data.get('ni'),
+            'mn': data.get('mn'),
+            'si': data.get('si'),
+            's': data.get('s'),
+            'p': data.get('p'),
+            'cu': data.get('cu'),
+            'nb': data.get('nb'),
+            'n': data.get('n'),
+            'tech': data.get('application') or data.get('tech'),
+            'standard': data.get('standard'),
+            'manufacturer': data.get('manufacturer'),
+            'analogues': data.get('analogues'),
+            'link': data.get('link') or data.get('source_url') or data.get('pdf_url')
+        }
+        cursor.execute(f"""
+            INSERT INTO steel_grades ({', '.join(row)})
+            VALUES ({', '.join('?' * len(row))})
+        """, tuple(row.values()))
+        new_id = cursor.lastrowid
+        index_grade(conn, new_id, data['grade'], data.get('analogues'))
+
+        generation = bump_write_generation(conn)
         conn.commit()
+        notify_write_committed()
+
+        # Journal covers the write until the scheduled backup includes it
+        get_change_journal().append('add', generation, data['grade'], row, source=source)
+        request_backup(reason="api_add_steel")
 
         return jsonify({
             'success': True,
             'message': f'Grade {data["grade"]} added to database',
-            'id': cursor.lastrowid
+            'grade': data['grade'],
+            'id': new_id
         })
 
     except Exception as e:
@@ -439,9 +726,6 @@ def add_steel():
 @app.route('/api/steels/delete', methods=['POST'])
 def delete_steel():
     """Delete steel grade from database"""
-    # Create backup before deleting grade
-    backup_before_modification(reason="api_delete_steel")
-
     data = request.get_json() or {}
 
     if not data.get('grade'):
@@ -458,9 +742,16 @@ def delete_steel():
         if not row:
             return jsonify({'error': 'Grade not found in database'}), 404
 
-        # Delete
+        # Delete (with analogue edges of all rows of this grade)
+        cursor.execute("SELECT id FROM steel_grades WHERE grade = ?", (data['grade'],))
+        unindex_grades(conn, [r[0] for r in cursor.fetchall()])
         cursor.execute("DELETE FROM steel_grades WHERE grade = ?", (data['grade'],))
+        generation = bump_write_generation(conn)
         conn.commit()
+        notify_write_committed()
+
+        get_change_journal().append('delete', generation, data['grade'])
+        request_backup(reason="api_delete_steel")
 
         return jsonify({
             'success': True,
@@ -480,25 +771,37 @@ def get_stats():
     if not os.path.exists(config.DB_FILE):
         return jsonify({'error': 'Database not found. Please run parser.py first.'}), 500
 
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
 
     try:
         cursor.execute("SELECT COUNT(*) FROM steel_grades")
         total = cursor.fetchone()[0]
 
-        # Check AI cache stats
+        # Check AI cache stats (ai_searches is not part of the read snapshot)
         ai_cached = 0
+        disk_conn = get_connection()
         try:
-            cursor.execute("SELECT COUNT(*) FROM ai_searches")
-            ai_cached = cursor.fetchone()[0]
+            ai_cached = disk_conn.execute("SELECT COUNT(*) FROM ai_searches").fetchone()[0]
         except:
             pass
+        finally:
+            disk_conn.close()
 
         return jsonify({
             'total': total,
             'ai_enabled': ai_search.enabled,
-            'ai_cached_searches': ai_cached
+            'ai_cached_searches': ai_cached,
+            'ai_cache': ai_search.cache.stats(),
+            'ai_single_flight': ai_search.flights.stats(),
+            'ai_jobs': get_job_manager().stats(),
+            'ai_providers': limiter_stats(),
+            'ai_breakers': breaker_stats(),
+            'ai_results': get_ai_result_store().stats(),
+            'pdf_cache': ai_search.pdf_cache.stats() if ai_search.pdf_cache else None,
+            'pdf_workers': pdf_worker_stats(),
+            'backups': get_backup_scheduler().stats(),
+            'read_snapshot': config.READ_SNAPSHOT_ENABLED
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
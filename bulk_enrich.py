@@ -0,0 +1,547 @@
+"""
+Bulk AI enrichment of grade lists
+
+Enriches hundreds of grades (e.g. from a customer list) without pressing
+"Add" in the bot once per grade:
+
+1. run: the list is stored as a run (enrich_runs / enrich_items). Grades that
+   are already in steel_grades are skipped. The rest are searched with
+   AISearch, at most --concurrency at a time (asyncio semaphore over a
+   thread pool; each provider's own limiter still applies). A busy
+   provider is waited for at most --busy-retries times per grade; the grade
+   then stays a retryable error that does not use up an attempt. Validated
+   results with at least --min-confidence go into ai_staging.
+2. Results and item statuses are written in batched transactions (every
+   --batch-size results or --flush-interval seconds). A committed batch is
+   the checkpoint: running the same list again (or `resume <run_id>`)
+   continues with the grades that are still pending or failed.
+3. promote: staged results are inserted into steel_grades in one
+   transaction, with one backup for the whole run and one change journal
+   write (database/change_journal.py).
+
+Throughput (grades/s, latency percentiles) is printed with every batch and
+at the end; point PERPLEXITY_BASE_URL at a local stub server to measure the
+pipeline without provider costs, or run tests/test_bulk_enrich.py (fake
+provider, no network) with -s.
+
+Usage:
+    python bulk_enrich.py run grades.txt [--concurrency 4] [--batch-size 20] [--force]
+    python bulk_enrich.py resume <run_id>
+    python bulk_enrich.py status [run_id]
+    python bulk_enrich.py promote <run_id>
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+from dotenv import load_dotenv
+
+# Settings of AISearch are read from .env (as in app.py)
+load_dotenv()
+
+from database_schema import get_connection, create_enrichment_tables, bump_write_generation
+from ai_cache import cache_key, CONFIDENCE_LEVELS
+from ai_concurrency import ProviderBusyError
+from ai_deadline import Deadline
+
+# Item statuses; pending and error items are (re)processed by run/resume
+STATUSES = ('pending', 'staged', 'rejected', 'not_found', 'exists', 'error')
+
+# steel_grades columns filled from an AI result (same mapping as /api/steels/add)
+ELEMENT_COLUMNS = ['c', 'cr', 'mo', 'v', 'w', 'co', 'ni', 'mn', 'si', 's', 'p', 'cu', 'nb', 'n']
+
+
+def read_grades(path: str) -> List[str]:
+    """
+    Read grade list: one grade per line, or CSV/TSV with the grade in the first column
+
+    Blank lines, '#' comments, a "grade" header and duplicates (same
+    normalized name) are skipped.
+    """
+    grades, seen = [], set()
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if path.lower().endswith(('.csv', '.tsv')):
+                for separator in ('\t', ';', ','):
+                    if separator in line:
+                        line = line.split(separator)[0].strip().strip('"')
+                        break
+            key = cache_key(line)
+            if not key or line.lower() in ('grade', 'марка') or key in seen:
+                continue
+            seen.add(key)
+            grades.append(line)
+    return grades
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _existing_keys(conn) -> set:
+    """Normalized names of all grades in steel_grades"""
+    keys = {row[0] for row in conn.execute("SELECT grade_key FROM grade_keys")}
+    if not keys:
+        # Analogue graph not built yet (it is on app start)
+        keys = {cache_key(row[0]) for row in conn.execute("SELECT grade FROM steel_grades")}
+    return keys
+
+
+def prepare_run(grades: List[str], source: str) -> Tuple[str, bool]:
+    """
+    Create run for grade list (or find the existing run of the same list)
+
+    Returns:
+        (run_id, resumed)
+    """
+    run_id = hashlib.sha1('\n'.join(cache_key(g) for g in grades).encode('utf-8')).hexdigest()[:12]
+
+    conn = get_connection()
+    try:
+        create_enrichment_tables(conn.cursor())
+        if conn.execute("SELECT 1 FROM enrich_runs WHERE id = ?", (run_id,)).fetchone():
+            conn.commit()
+            return run_id, True
+
+        existing = _existing_keys(conn)
+        conn.execute(
+            "INSERT INTO enrich_runs (id, source, total, created_at) VALUES (?, ?, ?, ?)",
+            (run_id, source, len(grades), _now())
+        )
+        conn.executemany("""
+            INSERT INTO enrich_items (run_id, position, grade, status, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(run_id, position, grade, 'exists' if cache_key(grade) in existing else 'pending', _now())
+              for position, grade in enumerate(grades)])
+        conn.commit()
+        return run_id, False
+    finally:
+        conn.close()
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class BulkEnricher:
+    """Runs AI searches for the pending items of a run and checkpoints results"""
+
+    def __init__(self, ai_search, run_id: str, concurrency: int = 4, batch_size: int = 20,
+                 flush_interval: float = 5.0, min_confidence: str = 'medium',
+                 force: bool = False, max_attempts: int = 3, deadline: Optional[float] = None,
+                 busy_retries: int = 10):
+        """
+        Args:
+            ai_search: AISearch instance
+            run_id: Run to process
+            concurrency: Concurrent searches
+            batch_size: Results per transaction
+            flush_interval: Max seconds results wait for their transaction
+            min_confidence: Lowest confidence staged (low / medium / high)
+            force: Bypass the AI result cache
+            max_attempts: Attempts per grade before it stays 'error'
+            deadline: Seconds per search attempt (None = unlimited)
+            busy_retries: Waits for a busy provider per grade before the grade
+                          is left as a retryable error
+        """
+        self.ai_search = ai_search
+        self.run_id = run_id
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.min_level = CONFIDENCE_LEVELS[min_confidence]
+        self.force = force
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.busy_retries = busy_retries
+
+        self.counts = {status: 0 for status in ('staged', 'rejected', 'not_found', 'error')}
+        self.latencies: List[float] = []
+        self.total = 0
+        self.started = 0.0
+
+    def _pending_items(self) -> List[Tuple[int, str, int]]:
+        conn = get_connection()
+        try:
+            return conn.execute("""
+                SELECT position, grade, attempts FROM enrich_items
+                WHERE run_id = ? AND (status = 'pending' OR (status = 'error' AND attempts < ?))
+                ORDER BY position
+            """, (self.run_id, self.max_attempts)).fetchall()
+        finally:
+            conn.close()
+
+    def _search(self, position: int, grade: str, attempts: int) -> Dict[str, Any]:
+        """Search one grade (worker thread); returns outcome for the writer"""
+        started = time.perf_counter()
+        outcome = {'position': position, 'grade': grade, 'attempts': attempts + 1,
+                   'result': None, 'error': None}
+        try:
+            for retry in range(self.busy_retries + 1):
+                try:
+                    result = self.ai_search.search_steel(grade, force=self.force, raise_errors=True,
+                                                         deadline=Deadline(self.deadline))
+                    break
+                except ProviderBusyError as e:
+                    if retry == self.busy_retries:
+                        # Not the grade's fault: does not use up an attempt, retried on resume
+                        outcome['status'] = 'error'
+                        outcome['attempts'] = attempts
+                        outcome['error'] = f"provider busy: {e}"
+                        outcome['latency'] = time.perf_counter() - started
+                        return outcome
+                    # Admission queue full or circuit open: wait as advised instead of failing the grade
+                    time.sleep(e.retry_after)
+
+            if result is None:
+                outcome['status'] = 'not_found'
+            elif not result.get('validated'):
+                outcome['status'] = 'rejected'
+                outcome['error'] = 'incomplete chemical composition'
+            elif CONFIDENCE_LEVELS.get(str(result.get('confidence')).lower(), -1) < self.min_level:
+                outcome['status'] = 'rejected'
+                outcome['error'] = f"confidence '{result.get('confidence')}'"
+            else:
+                outcome['status'] = 'staged'
+                outcome['result'] = result
+        except Exception as e:
+            # AIUpstreamError (provider failure), DeadlineExceeded and anything unexpected: retried on resume
+            outcome['status'] = 'error'
+            outcome['error'] = str(e)
+
+        outcome['latency'] = time.perf_counter() - started
+        return outcome
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        """Store results and item statuses in one transaction (the checkpoint)"""
+        conn = get_connection()
+        try:
+            for outcome in batch:
+                result = outcome['result']
+                if result is not None:
+                    stored = {k: v for k, v in result.items() if k not in ('cached', 'cache_tier', 'cache_age')}
+                    conn.execute("""
+                        INSERT OR REPLACE INTO ai_staging (run_id, grade, cache_key, result, confidence, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, (self.run_id, outcome['grade'], cache_key(outcome['grade']),
+                          json.dumps(stored, ensure_ascii=False), result.get('confidence'), _now()))
+
+                conn.execute("""
+                    UPDATE enrich_items
+                    SET status = ?, attempts = ?, latency_ms = ?, error = ?, updated_at = ?
+                    WHERE run_id = ? AND position = ?
+                """, (outcome['status'], outcome['attempts'], int(outcome['latency'] * 1000),
+                      outcome['error'], _now(), self.run_id, outcome['position']))
+            conn.commit()
+        finally:
+            conn.close()
+
+        for outcome in batch:
+            self.counts[outcome['status']] += 1
+            self.latencies.append(outcome['latency'])
+        self._print_progress()
+
+    def _print_progress(self) -> None:
+        done = sum(self.counts.values())
+        elapsed = time.perf_counter() - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / rate if rate > 0 else 0.0
+        print(f"[Bulk] {done}/{self.total} | {rate:.2f} grades/s | "
+              f"staged {self.counts['staged']}, rejected {self.counts['rejected']}, "
+              f"not found {self.counts['not_found']}, errors {self.counts['error']} | "
+              f"ETA {eta:.0f} s")
+
+    async def _writer(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        batch: List[Dict[str, Any]] = []
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    outcome = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    outcome = False  # flush interval elapsed
+
+                if outcome is None:
+                    break
+                if outcome:
+                    batch.append(outcome)
+                    if deadline is None:
+                        deadline = loop.time() + self.flush_interval
+
+                if batch and (len(batch) >= self.batch_size or outcome is False):
+                    await loop.run_in_executor(None, self._write_batch, batch)
+                    batch, deadline = [], None
+        finally:
+            # Also on Ctrl+C: finished searches are not repeated on resume
+            if batch:
+                self._write_batch(batch)
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Process pending items
+
+        Returns:
+            Summary with counts, elapsed seconds, throughput and latency percentiles
+        """
+        items = self._pending_items()
+        self.total = len(items)
+        self.started = time.perf_counter()
+        if not items:
+            print(f"[Bulk] Run {self.run_id}: nothing to do")
+            return self.summary()
+
+        print(f"[Bulk] Run {self.run_id}: {len(items)} grades, concurrency {self.concurrency}")
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        writer = asyncio.create_task(self._writer(queue))
+
+        async def process(item):
+            async with semaphore:
+                outcome = await loop.run_in_executor(executor, self._search, *item)
+            await queue.put(outcome)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='bulk-enrich') as executor:
+            try:
+                await asyncio.gather(*(process(item) for item in items))
+            finally:
+                await queue.put(None)
+                await writer
+
+        conn = get_connection()
+        try:
+            pending = conn.execute("""
+                SELECT COUNT(*) FROM enrich_items
+                WHERE run_id = ? AND (status = 'pending' OR (status = 'error' AND attempts < ?))
+            """, (self.run_id, self.max_attempts)).fetchone()[0]
+            if not pending:
+                conn.execute("UPDATE enrich_runs SET finished_at = ? WHERE id = ?", (_now(), self.run_id))
+                conn.commit()
+        finally:
+            conn.close()
+
+        return self.summary()
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        processed = len(self.latencies)
+        return {
+            'run_id': self.run_id,
+            'processed': processed,
+            'counts': dict(self.counts),
+            'elapsed_seconds': round(elapsed, 2),
+            'grades_per_second': round(processed / elapsed, 3) if elapsed > 0 else 0.0,
+            'latency_p50': round(_percentile(self.latencies, 0.5), 3),
+            'latency_p95': round(_percentile(self.latencies, 0.95), 3)
+        }
+
+
+def print_status(run_id: Optional[str] = None) -> None:
+    """Print status counts of one run or all runs"""
+    conn = get_connection()
+    try:
+        create_enrichment_tables(conn.cursor())
+        runs = conn.execute(
+            "SELECT id, source, total, created_at, finished_at FROM enrich_runs "
+            + ("WHERE id = ? " if run_id else "") + "ORDER BY created_at",
+            (run_id,) if run_id else ()
+        ).fetchall()
+        if not runs:
+            print("No enrichment runs" if not run_id else f"Run {run_id} not found")
+            return
+
+        for rid, source, total, created_at, finished_at in runs:
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM enrich_items WHERE run_id = ? GROUP BY status", (rid,)
+            ).fetchall())
+            staged, promoted = conn.execute(
+                "SELECT COUNT(*), COUNT(promoted_id) FROM ai_staging WHERE run_id = ?", (rid,)
+            ).fetchone()
+            state = 'finished' if finished_at else 'incomplete'
+            print(f"{rid}  {source}  {total} grades  {created_at[:19]}  {state}")
+            print("    " + ", ".join(f"{status} {counts.get(status, 0)}" for status in STATUSES)
+                  + f" | promoted {promoted}/{staged}")
+    finally:
+        conn.close()
+
+
+def promote(run_id: str) -> Dict[str, int]:
+    """
+    Insert staged results of a run into steel_grades (one backup, one transaction)
+
+    Grades added to steel_grades since staging are skipped.
+
+    Returns:
+        {'added': n, 'skipped': n}
+    """
+    from database.backup_manager import backup_before_modification
+    from database.backup_scheduler import request_backup
+    from database.change_journal import get_change_journal
+    from analogue_graph import index_grade
+
+    conn = get_connection()
+    try:
+        rows = conn.execute("""
+            SELECT id, grade, result FROM ai_staging
+            WHERE run_id = ? AND promoted_id IS NULL
+            ORDER BY id
+        """, (run_id,)).fetchall()
+    finally:
+        conn.close()
+
+    if not rows:
+        print(f"[Bulk] Run {run_id}: nothing to promote")
+        return {'added': 0, 'skipped': 0}
+
+    backup_before_modification(reason=f"bulk_enrich_{run_id}")
+
+    added = skipped = 0
+    changes = []
+    conn = get_connection()
+    try:
+        existing = _existing_keys(conn)
+        for staging_id, grade, result_json in rows:
+            data = json.loads(result_json)
+            grade = data.get('grade') or grade
+            if cache_key(grade) in existing:
+                conn.execute("UPDATE ai_staging SET promoted_id = 0 WHERE id = ?", (staging_id,))
+                skipped += 1
+                continue
+
+            row = {
+                'grade': grade,
+                'base': data.get('base', 'Fe'),
+                **{element: data.get(element) for element in ELEMENT_COLUMNS},
+                'tech': data.get('application') or data.get('tech'),
+                'standard': data.get('standard'),
+                'manufacturer': data.get('manufacturer'),
+                'analogues': data.get('analogues'),
+                'link': data.get('link') or data.get('source_url') or data.get('pdf_url')
+            }
+            cursor = conn.execute(f"""
+                INSERT INTO steel_grades ({', '.join(row)})
+                VALUES ({', '.join('?' * len(row))})
+            """, tuple(row.values()))
+            new_id = cursor.lastrowid
+            changes.append(('add', grade, row))
+            index_grade(conn, new_id, grade, data.get('analogues'))
+            conn.execute("UPDATE ai_staging SET promoted_id = ? WHERE id = ?", (new_id, staging_id))
+            existing.add(cache_key(grade))
+            added += 1
+
+        generation = bump_write_generation(conn) if added else None
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    if added:
+        # One journal write for the whole import; the backup after it is taken at exit
+        get_change_journal().append_many(generation, changes, source='bulk_enrich')
+        request_backup(reason=f"bulk_enrich_{run_id}")
+
+    print(f"[Bulk] Run {run_id}: {added} grades added, {skipped} skipped (already in database)")
+    return {'added': added, 'skipped': skipped}
+
+
+def _run(run_id: str, args) -> None:
+    from ai_search import get_ai_search
+
+    ai_search = get_ai_search()
+    if not ai_search.enabled:
+        print("AI search is disabled (check PERPLEXITY_API_KEY / ENABLE_AI_FALLBACK)")
+        sys.exit(1)
+
+    enricher = BulkEnricher(
+        ai_search, run_id,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        flush_interval=args.flush_interval,
+        min_confidence=args.min_confidence,
+        force=args.force,
+        max_attempts=args.max_attempts,
+        deadline=args.deadline,
+        busy_retries=args.busy_retries
+    )
+    try:
+        summary = asyncio.run(enricher.run())
+    except KeyboardInterrupt:
+        print(f"\n[Bulk] Interrupted - continue with: python bulk_enrich.py resume {run_id}")
+        sys.exit(130)
+
+    print(json.dumps(summary, indent=2))
+    print(f"Review with: python bulk_enrich.py status {run_id}")
+    print(f"Add to database: python bulk_enrich.py promote {run_id}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk AI enrichment of steel grade lists")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_run_options(command):
+        command.add_argument('--concurrency', type=int, default=4, help="concurrent AI searches")
+        command.add_argument('--batch-size', type=int, default=20, help="results per transaction")
+        command.add_argument('--flush-interval', type=float, default=5.0, help="max seconds between transactions")
+        command.add_argument('--min-confidence', choices=list(CONFIDENCE_LEVELS), default='medium')
+        command.add_argument('--max-attempts', type=int, default=3, help="attempts per grade on errors")
+        command.add_argument('--busy-retries', type=int, default=10,
+                             help="waits for a busy provider per grade (then retried on resume)")
+        command.add_argument('--force', action='store_true', help="bypass cached AI results")
+        command.add_argument('--deadline', type=float, default=120.0,
+                             help="seconds per search attempt (slower stages are skipped or cut)")
+
+    run_command = commands.add_parser('run', help="enrich grades from a file (resumes the same list)")
+    run_command.add_argument('file')
+    add_run_options(run_command)
+
+    resume_command = commands.add_parser('resume', help="continue an interrupted run")
+    resume_command.add_argument('run_id')
+    add_run_options(resume_command)
+
+    status_command = commands.add_parser('status', help="show run progress")
+    status_command.add_argument('run_id', nargs='?')
+
+    promote_command = commands.add_parser('promote', help="add staged results to steel_grades")
+    promote_command.add_argument('run_id')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        grades = read_grades(args.file)
+        if not grades:
+            print(f"No grades in {args.file}")
+            sys.exit(1)
+        run_id, resumed = prepare_run(grades, args.file)
+        print(f"[Bulk] {'Resuming' if resumed else 'Created'} run {run_id} ({len(grades)} grades)")
+        _run(run_id, args)
+
+    elif args.command == 'resume':
+        _run(args.run_id, args)
+
+    elif args.command == 'status':
+        print_status(args.run_id)
+
+    elif args.command == 'promote':
+        promote(args.run_id)
+
+
+if __name__ == '__main__':
+    main()
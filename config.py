@@ -13,3 +13,10 @@ RETRY_COUNT = 3
 REQUEST_TIMEOUT = 30
 DELAY_BETWEEN_REQUESTS = 1  # seconds
 
+# Read snapshot configuration
+# When enabled, read endpoints are served from an in-memory copy of the database
+# that is rebuilt whenever the write generation changes
+READ_SNAPSHOT_ENABLED = os.getenv('READ_SNAPSHOT_ENABLED', 'False').lower() == 'true'
+
+# How often in-memory data (snapshot, autocomplete index) checks the write generation
+GENERATION_CHECK_INTERVAL = float(os.getenv('GENERATION_CHECK_INTERVAL', '2'))  # seconds
@@ -5,64 +5,321 @@ Automatic Database Backup Manager
 Minimal-cost, maximum-reliability backup system for steel_database.db
 
 Features:
-- Automatic backup before any database modification
+- Automatic backups after database modifications, taken in the background
+  after a quiet period (backup_scheduler.py); writes since the latest backup
+  are kept in the change journal (change_journal.py), see recover()
 - Rotating backups (keeps last N versions)
-- Incremental space usage (uses hard links)
+- Incremental space usage: backups are manifests of content-addressed,
+  compressed chunks shared between backups (chunk_store.py), so hundreds of
+  restore points cost about one compressed copy plus the changed chunks
 - Backup verification
 - Easy restore functionality
+- Online copies through the SQLite backup API: consistent with the WAL file,
+  copied in small page steps with short pauses, so readers and writers of
+  the live database are never blocked for the whole copy
+- Cheap change detection: the catalogue write generation (db_meta, bumped by
+  every steel_grades modification) is compared with the one stored in the
+  latest backup; the database is copied and hashed only when it changed
+  (AI cache and telemetry writes do not bump it and do not cause backups)
 
 Usage:
     from database.backup_manager import backup_before_modification, restore_backup
 
-    # Before modifying database
+    # Before a bulk modification (API writes use backup_scheduler.request_backup)
     backup_path = backup_before_modification()
 
     # After modification, if something went wrong
     restore_backup(backup_path)
+
+    # Database lost or corrupted: latest backup + change journal
+    python database/backup_manager.py recover
+
+    # Point-in-time restore (base backup + journal up to the point)
+    python database/backup_manager.py restore-at 2026-01-31T14:00
 """
 
+import os
+import json
+import time
 import sqlite3
 import shutil
 import hashlib
 from pathlib import Path
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 import logging
 
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process lock (run one backup process)
+    fcntl = None
+
+try:
+    from database.change_journal import ChangeJournal, get_change_journal
+    from database.chunk_store import ChunkStore, ChunkError
+except ImportError:  # Run as a script from database/
+    from change_journal import ChangeJournal, get_change_journal
+    from chunk_store import ChunkStore, ChunkError
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Configuration
 BACKUP_DIR = Path(__file__).parent / 'backups'
 DB_PATH = Path(__file__).parent / 'steel_database.db'
-MAX_BACKUPS = 3  # Keep last 3 backups (reduced from 10 for space efficiency)
+MAX_BACKUPS = 200  # Restore points kept (each costs only its changed chunks)
 ALWAYS_BACKUP = True  # Set to False to disable automatic backups
+BACKUP_PAGES_PER_STEP = 1024  # Pages copied per backup step (4 MB with 4 KB pages)
+BACKUP_STEP_SLEEP = 0.005  # Pause between steps, seconds (lets writers in)
+BACKUP_MAX_RESTARTS = 3  # Copy restarts (source written meanwhile) before a single-step copy
+HASH_BUFFER_SIZE = 1024 * 1024  # Read size when hashing a backup copy
+
+class _CopyRestarted(Exception):
+    """Online copy restarted too often (aborts the stepwise copy)"""
+
 
 class BackupManager:
-    def __init__(self, db_path=DB_PATH, backup_dir=BACKUP_DIR, max_backups=MAX_BACKUPS):
+    def __init__(self, db_path=DB_PATH, backup_dir=BACKUP_DIR, max_backups=MAX_BACKUPS,
+                 pages_per_step=BACKUP_PAGES_PER_STEP, step_sleep=BACKUP_STEP_SLEEP):
         self.db_path = Path(db_path)
         self.backup_dir = Path(backup_dir)
         self.max_backups = max_backups
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
 
         # Create backup directory
         self.backup_dir.mkdir(exist_ok=True)
-
-    def get_db_hash(self):
-        """Calculate MD5 hash of database file"""
-        if not self.db_path.exists():
+        self.store = ChunkStore(self.backup_dir / 'chunks')
+
+        # Serializes chunk writes with garbage collection: threads (RLock) and
+        # processes (flock on backups/.store.lock; app and bulk_enrich back up concurrently)
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+
+    @contextmanager
+    def _store_lock(self):
+        """Exclusive use of the chunk store (reentrant within a thread)"""
+        with self._lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                self._lock_file = open(self.backup_dir / '.store.lock', 'a')
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_file is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def get_db_hash(self, path=None):
+        """
+        Calculate MD5 hash of a database file (default: the live database)
+
+        The live file alone misses pages still in its -wal file; backups are
+        compared by the hash of their consistent copy.
+        """
+        path = Path(path) if path else self.db_path
+        if not path.exists():
             return None
 
         md5 = hashlib.md5()
-        with open(self.db_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
+        with open(path, 'rb', buffering=0) as f:
+            for chunk in iter(lambda: f.read(HASH_BUFFER_SIZE), b""):
                 md5.update(chunk)
         return md5.hexdigest()
 
-    def get_db_stats(self):
-        """Get database statistics"""
+    def get_change_signature(self):
+        """
+        Cheap signature of the live database content (no full read)
+
+        "gen:<n>" from the persisted write generation; databases without one
+        (never modified through the app) fall back to size and mtime of the
+        database and its -wal file.
+
+        Returns:
+            Signature string, or None if the database does not exist
+        """
         if not self.db_path.exists():
             return None
 
+        generation = self._read_generation(self.db_path)
+        if generation:
+            return f"gen:{generation}"
+
+        parts = []
+        for path in (self.db_path, Path(f"{self.db_path}-wal")):
+            if path.exists():
+                stat = path.stat()
+                parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+        return "file:" + ":".join(parts)
+
+    @staticmethod
+    def _read_generation(path):
+        """Write generation stored in a database file (0 if none)"""
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30.0)
+            try:
+                row = conn.execute(
+                    "SELECT value FROM db_meta WHERE key = 'write_generation'"
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return 0
+        return row[0] if row and row[0] else 0
+
+    @staticmethod
+    def _read_marker(backup_path, name):
+        marker = Path(backup_path) / name
+        if not marker.exists():
+            return None
+        with open(marker, 'r') as f:
+            return f.read().strip()
+
+    @staticmethod
+    def _load_manifest(backup_path):
+        manifest_path = Path(backup_path) / 'manifest.json'
+        if not manifest_path.exists():
+            return None
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+
+    def _store_copy(self, copy_path, backup_path, manifest=None):
+        """
+        Store a database copy as backup_path (chunks + manifest.json + hash.txt)
+
+        Args:
+            copy_path: Consistent copy (see online_copy), deleted afterwards
+            backup_path: Backup directory to create
+            manifest: Result of store.write_file(copy_path) if already stored
+
+        Returns:
+            Manifest dict
+        """
+        with self._store_lock():
+            try:
+                if manifest is None:
+                    manifest = self.store.write_file(copy_path)
+            finally:
+                Path(copy_path).unlink()
+
+            backup_path = Path(backup_path)
+            backup_path.mkdir(exist_ok=True)
+            tmp_path = backup_path / 'manifest.json.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, backup_path / 'manifest.json')
+
+            with open(backup_path / 'hash.txt', 'w') as f:
+                f.write(manifest['md5'])
+        return manifest
+
+    def materialize(self, backup_path, target_path):
+        """
+        Database file of a backup: reassembled from its chunks into
+        target_path, or the full copy of a backup made before chunking
+
+        Returns:
+            (path, temporary) - temporary is True if path is target_path
+            and should be deleted by the caller
+
+        Raises:
+            ChunkError: Missing/corrupted chunk
+            FileNotFoundError: Neither manifest nor database file in backup
+        """
+        backup_path = Path(backup_path)
+        manifest = self._load_manifest(backup_path)
+        if manifest is not None:
+            return self.store.read_file(manifest, target_path), True
+
+        db_backup = backup_path / 'steel_database.db'
+        if db_backup.exists():
+            return db_backup, False
+        raise FileNotFoundError(f"Database file not found in backup: {backup_path}")
+
+    def online_copy(self, target_path, source_path=None):
+        """
+        Copy the live database with the SQLite online backup API
+
+        Unlike a file copy, the result includes transactions still in the
+        -wal file and is always consistent. Pages are copied in steps of
+        pages_per_step with step_sleep pauses.
+
+        In WAL mode the copy reads one snapshot (an open read transaction on
+        the source connection): writers commit concurrently and the copy is
+        never restarted. Other journal modes are copied without holding a
+        lock between steps; SQLite restarts the copy when the source is
+        written meanwhile, and after BACKUP_MAX_RESTARTS restarts the rest is
+        copied in one step.
+
+        Args:
+            target_path: File to create (written as <name>.tmp, then renamed)
+            source_path: Database to copy (default: the live database)
+
+        Returns:
+            Seconds the copy took
+        """
+        source_path = Path(source_path) if source_path else self.db_path
+        target_path = Path(target_path)
+        tmp_path = target_path.with_name(target_path.name + '.tmp')
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+        started = time.monotonic()
+        restarts = 0
+        last_remaining = None
+
+        def progress(status, remaining, total):
+            nonlocal restarts, last_remaining
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+                if restarts > BACKUP_MAX_RESTARTS:
+                    raise _CopyRestarted()
+            last_remaining = remaining
+            if remaining and self.step_sleep:
+                time.sleep(self.step_sleep)
+
+        source = sqlite3.connect(str(source_path), timeout=30.0, isolation_level=None)
         try:
-            conn = sqlite3.connect(self.db_path)
+            snapshot = source.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal'
+            if snapshot:
+                source.execute('BEGIN')
+                source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+            target = sqlite3.connect(str(tmp_path))
+            try:
+                try:
+                    source.backup(target, pages=self.pages_per_step, progress=progress)
+                except _CopyRestarted:
+                    logging.warning(f"Database changed {restarts} times during backup, copying in one step")
+                    source.backup(target)
+                # Self-contained file (no -wal next to the backup)
+                target.execute('PRAGMA journal_mode=DELETE')
+            finally:
+                target.close()
+        except Exception:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+        finally:
+            source.close()
+
+        os.replace(tmp_path, target_path)
+        return time.monotonic() - started
+
+    def get_db_stats(self, path=None):
+        """Get database statistics (default: the live database)"""
+        path = Path(path) if path else self.db_path
+        if not path.exists():
+            return None
+
+        try:
+            conn = sqlite3.connect(path)
             cursor = conn.cursor()
 
             # Get grade count
@@ -78,7 +335,7 @@ class BackupManager:
             return {
                 'total_grades': total_grades,
                 'with_analogues': with_analogues,
-                'size_mb': self.db_path.stat().st_size / (1024 * 1024)
+                'size_mb': path.stat().st_size / (1024 * 1024)
             }
         except Exception as e:
             logging.error(f"Error getting DB stats: {e}")
@@ -90,51 +347,226 @@ class BackupManager:
             logging.error(f"Database not found: {self.db_path}")
             return None
 
-        # Get current hash and stats
-        db_hash = self.get_db_hash()
-        db_stats = self.get_db_stats()
+        with self._store_lock():
+            # Cheap check first: nothing written since the latest backup
+            signature = self.get_change_signature()
+            last_backup = self.get_latest_backup()
+            if last_backup and signature and self._read_marker(last_backup, 'signature.txt') == signature:
+                logging.info(f"Database unchanged since last backup ({signature}), skipping")
+                return last_backup
 
-        # Check if last backup is identical
-        last_backup = self.get_latest_backup()
-        if last_backup:
-            with open(last_backup / 'hash.txt', 'r') as f:
-                last_hash = f.read().strip()
-            if last_hash == db_hash:
+            # Create backup filename with timestamp
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            backup_name = f"backup_{timestamp}_{reason}"
+            backup_path = self.backup_dir / backup_name
+
+            # Consistent online copy (includes the -wal file, does not block writers)
+            staging_path = self.backup_dir / f".{backup_name}.db"
+            try:
+                copy_seconds = self.online_copy(staging_path)
+            except sqlite3.Error as e:
+                logging.error(f"Backup failed: {e}")
+                return None
+            db_stats = self.get_db_stats(staging_path)
+
+            # Writes committed during the copy are in it: tag the backup with
+            # the generation it actually contains (base for journal replay)
+            copy_generation = self._read_generation(staging_path)
+            if copy_generation:
+                signature = f"gen:{copy_generation}"
+
+            # Chunk the copy (one read: chunk digests + MD5 of the whole file)
+            try:
+                manifest = self.store.write_file(staging_path)
+            except OSError as e:
+                staging_path.unlink()
+                logging.error(f"Backup failed: {e}")
+                return None
+
+            # Check if last backup is identical (signature changed without a content change)
+            if last_backup and self._read_marker(last_backup, 'hash.txt') == manifest['md5']:
+                staging_path.unlink()
+                if signature:
+                    with open(last_backup / 'signature.txt', 'w') as f:
+                        f.write(signature)
                 logging.info(f"Database unchanged since last backup, skipping")
                 return last_backup
 
-        # Create backup filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_name = f"backup_{timestamp}_{reason}"
-        backup_path = self.backup_dir / backup_name
+            self._store_copy(staging_path, backup_path, manifest)
 
-        backup_path.mkdir(exist_ok=True)
+            # Save change signature
+            if signature:
+                with open(backup_path / 'signature.txt', 'w') as f:
+                    f.write(signature)
 
-        # Copy database file
-        db_backup = backup_path / 'steel_database.db'
-        shutil.copy2(self.db_path, db_backup)
+            # Save stats
+            if db_stats:
+                with open(backup_path / 'stats.txt', 'w') as f:
+                    f.write(f"Total grades: {db_stats['total_grades']}\n")
+                    f.write(f"With analogues: {db_stats['with_analogues']}\n")
+                    f.write(f"Size: {db_stats['size_mb']:.2f} MB\n")
+                    f.write(f"Stored: {manifest['stored_bytes'] / (1024 * 1024):.2f} MB "
+                            f"({manifest['new_chunks']}/{len(manifest['chunks'])} new chunks)\n")
+                    f.write(f"Timestamp: {timestamp}\n")
+                    f.write(f"Reason: {reason}\n")
 
-        # Save hash
-        with open(backup_path / 'hash.txt', 'w') as f:
-            f.write(db_hash)
+            logging.info(f"Backup created: {backup_name} ({copy_seconds:.2f} s, "
+                         f"{manifest['new_chunks']}/{len(manifest['chunks'])} new chunks)")
+            logging.info(f"  Total grades: {db_stats['total_grades'] if db_stats else 'unknown'}")
+            logging.info(f"  Size: {db_stats['size_mb']:.2f} MB" if db_stats else "")
 
-        # Save stats
-        if db_stats:
-            with open(backup_path / 'stats.txt', 'w') as f:
-                f.write(f"Total grades: {db_stats['total_grades']}\n")
-                f.write(f"With analogues: {db_stats['with_analogues']}\n")
-                f.write(f"Size: {db_stats['size_mb']:.2f} MB\n")
-                f.write(f"Timestamp: {timestamp}\n")
-                f.write(f"Reason: {reason}\n")
+            # Clean old backups
+            self.clean_old_backups()
 
-        logging.info(f"Backup created: {backup_name}")
-        logging.info(f"  Total grades: {db_stats['total_grades'] if db_stats else 'unknown'}")
-        logging.info(f"  Size: {db_stats['size_mb']:.2f} MB" if db_stats else "")
+        return backup_path
 
-        # Clean old backups
-        self.clean_old_backups()
+    def get_backup_generation(self, backup_path):
+        """Write generation contained in a backup (0 if unknown)"""
+        signature = self._read_marker(backup_path, 'signature.txt') or ''
+        if signature.startswith('gen:'):
+            return int(signature[4:])
+        return 0
+
+    def find_base_backup(self, generation):
+        """Newest backup containing at most generation (None if none)"""
+        best = None
+        best_generation = 0
+        for backup in self.backup_dir.glob("backup_*"):
+            backup_generation = self.get_backup_generation(backup)
+            if 0 < backup_generation <= generation and backup_generation > best_generation:
+                best, best_generation = backup, backup_generation
+        return best
+
+    def restore_to(self, generation=None, backup_path=None):
+        """
+        Point-in-time restore: a base backup plus the change journal after it
+
+        Args:
+            generation: Target write generation (None = last committed
+                        write); see ChangeJournal.resolve for times
+            backup_path: Base backup (default: latest for generation=None,
+                         else the newest one at or before generation)
+
+        When the target is older than the newest known write, the journal
+        entries after it are moved to an archive file, the generation jumps
+        past every known one (so new writes never reuse a generation of the
+        abandoned history) and a backup of the restored state is taken.
+
+        Run it with the app (and bulk_enrich) stopped: a write committed
+        between the restore and the generation jump would reuse a
+        generation of the abandoned history.
+
+        Returns:
+            True if successful
+        """
+        journal = get_change_journal()
+        if backup_path is not None:
+            backup_path = Path(backup_path)
+        elif generation is None:
+            backup_path = self.get_latest_backup()
+        else:
+            backup_path = self.find_base_backup(generation)
+        if backup_path is None:
+            logging.error(f"No backup to restore generation {generation if generation is not None else 'latest'} from")
+            return False
 
-        return backup_path
+        base_generation = self.get_backup_generation(backup_path)
+        if generation is not None and base_generation > generation:
+            logging.error(f"{backup_path.name} contains generation {base_generation}, newer than {generation}")
+            return False
+
+        known_generation = max(journal.max_generation(), self._read_generation(self.db_path),
+                               *(self.get_backup_generation(b) for b in self.backup_dir.glob("backup_*")))
+
+        if not self.restore_snapshot(backup_path):
+            return False
+
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30.0)
+            try:
+                applied = journal.replay(conn, since_generation=base_generation, until_generation=generation)
+                if generation is not None and generation < known_generation:
+                    archive_path, moved = journal.archive(generation)
+                    journal.set_generation(conn, known_generation + 1)
+                    conn.commit()
+                    logging.info(f"Moved {moved} later journal entries to {archive_path.name}")
+            finally:
+                conn.close()
+        except (sqlite3.Error, ValueError, OSError) as e:
+            logging.error(f"Change journal replay failed: {e}")
+            return False
+
+        logging.info(f"Restored {backup_path.name} + {applied} journal entries "
+                     f"(generation {generation if generation is not None else 'latest'})")
+        if generation is not None and generation < known_generation:
+            self.create_backup(reason="restore_point")
+        return True
+
+    def recover(self, backup_path=None):
+        """
+        Restore a backup (latest if not specified) and replay the change
+        journal written after it
+
+        Returns:
+            True if successful
+        """
+        return self.restore_to(None, backup_path)
+
+    def replay_changes(self, generations, journal=None):
+        """
+        Apply selected journal entries to the live database as new writes
+
+        Each applied transaction gets a new write generation and is journaled
+        again (source 'replay'). Replayed grades are added to the analogue
+        graph on the next app start (ensure_analogue_graph).
+
+        Args:
+            generations: Generations to replay
+            journal: Journal to read (default: the current one; an archive
+                     written by restore_to for abandoned changes)
+
+        Returns:
+            Number of applied entries
+        """
+        current = get_change_journal()
+        entries = (journal or current).entries(generations=set(generations))
+
+        by_generation = {}
+        for entry in entries:
+            by_generation.setdefault(entry['generation'], []).append(entry)
+
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        try:
+            for selected in by_generation.values():
+                for entry in selected:
+                    current.apply(conn, entry)
+                generation = self._bump_generation(conn)
+                conn.commit()
+                current.append_many(generation, [(e['op'], e['grade'], e.get('row')) for e in selected],
+                                    source='replay')
+        finally:
+            conn.close()
+
+        logging.info(f"Replayed {len(entries)} journal entries")
+        return len(entries)
+
+    @staticmethod
+    def _bump_generation(conn):
+        """Increment the write generation inside the open transaction (as database_schema does)"""
+        conn.execute("CREATE TABLE IF NOT EXISTS db_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('write_generation', 0)")
+        conn.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'write_generation'")
+        return conn.execute("SELECT value FROM db_meta WHERE key = 'write_generation'").fetchone()[0]
+
+    def restore_backup(self, backup_path):
+        """
+        Restore database from backup, as of the generation it contains
+
+        Later journal entries are archived and the generation jumps past
+        them (see restore_to), so new writes never reuse their generations.
+        """
+        backup_path = Path(backup_path)
+        return self.restore_to(self.get_backup_generation(backup_path), backup_path)
 
     def get_latest_backup(self):
         """Get path to latest backup"""
@@ -159,31 +591,55 @@ class BackupManager:
                 print(f"\n{i}. {backup.name}")
                 print(f"   (No stats available)")
 
-        print("\n" + "="*80)
+        store = self.store.stats()
+        print(f"\nChunk store: {store['chunks']} chunks, {store['size_mb']:.2f} MB")
+        print("="*80)
         return backups
 
-    def restore_backup(self, backup_path):
-        """Restore database from backup"""
+    def restore_snapshot(self, backup_path):
+        """
+        Restore database from backup (base step of restore_to)
+
+        Restores the backup's file only: the change journal and the write
+        generation are left as they are, use restore_backup or restore_to.
+        """
         backup_path = Path(backup_path)
 
         if not backup_path.exists():
             logging.error(f"Backup not found: {backup_path}")
             return False
 
-        db_backup = backup_path / 'steel_database.db'
-        if not db_backup.exists():
-            logging.error(f"Database file not found in backup: {db_backup}")
+        # Reassemble the backup first: a damaged backup must not touch the live database
+        try:
+            db_backup, temporary = self.materialize(backup_path, self.backup_dir / f".restore_{backup_path.name}.db")
+        except (ChunkError, FileNotFoundError) as e:
+            logging.error(f"Cannot restore {backup_path.name}: {e}")
             return False
 
-        # Create safety backup of current database
-        if self.db_path.exists():
-            safety_backup = self.backup_dir / f"safety_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            safety_backup.mkdir(exist_ok=True)
-            shutil.copy2(self.db_path, safety_backup / 'steel_database.db')
-            logging.info(f"Created safety backup: {safety_backup.name}")
-
-        # Restore from backup
-        shutil.copy2(db_backup, self.db_path)
+        try:
+            # Create safety backup of current database
+            if self.db_path.exists():
+                safety_backup = self.backup_dir / f"safety_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                staging_path = self.backup_dir / f".{safety_backup.name}.db"
+                self.online_copy(staging_path)
+                self._store_copy(staging_path, safety_backup)
+                logging.info(f"Created safety backup: {safety_backup.name}")
+
+            # Restore from backup through the backup API: pages are written into the
+            # live database (and its WAL), so open connections see the restored data
+            # and no stale -wal file is replayed over a copied file
+            source = sqlite3.connect(str(db_backup))
+            try:
+                target = sqlite3.connect(str(self.db_path), timeout=30.0)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+            finally:
+                source.close()
+        finally:
+            if temporary:
+                db_backup.unlink()
         logging.info(f"Database restored from: {backup_path.name}")
 
         # Verify
@@ -196,24 +652,52 @@ class BackupManager:
         return True
 
     def clean_old_backups(self):
-        """Remove old backups, keeping only MAX_BACKUPS most recent"""
-        backups = sorted(self.backup_dir.glob("backup_*"), key=lambda p: p.name, reverse=True)
+        """Remove old backups, keeping only MAX_BACKUPS most recent, and their unused chunks"""
+        with self._store_lock():
+            backups = sorted(self.backup_dir.glob("backup_*"), key=lambda p: p.name, reverse=True)
+
+            # Skip safety backups
+            backups = [b for b in backups if not b.name.startswith("safety_backup_")]
 
-        # Skip safety backups
-        backups = [b for b in backups if not b.name.startswith("safety_backup_")]
+            if len(backups) <= self.max_backups:
+                return
 
-        if len(backups) > self.max_backups:
             for old_backup in backups[self.max_backups:]:
                 shutil.rmtree(old_backup)
                 logging.info(f"Removed old backup: {old_backup.name}")
 
+            # Journal entries older than the oldest kept backup cannot be replayed onto any base
+            oldest_generation = min(self.get_backup_generation(b) for b in backups[:self.max_backups])
+            if oldest_generation:
+                try:
+                    get_change_journal().truncate(oldest_generation)
+                except OSError as e:
+                    logging.warning(f"Change journal truncate failed: {e}")
+
+            # Chunks still referenced by any backup (including safety backups) stay
+            manifests = []
+            for backup in self.backup_dir.glob("*backup_*"):
+                manifest = self._load_manifest(backup)
+                if manifest is not None:
+                    manifests.append(manifest)
+            self.store.gc(manifests)
+
     def verify_backup(self, backup_path):
-        """Verify backup integrity"""
+        """Verify backup integrity (chunks, MD5 and a query on the reassembled database)"""
         backup_path = Path(backup_path)
-        db_backup = backup_path / 'steel_database.db'
 
-        if not db_backup.exists():
+        manifest = self._load_manifest(backup_path)
+        if manifest is not None:
+            missing = self.store.missing(manifest)
+            if missing:
+                return False, f"{len(missing)} chunks missing"
+
+        try:
+            db_backup, temporary = self.materialize(backup_path, self.backup_dir / f".verify_{backup_path.name}.db")
+        except FileNotFoundError:
             return False, "Database file not found"
+        except ChunkError as e:
+            return False, str(e)
 
         # Try to open and query
         try:
@@ -225,6 +709,9 @@ class BackupManager:
             return True, f"OK - {count} grades"
         except Exception as e:
             return False, str(e)
+        finally:
+            if temporary:
+                db_backup.unlink()
 
 
 # Convenience functions
@@ -268,6 +755,10 @@ if __name__ == "__main__":
         print("  python backup_manager.py list             - List backups")
         print("  python backup_manager.py restore [name]   - Restore backup")
         print("  python backup_manager.py verify [name]    - Verify backup")
+        print("  python backup_manager.py recover [name]   - Restore backup + replay change journal")
+        print("  python backup_manager.py restore-at POINT  - Restore to a time (ISO) or gen:N")
+        print("  python backup_manager.py journal [gen]     - List journal entries after gen")
+        print("  python backup_manager.py replay GEN... [--from FILE] - Re-apply selected changes")
         sys.exit(1)
 
     command = sys.argv[1]
@@ -301,6 +792,46 @@ if __name__ == "__main__":
         ok, msg = manager.verify_backup(backup_path)
         print(f"Verification: {'OK' if ok else 'FAILED'} - {msg}")
 
+    elif command == "recover":
+        backup_path = manager.backup_dir / sys.argv[2] if len(sys.argv) > 2 else None
+        ok = manager.recover(backup_path)
+        print(f"Recovery: {'OK' if ok else 'FAILED'}")
+        sys.exit(0 if ok else 1)
+
+    elif command == "restore-at":
+        if len(sys.argv) < 3:
+            print("Specify a time (e.g. 2026-01-31T14:00) or gen:N")
+            sys.exit(1)
+        point = sys.argv[2]
+        if point.startswith("gen:"):
+            generation = int(point[4:])
+        else:
+            generation = get_change_journal().resolve(datetime.fromisoformat(point))
+            if generation is None:
+                print("Change journal is empty, restore a backup instead")
+                sys.exit(1)
+        ok = manager.restore_to(generation)
+        print(f"Restore to generation {generation}: {'OK' if ok else 'FAILED'}")
+        sys.exit(0 if ok else 1)
+
+    elif command == "journal":
+        since = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+        for entry in get_change_journal().entries(since_generation=since):
+            print(f"gen:{entry['generation']:<6} {entry['ts'][:19]}  {entry['op']:<6} "
+                  f"{entry.get('source') or '':<11} {entry['grade']}")
+
+    elif command == "replay":
+        args = sys.argv[2:]
+        journal = None
+        if "--from" in args:
+            index = args.index("--from")
+            journal = ChangeJournal(args[index + 1])
+            del args[index:index + 2]
+        if not args:
+            print("Specify generations to replay")
+            sys.exit(1)
+        manager.replay_changes([int(arg) for arg in args], journal=journal)
+
     else:
         print(f"Unknown command: {command}")
         sys.exit(1)
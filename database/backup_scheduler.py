@@ -0,0 +1,195 @@
+"""
+Background Backup Scheduler
+===========================
+
+API writes used to run a full backup synchronously before doing any work,
+so a burst of 20 "Add" clicks made 20 copies in a row. Writes now only
+register intent (request_backup); a daemon thread takes one backup after
+BACKUP_QUIET_PERIOD seconds without new writes, and at the latest
+BACKUP_MAX_DELAY seconds after the first write not yet backed up. A failed
+backup (e.g. disk full) is retried after a quiet period that doubles with
+every further failure, up to BACKUP_MAX_DELAY.
+
+Writes between two backups are covered by the change journal
+(change_journal.py); backups are the base snapshots it is replayed onto.
+A pending backup is also taken at interpreter exit (flush).
+
+Settings (.env):
+    BACKUP_QUIET_PERIOD=30     # seconds without writes before a backup
+    BACKUP_MAX_DELAY=300       # max seconds a write stays without backup
+
+Usage:
+    from database.backup_scheduler import request_backup
+
+    # After a committed modification
+    request_backup(reason="api_add_steel")
+"""
+
+import os
+import time
+import atexit
+import threading
+from datetime import datetime
+import logging
+
+from database.backup_manager import get_backup_manager, ALWAYS_BACKUP
+from database.change_journal import get_change_journal
+
+
+class BackupScheduler:
+    # Lower bound of the retry delay after a failed backup (seconds)
+    MIN_RETRY_DELAY = 1.0
+
+    def __init__(self, quiet_period=None, max_delay=None, manager=None, journal=None):
+        """
+        Args:
+            quiet_period: Seconds without writes before a backup (default: BACKUP_QUIET_PERIOD)
+            max_delay: Max seconds from the first pending write (default: BACKUP_MAX_DELAY)
+        """
+        self.quiet_period = quiet_period if quiet_period is not None else float(os.getenv('BACKUP_QUIET_PERIOD', '30'))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv('BACKUP_MAX_DELAY', '300'))
+        self.manager = manager or get_backup_manager()
+        self.journal = journal or get_change_journal()
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False  # Backup in progress
+
+        # Pending writes (monotonic times)
+        self._first_write = None
+        self._last_write = None
+        self._reasons = []
+        # Failed backups: no retry before _retry_at
+        self._retry_at = None
+        self._failed_in_row = 0
+
+        self._stats = {
+            'requests': 0,
+            'backups': 0,
+            'failures': 0,
+            'last_backup': None,
+            'last_error': None
+        }
+
+    def request(self, reason="modification"):
+        """Register a committed write; the backup follows after the quiet period"""
+        now = time.monotonic()
+        with self._cond:
+            if self._first_write is None:
+                self._first_write = now
+            self._last_write = now
+            if reason not in self._reasons:
+                self._reasons.append(reason)
+            self._stats['requests'] += 1
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _due_at(self):
+        """Monotonic time of the pending backup (caller holds _cond)"""
+        due = min(self._last_write + self.quiet_period, self._first_write + self.max_delay)
+        if self._retry_at is not None:
+            due = max(due, self._retry_at)
+        return due
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._first_write is None or self._running:
+                    self._cond.wait()
+                delay = self._due_at() - time.monotonic()
+                if delay > 0:
+                    # New writes move the quiet period; re-check when woken
+                    self._cond.wait(delay)
+                    continue
+            self._backup()
+
+    def _backup(self):
+        """Take the pending backup (returns backup path or None)"""
+        with self._cond:
+            if self._first_write is None or self._running:
+                return None
+            self._running = True
+            reasons = self._reasons
+            pending_since = self._first_write
+            self._first_write = self._last_write = None
+            self._reasons = []
+
+        reason = reasons[0] if len(reasons) == 1 else "batch"
+        backup_path = None
+        error = None
+        try:
+            backup_path = self.manager.create_backup(reason=reason)
+            if backup_path is None:
+                error = "create_backup returned no backup"
+        except Exception as e:
+            error = str(e)
+
+        with self._cond:
+            self._running = False
+            if error:
+                # Keep the writes pending; retry after another quiet period (doubled per failure)
+                self._failed_in_row += 1
+                backoff = max(self.MIN_RETRY_DELAY, min(self.quiet_period * 2 ** (self._failed_in_row - 1),
+                                                        max(self.quiet_period, self.max_delay)))
+                logging.error(f"Scheduled backup failed: {error} (retry in {backoff:g} s)")
+                self._stats['failures'] += 1
+                self._stats['last_error'] = error
+                now = time.monotonic()
+                self._retry_at = now + backoff
+                self._first_write = pending_since if self._first_write is None else min(pending_since, self._first_write)
+                self._last_write = max(self._last_write or now, now)
+                self._reasons = reasons + [r for r in self._reasons if r not in reasons]
+            else:
+                self._retry_at = None
+                self._failed_in_row = 0
+                self._stats['backups'] += 1
+                self._stats['last_backup'] = datetime.now().isoformat()
+            self._cond.notify_all()
+
+        return backup_path
+
+    def flush(self):
+        """Take the pending backup now (no-op if nothing is pending)"""
+        return self._backup()
+
+    def stats(self):
+        """Pending state and counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = self._first_write is not None
+            stats['failed_in_row'] = self._failed_in_row
+            stats['pending_seconds'] = (
+                round(time.monotonic() - self._first_write, 1) if self._first_write is not None else None
+            )
+        stats['quiet_period'] = self.quiet_period
+        stats['max_delay'] = self.max_delay
+        stats['journal'] = self.journal.stats()
+        return stats
+
+
+# Singleton instance
+_backup_scheduler = None
+_backup_scheduler_lock = threading.Lock()
+
+
+def get_backup_scheduler():
+    """Get or create BackupScheduler singleton instance (flushed at exit)"""
+    global _backup_scheduler
+
+    if _backup_scheduler is None:
+        with _backup_scheduler_lock:
+            if _backup_scheduler is None:
+                _backup_scheduler = BackupScheduler()
+                atexit.register(_backup_scheduler.flush)
+
+    return _backup_scheduler
+
+
+def request_backup(reason="modification"):
+    """Schedule a backup after a committed modification"""
+    if not ALWAYS_BACKUP:
+        return
+    get_backup_scheduler().request(reason=reason)
@@ -0,0 +1,419 @@
+"""
+Logical change journal of catalogue modifications
+=================================================
+
+Every committed steel_grades modification (API add/delete, AI results added
+by result token, bulk_enrich imports) is appended here as one JSON line per
+changed row, tagged with the write generation of its transaction and its
+source. Together with the base snapshots of backup_manager.py the journal
+allows:
+
+- recovery to the last committed write (latest backup + newer entries)
+- restore to any point in time (newest backup at or before the point +
+  entries up to it), see BackupManager.restore_to
+- replaying selected changes onto the live database
+
+Appends use group commit: each append writes its lines and waits until
+they are fsync'ed, and one fsync covers all lines written by concurrent
+appenders meanwhile, so a burst of writes costs a few fsyncs, not one per
+write. The per-write cost is one append instead of a database copy.
+
+Entries older than the oldest kept backup are dropped (truncate). Replay is
+idempotent (add = insert if the grade is missing, delete = delete by grade).
+A torn last line (crash during append) is ignored.
+
+Several processes write the journal (the app, bulk_enrich, the backup CLI):
+appends and rewrites hold an flock on <journal>.lock, and an appender
+reopens the journal when another process has replaced the file.
+
+Usage:
+    from database.change_journal import get_change_journal
+
+    # After conn.commit() of a modification
+    get_change_journal().append('add', generation, grade, row, source='api')
+
+    # Recovery: python backup_manager.py recover
+    get_change_journal().replay(conn, since_generation=backup_generation)
+"""
+
+import os
+import json
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process lock (run one writer process)
+    fcntl = None
+
+# Configuration
+JOURNAL_PATH = Path(__file__).parent / 'backups' / 'change_journal.jsonl'
+
+OPERATIONS = ('add', 'delete')
+
+
+class ChangeJournal:
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+
+        # Guards the file; fsync runs outside it (group commit)
+        self._cond = threading.Condition()
+        self._file = None
+        self._written = 0  # Appends written to the file
+        self._synced = 0  # Appends known to be on disk
+        self._syncing = False
+        self._retired = []  # Replaced files still being fsync'ed
+
+        self._stats = {
+            'appends': 0,
+            'entries': 0,
+            'fsyncs': 0,
+            'failures': 0
+        }
+
+    @contextmanager
+    def _file_lock(self, exclusive=True):
+        """flock shared by all processes using this journal (the journal file itself is replaced by rewrites)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _open_current(self):
+        """Open the journal for appending, again if another process replaced it (caller holds _cond and the file lock)"""
+        if self._file is not None:
+            try:
+                replaced = os.fstat(self._file.fileno()).st_ino != os.stat(self.path).st_ino
+            except FileNotFoundError:
+                replaced = True
+            if not replaced:
+                return self._file
+            # The replacing process read (under the file lock) and fsync'ed everything written before
+            self._synced = self._written
+            # Closed by the fsync in progress, if any (never wait here while holding the file lock)
+            if self._syncing:
+                self._retired.append(self._file)
+            else:
+                self._file.close()
+            self._file = None
+        self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def append(self, op, generation, grade, row=None, source='api'):
+        """
+        Append a committed modification of one row (durable when this returns)
+
+        Args:
+            op: 'add' or 'delete'
+            generation: Write generation set by the modification
+            grade: Grade name
+            row: Inserted steel_grades columns (for 'add')
+            source: Writer ('api', 'ai', 'bulk_enrich', 'replay')
+
+        Returns:
+            True if written (errors are logged, not raised)
+        """
+        return self.append_many(generation, [(op, grade, row)], source=source)
+
+    def append_many(self, generation, changes, source='api'):
+        """
+        Append all row changes of one transaction (one durable write)
+
+        Args:
+            generation: Write generation set by the transaction
+            changes: List of (op, grade, row) tuples
+            source: Writer (see append)
+
+        Returns:
+            True if written (errors are logged, not raised)
+        """
+        ts = datetime.now().isoformat()
+        lines = []
+        for op, grade, row in changes:
+            if op not in OPERATIONS:
+                raise ValueError(f"Unknown journal operation: {op}")
+            lines.append(json.dumps({
+                'generation': generation,
+                'op': op,
+                'grade': grade,
+                'row': row,
+                'source': source,
+                'ts': ts
+            }, ensure_ascii=False) + '\n')
+        if not lines:
+            return True
+
+        try:
+            with self._cond:
+                with self._file_lock():
+                    journal_file = self._open_current()
+                    journal_file.write(''.join(lines))
+                    journal_file.flush()
+                self._written += 1
+                sequence = self._written
+                self._stats['appends'] += 1
+                self._stats['entries'] += len(lines)
+
+                # Group commit: one appender fsyncs for everyone written so far
+                while self._synced < sequence:
+                    if self._syncing:
+                        self._cond.wait()
+                        continue
+                    if self._file is None:
+                        # Closed by a rewrite, which fsync'ed everything written so far
+                        self._synced = self._written
+                        break
+                    fd = self._file.fileno()
+                    target = self._written
+                    self._syncing = True
+                    self._cond.release()
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        self._cond.acquire()
+                        self._syncing = False
+                        for retired in self._retired:
+                            retired.close()
+                        self._retired = []
+                        self._cond.notify_all()
+                    self._synced = max(self._synced, target)
+                    self._stats['fsyncs'] += 1
+        except OSError as e:
+            # The write itself is committed; only restores past it are affected
+            with self._cond:
+                self._stats['failures'] += 1
+            logging.error(f"Change journal append failed (generation {generation}): {e}")
+            return False
+        return True
+
+    def _read(self):
+        """All entries in append order (caller holds _cond)"""
+        if not self.path.exists():
+            return []
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+
+        result = []
+        for number, line in enumerate(lines, 1):
+            try:
+                result.append(json.loads(line))
+            except json.JSONDecodeError:
+                if number == len(lines):
+                    logging.warning("Change journal: ignoring torn last entry")
+                    continue
+                raise
+        return result
+
+    def entries(self, since_generation=0, until_generation=None, generations=None):
+        """
+        Journal entries with since_generation < generation <= until_generation
+
+        Args:
+            generations: Only these generations (selected changes)
+
+        Returns:
+            List of entry dicts in commit order (by generation; concurrent
+            writers may append out of order, rows of one transaction keep
+            their append order)
+        """
+        with self._cond, self._file_lock(exclusive=False):
+            entries = self._read()
+
+        result = []
+        for entry in entries:
+            generation = entry.get('generation') or 0
+            if generation <= since_generation:
+                continue
+            if until_generation is not None and generation > until_generation:
+                continue
+            if generations is not None and generation not in generations:
+                continue
+            result.append(entry)
+        result.sort(key=lambda entry: entry.get('generation') or 0)
+        return result
+
+    def max_generation(self):
+        """Highest generation in the journal (0 if empty)"""
+        return max((entry.get('generation') or 0 for entry in self.entries()), default=0)
+
+    def resolve(self, point):
+        """
+        Write generation of the catalogue at a point in time
+
+        Args:
+            point: datetime (local time, as in the entries' ts)
+
+        Returns:
+            Highest generation written at or before point; one less than the
+            first generation if point precedes the whole journal; None if the
+            journal is empty
+        """
+        entries = self.entries()
+        if not entries:
+            return None
+
+        timestamp = point.isoformat()
+        generation = None
+        for entry in entries:
+            if entry['ts'] <= timestamp:
+                generation = max(generation or 0, entry['generation'])
+        if generation is None:
+            generation = entries[0]['generation'] - 1
+        return generation
+
+    def _rewrite(self, keep, archive_path=None):
+        """
+        Rewrite the journal with the entries keep(entry) accepts
+
+        Dropped entries are appended to archive_path if given.
+
+        Returns:
+            (kept, dropped) entry counts
+        """
+        with self._cond:
+            # No fsync may start while _cond is held; wait before taking the file lock
+            while self._syncing:
+                self._cond.wait()
+            with self._file_lock():
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+
+                entries = self._read()
+                kept = [entry for entry in entries if keep(entry)]
+                dropped = [entry for entry in entries if not keep(entry)]
+
+                if archive_path is not None and dropped:
+                    with open(archive_path, 'a', encoding='utf-8') as f:
+                        for entry in dropped:
+                            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                        f.flush()
+                        os.fsync(f.fileno())
+
+                tmp_path = self.path.with_name(self.path.name + '.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for entry in kept:
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self._synced = self._written
+                return len(kept), len(dropped)
+
+    def truncate(self, upto_generation):
+        """
+        Drop entries no backup can use any more (generation <= upto_generation)
+
+        Returns:
+            Number of entries kept
+        """
+        return self._rewrite(lambda entry: (entry.get('generation') or 0) > upto_generation)[0]
+
+    def archive(self, after_generation):
+        """
+        Move entries newer than after_generation to a separate file
+
+        Used after a restore to an earlier point: the entries after it are
+        no longer part of the catalogue's history, but can still be listed
+        and replayed from the archive (ChangeJournal(archive_path)).
+
+        Returns:
+            (archive path, number of moved entries)
+        """
+        archive_path = self.path.with_name(
+            f"{self.path.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_abandoned.jsonl"
+        )
+        moved = self._rewrite(
+            lambda entry: (entry.get('generation') or 0) <= after_generation, archive_path
+        )[1]
+        return archive_path, moved
+
+    @staticmethod
+    def apply(conn, entry):
+        """Apply one entry to steel_grades (idempotent, no commit)"""
+        if entry['op'] == 'add':
+            exists = conn.execute(
+                "SELECT 1 FROM steel_grades WHERE grade = ?", (entry['grade'],)
+            ).fetchone()
+            if not exists:
+                row = entry.get('row') or {'grade': entry['grade']}
+                conn.execute(
+                    f"INSERT INTO steel_grades ({', '.join(row)}) "
+                    f"VALUES ({', '.join('?' * len(row))})",
+                    tuple(row.values())
+                )
+        else:
+            conn.execute("DELETE FROM steel_grades WHERE grade = ?", (entry['grade'],))
+
+    @staticmethod
+    def set_generation(conn, generation):
+        """Set the write generation of a database (no commit)"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS db_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        conn.execute(
+            "INSERT OR REPLACE INTO db_meta (key, value) VALUES ('write_generation', ?)",
+            (generation,)
+        )
+
+    def replay(self, conn, since_generation=0, until_generation=None):
+        """
+        Apply journal entries to a database (e.g. a restored backup)
+
+        Args:
+            conn: sqlite3 connection to the target database
+            since_generation: Generation the database already contains
+            until_generation: Last generation to apply (None = all)
+
+        Returns:
+            Number of applied entries
+        """
+        applied = 0
+        last_generation = None
+        for entry in self.entries(since_generation, until_generation):
+            self.apply(conn, entry)
+            last_generation = max(last_generation or 0, entry['generation'])
+            applied += 1
+
+        if last_generation is not None:
+            self.set_generation(conn, last_generation)
+        conn.commit()
+        return applied
+
+    def stats(self):
+        """Append counters (entries / fsyncs shows the group commit factor)"""
+        with self._cond:
+            stats = dict(self._stats)
+        stats['size_kb'] = round(self.path.stat().st_size / 1024, 1) if self.path.exists() else 0
+        return stats
+
+
+# Singleton instance
+_change_journal = None
+_change_journal_lock = threading.Lock()
+
+
+def get_change_journal():
+    """Get or create ChangeJournal singleton instance"""
+    global _change_journal
+
+    if _change_journal is None:
+        with _change_journal_lock:
+            if _change_journal is None:
+                _change_journal = ChangeJournal()
+
+    return _change_journal
@@ -0,0 +1,194 @@
+"""
+Content-addressed chunk store for database backups
+==================================================
+
+A backup used to be a full uncompressed copy of the database, although
+only a few pages change between two backups. Backups are now split into
+fixed-size chunks (CHUNK_SIZE, a multiple of every SQLite page size, so
+chunks are page-aligned); each chunk is stored once, zlib-compressed, under
+the SHA-256 of its content. A backup is a manifest: the list of its chunk
+digests plus size and MD5 of the whole file.
+
+Unchanged chunks are shared by all backups that contain them, so keeping
+hundreds of restore points costs about one compressed copy plus the changed
+chunks. Chunks no longer referenced by any manifest are removed by gc().
+
+Layout:
+    backups/chunks/ab/abcdef...    # zlib-compressed chunk, name = sha256
+    backups/<backup>/manifest.json
+
+Usage:
+    store = ChunkStore(backup_dir / 'chunks')
+    manifest = store.write_file(db_copy)              # chunks + manifest dict
+    store.read_file(manifest, restored_db)            # reassemble
+    store.gc([manifest, ...])                         # drop unreferenced chunks
+"""
+
+import os
+import zlib
+import hashlib
+import threading
+from pathlib import Path
+import logging
+
+# Configuration
+CHUNK_SIZE = 64 * 1024  # Bytes per chunk (16 pages of 4 KB; SQLite pages are at most 64 KB)
+COMPRESS_LEVEL = 6  # zlib level of stored chunks
+MANIFEST_FORMAT = 1
+
+
+class ChunkError(Exception):
+    """Chunk missing or corrupted"""
+
+
+class ChunkStore:
+    def __init__(self, root, chunk_size=CHUNK_SIZE):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _chunk_path(self, digest):
+        return self.root / digest[:2] / digest
+
+    def has(self, digest):
+        return self._chunk_path(digest).exists()
+
+    def put(self, data):
+        """
+        Store a chunk (no-op if already stored)
+
+        Returns:
+            (digest, stored_bytes) - stored_bytes is 0 for a known chunk
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if path.exists():
+            return digest, 0
+
+        compressed = zlib.compress(data, COMPRESS_LEVEL)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f"{digest}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return digest, len(compressed)
+
+    def get(self, digest):
+        """
+        Raises:
+            ChunkError: Chunk missing or its content does not match digest
+        """
+        path = self._chunk_path(digest)
+        try:
+            with open(path, 'rb') as f:
+                data = zlib.decompress(f.read())
+        except FileNotFoundError:
+            raise ChunkError(f"Chunk missing: {digest}")
+        except zlib.error as e:
+            raise ChunkError(f"Chunk corrupted: {digest} ({e})")
+
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ChunkError(f"Chunk corrupted: {digest}")
+        return data
+
+    def write_file(self, path):
+        """
+        Split a file into chunks and store them
+
+        Returns:
+            Manifest dict: format, chunk_size, size, md5, chunks (digests),
+            new_chunks, stored_bytes (compressed bytes added to the store)
+        """
+        md5 = hashlib.md5()
+        chunks = []
+        new_chunks = 0
+        stored_bytes = 0
+        size = 0
+
+        with open(path, 'rb', buffering=0) as f:
+            for data in iter(lambda: f.read(self.chunk_size), b""):
+                md5.update(data)
+                size += len(data)
+                digest, stored = self.put(data)
+                chunks.append(digest)
+                if stored:
+                    new_chunks += 1
+                    stored_bytes += stored
+
+        return {
+            'format': MANIFEST_FORMAT,
+            'chunk_size': self.chunk_size,
+            'size': size,
+            'md5': md5.hexdigest(),
+            'chunks': chunks,
+            'new_chunks': new_chunks,
+            'stored_bytes': stored_bytes
+        }
+
+    def read_file(self, manifest, target_path):
+        """
+        Reassemble the file of a manifest (written as <name>.tmp, then renamed)
+
+        Raises:
+            ChunkError: Missing/corrupted chunk or MD5 mismatch
+        """
+        target_path = Path(target_path)
+        tmp_path = target_path.with_name(target_path.name + '.tmp')
+        md5 = hashlib.md5()
+        try:
+            with open(tmp_path, 'wb') as f:
+                for digest in manifest['chunks']:
+                    data = self.get(digest)
+                    md5.update(data)
+                    f.write(data)
+            if md5.hexdigest() != manifest['md5']:
+                raise ChunkError("Reassembled file does not match manifest MD5")
+        except Exception:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+        os.replace(tmp_path, target_path)
+        return target_path
+
+    def missing(self, manifest):
+        """Digests of a manifest that are not in the store"""
+        return [digest for digest in dict.fromkeys(manifest['chunks']) if not self.has(digest)]
+
+    def gc(self, manifests):
+        """
+        Remove chunks not referenced by any of manifests
+
+        Reference counts are recomputed from the manifests on every run, so
+        an interrupted backup or deletion never leaves a wrong count behind.
+        Must not run concurrently with write_file, in any process
+        (BackupManager holds its store lock around both); leftover .tmp files
+        of interrupted writes are removed too.
+
+        Returns:
+            (removed chunks, freed bytes)
+        """
+        refcounts = {}
+        for manifest in manifests:
+            for digest in manifest['chunks']:
+                refcounts[digest] = refcounts.get(digest, 0) + 1
+
+        removed = 0
+        freed = 0
+        for path in self.root.glob('*/*'):
+            if path.name.endswith('.tmp') or refcounts.get(path.name, 0) == 0:
+                freed += path.stat().st_size
+                path.unlink()
+                removed += 1
+        if removed:
+            logging.info(f"Chunk store: removed {removed} unreferenced chunks ({freed / (1024 * 1024):.2f} MB)")
+        return removed, freed
+
+    def stats(self):
+        """Stored chunk count and compressed size"""
+        paths = [p for p in self.root.glob('*/*') if not p.name.endswith('.tmp')]
+        return {
+            'chunks': len(paths),
+            'size_mb': sum(p.stat().st_size for p in paths) / (1024 * 1024)
+        }
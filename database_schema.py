@@ -49,7 +49,22 @@ def create_database():
     cursor.execute('''
         CREATE INDEX IF NOT EXISTS idx_analogues ON steel_grades(analogues)
     ''')
-    
+
+    # Key/value metadata (write generation, etc.)
+    create_meta_table(cursor)
+
+    # Analogue graph (parsed analogues column)
+    create_analogue_tables(cursor)
+
+    # Cached AI search results
+    create_ai_cache_table(cursor)
+
+    # Bulk AI enrichment (checkpoints + staging)
+    create_enrichment_tables(cursor)
+
+    # Per-search AI telemetry
+    create_ai_telemetry_table(cursor)
+
     conn.commit()
     conn.close()
     print(f"Database created at {config.DB_FILE}")
@@ -68,6 +83,229 @@ def get_connection():
     return conn
 
 
+def create_meta_table(cursor):
+    """Create db_meta key/value table if missing"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS db_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+
+
+def create_analogue_tables(cursor):
+    """
+    Create analogue graph tables if missing
+
+    - grade_keys: normalized name of every grade (indexed lookup by name)
+    - steel_analogues: one edge per analogue listed in steel_grades.analogues,
+      resolved to the grade it names when that grade is in the database
+    - grade_classes: equivalence class (connected component over analogue
+      links) of every grade; class_id is the lowest grade id in the class
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS grade_keys (
+            grade_id INTEGER PRIMARY KEY,
+            grade_key TEXT NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_grade_key ON grade_keys(grade_key)
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS steel_analogues (
+            grade_id INTEGER NOT NULL,
+            analogue_name TEXT NOT NULL,
+            analogue_key TEXT NOT NULL,
+            resolved_grade_id INTEGER,
+            PRIMARY KEY (grade_id, analogue_key)
+        )
+    ''')
+
+    # Reverse direction: "who lists X as an analogue"
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_analogue_key ON steel_analogues(analogue_key)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_analogue_resolved ON steel_analogues(resolved_grade_id)
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS grade_classes (
+            grade_id INTEGER PRIMARY KEY,
+            class_id INTEGER NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_grade_class ON grade_classes(class_id)
+    ''')
+
+
+def create_ai_cache_table(cursor):
+    """
+    Create ai_searches cache table if missing (adds newer columns to old tables)
+
+    cache_key is the normalized grade name the entry is looked up by;
+    latency_ms is how long the original AI search took (latency saved per hit).
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_searches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            grade_name TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+
+    cursor.execute("PRAGMA table_info(ai_searches)")
+    columns = [col[1] for col in cursor.fetchall()]
+
+    for column, column_type in (('cache_key', 'TEXT'), ('confidence', 'TEXT'), ('latency_ms', 'INTEGER')):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE ai_searches ADD COLUMN {column} {column_type}")
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ai_grade ON ai_searches(grade_name)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ai_cache_key ON ai_searches(cache_key, created_at)
+    ''')
+
+
+def create_enrichment_tables(cursor):
+    """
+    Create bulk AI enrichment tables if missing (see bulk_enrich.py)
+
+    - enrich_runs: one row per input list
+    - enrich_items: every grade of a run with its processing status; the
+      checkpoint a crashed run resumes from
+    - ai_staging: validated AI results waiting to be promoted to steel_grades
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS enrich_runs (
+            id TEXT PRIMARY KEY,
+            source TEXT,
+            total INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS enrich_items (
+            run_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            grade TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            latency_ms INTEGER,
+            error TEXT,
+            updated_at TEXT,
+            PRIMARY KEY (run_id, position)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_enrich_status ON enrich_items(run_id, status)
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_staging (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            grade TEXT NOT NULL,
+            cache_key TEXT NOT NULL,
+            result TEXT NOT NULL,
+            confidence TEXT,
+            created_at TEXT NOT NULL,
+            promoted_id INTEGER,
+            UNIQUE (run_id, cache_key)
+        )
+    ''')
+
+
+def create_ai_telemetry_table(cursor):
+    """
+    Create ai_telemetry table if missing (see ai_telemetry.py)
+
+    One row per AISearch.search_steel call. Stage columns are milliseconds,
+    NULL when the stage did not run; token columns are as reported by the
+    provider.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_telemetry (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            grade TEXT NOT NULL,
+            cache_key TEXT,
+            outcome TEXT NOT NULL,
+            cache_tier TEXT,
+            error TEXT,
+            total_ms INTEGER,
+            perplexity_wait_ms INTEGER,
+            perplexity_ms INTEGER,
+            pdf_ms INTEGER,
+            extraction_ms INTEGER,
+            perplexity_prompt_tokens INTEGER,
+            perplexity_completion_tokens INTEGER,
+            openai_prompt_tokens INTEGER,
+            openai_completion_tokens INTEGER,
+            pdf_found INTEGER,
+            pdf_parse_cached INTEGER,
+            pdf_pages INTEGER,
+            pdf_method TEXT,
+            pdf_updated INTEGER,
+            confidence TEXT,
+            confidence_score INTEGER,
+            validated INTEGER
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ai_telemetry_created ON ai_telemetry(created_at)
+    ''')
+
+
+def get_write_generation(conn):
+    """
+    Get current write generation of the catalogue
+
+    The generation is bumped by every committed modification of steel_grades,
+    so readers can detect changes with a single primary key lookup.
+
+    Returns:
+        Generation number (0 if never written or db_meta is missing)
+    """
+    try:
+        row = conn.execute(
+            "SELECT value FROM db_meta WHERE key = 'write_generation'"
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return row[0] if row else 0
+
+
+def bump_write_generation(conn):
+    """
+    Increment write generation inside the caller's transaction
+
+    Must be called before conn.commit() of the modification it describes.
+
+    Returns:
+        New generation number
+    """
+    cursor = conn.cursor()
+    create_meta_table(cursor)
+    cursor.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('write_generation', 0)")
+    cursor.execute("UPDATE db_meta SET value = value + 1 WHERE key = 'write_generation'")
+    return get_write_generation(conn)
+
+
 def migrate_database():
     """Migrate existing database to add new columns"""
     conn = sqlite3.connect(config.DB_FILE, timeout=30.0)
@@ -93,6 +331,26 @@ def migrate_database():
             conn.commit()
             print("✓ Added 'manufacturer' column")
 
+        # Add db_meta table (write generation) if missing
+        create_meta_table(cursor)
+        conn.commit()
+
+        # Add analogue graph tables if missing (filled on app start)
+        create_analogue_tables(cursor)
+        conn.commit()
+
+        # Add/upgrade AI search cache table
+        create_ai_cache_table(cursor)
+        conn.commit()
+
+        # Add bulk enrichment tables if missing
+        create_enrichment_tables(cursor)
+        conn.commit()
+
+        # Add AI telemetry table if missing
+        create_ai_telemetry_table(cursor)
+        conn.commit()
+
     except Exception as e:
         print(f"Migration error: {e}")
         conn.rollback()
@@ -13,7 +13,7 @@ import csv
 import os
 import re
 from typing import List, Dict, Optional, Any, Tuple
-from database_schema import get_connection
+from read_snapshot import get_read_connection
 
 
 # ============================================================================
@@ -348,9 +348,10 @@ class CompositionMatcher:
 
     def __init__(self):
         """Инициализация matcher"""
-        self.conn = get_connection()
+        self.conn = get_read_connection()
 
-    def parse_element_value(self, value_str: Any) -> Optional[float]:
+    @staticmethod
+    def parse_element_value(value_str: Any) -> Optional[float]:
         """
         Парсинг значения элемента из БД
         Обрабатывает:
@@ -916,6 +917,66 @@ class CompositionMatcher:
             self.conn.close()
 
 
+def composition_diff_matrix(reference: Dict[str, Any],
+                            candidates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Матрица отклонений химсостава относительно эталонной марки
+
+    Значения парсятся так же, как в Fuzzy Search (CompositionMatcher.parse_element_value),
+    поэтому клиентам не нужно повторно разбирать строки вида '11.5-12.5' или 'до 0.08'.
+
+    Args:
+        reference: Эталонная марка (dict с grade и элементами)
+        candidates: Сравниваемые марки
+
+    Returns:
+        {
+            'elements': ['c', 'cr', ...],
+            'reference': {'grade': 'Х12МФ', 'values': {'c': 1.55, ...}},
+            'grades': [
+                {
+                    'grade': 'D2',
+                    'values': {'c': 1.55, ...},
+                    'abs_delta': {'c': 0.0, ...},   # candidate - reference
+                    'pct_delta': {'c': 0.0, ...}    # % от эталона (None если эталон 0/нет)
+                }
+            ]
+        }
+    """
+    parse = CompositionMatcher.parse_element_value
+    elements = CompositionMatcher.ELEMENTS
+
+    ref_values = {e: parse(reference.get(e)) for e in elements}
+
+    grades = []
+    for candidate in candidates:
+        values = {e: parse(candidate.get(e)) for e in elements}
+        abs_delta = {}
+        pct_delta = {}
+        for element in elements:
+            ref_val = ref_values[element]
+            cand_val = values[element]
+            if ref_val is None or cand_val is None:
+                abs_delta[element] = None
+                pct_delta[element] = None
+                continue
+            abs_delta[element] = round(cand_val - ref_val, 4)
+            pct_delta[element] = (round((cand_val - ref_val) / abs(ref_val) * 100, 1)
+                                  if ref_val != 0 else None)
+        grades.append({
+            'grade': candidate.get('grade'),
+            'values': values,
+            'abs_delta': abs_delta,
+            'pct_delta': pct_delta
+        })
+
+    return {
+        'elements': list(elements),
+        'reference': {'grade': reference.get('grade'), 'values': ref_values},
+        'grades': grades
+    }
+
+
 def get_composition_matcher():
     """Получить экземпляр CompositionMatcher"""
     return CompositionMatcher()
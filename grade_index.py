@@ -0,0 +1,128 @@
+"""
+In-memory grade name index for autocomplete
+
+Sorted array of upper-cased original and normalized grade names; a prefix
+query is two bisections plus a slice, so top-N lookups take microseconds
+instead of shipping all ~10k names to the browser.
+
+The index is rebuilt when the catalogue write generation changes
+(see read_snapshot.GenerationTracked).
+"""
+
+import bisect
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+from read_snapshot import GenerationTracked, register_tracked
+
+
+def normalize_grade_name(name: Optional[str]) -> Optional[str]:
+    """
+    Normalize grade name for matching (remove spaces, hyphens, dots; upper case)
+
+    Example: "ШХ 15" → "ШХ15", "X-30" → "X30", "1.2379" → "12379"
+    """
+    if not name:
+        return name
+    return name.replace(' ', '').replace('-', '').replace('.', '').upper()
+
+
+def split_analogues(analogues: Optional[str]) -> List[str]:
+    """
+    Split free-text analogues field into grade names
+
+    Pipe-separated if it contains '|', otherwise whitespace-separated
+    (same rule as fuzzy_search and the Telegram bot).
+    """
+    if not analogues:
+        return []
+    text = str(analogues)
+    parts = text.split('|') if '|' in text else text.split()
+    return [p.strip() for p in parts if p and p.strip()]
+
+
+class GradeIndex(GenerationTracked):
+    """Sorted prefix index over original and normalized grade names"""
+
+    # Sorts after any real character, closes the prefix range
+    _PREFIX_END = '\U0010ffff'
+
+    def __init__(self):
+        super().__init__()
+        # Parallel arrays, replaced atomically on rebuild
+        self._data: Tuple[List[str], List[str]] = ([], [])
+
+    def _build(self, conn: sqlite3.Connection, generation: int) -> None:
+        grades = [row[0] for row in conn.execute(
+            "SELECT DISTINCT grade FROM steel_grades WHERE grade IS NOT NULL"
+        )]
+
+        entries = set()
+        for grade in grades:
+            entries.add((grade.upper(), grade))
+            normalized = normalize_grade_name(grade)
+            if normalized:
+                entries.add((normalized, grade))
+
+        entries = sorted(entries)
+        self._data = ([key for key, _ in entries], [grade for _, grade in entries])
+
+    def _prefix_range(self, keys: List[str], prefix: str) -> Tuple[int, int]:
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + self._PREFIX_END, lo)
+        return lo, hi
+
+    def autocomplete(self, query: str, limit: int = 10) -> List[str]:
+        """
+        Grade names starting with query (case-insensitive, also matches normalized form)
+
+        Args:
+            query: Typed prefix, e.g. "х12" or "1.23"
+            limit: Maximum number of grades to return
+
+        Returns:
+            List of original grade names (exact-case prefix matches first)
+        """
+        query = (query or '').strip()
+        if not query or limit <= 0:
+            return []
+
+        self.refresh()
+        keys, grades = self._data
+
+        results = []
+        seen = set()
+        for prefix in (query.upper(), normalize_grade_name(query)):
+            if not prefix:
+                continue
+            lo, hi = self._prefix_range(keys, prefix)
+            for i in range(lo, hi):
+                grade = grades[i]
+                if grade not in seen:
+                    seen.add(grade)
+                    results.append(grade)
+                    if len(results) >= limit:
+                        return results
+
+        return results
+
+    def __len__(self) -> int:
+        return len(self._data[0])
+
+
+# Singleton instance
+_grade_index = None
+_grade_index_lock = threading.Lock()
+
+
+def get_grade_index() -> GradeIndex:
+    """Get or create GradeIndex singleton instance"""
+    global _grade_index
+
+    if _grade_index is None:
+        with _grade_index_lock:
+            if _grade_index is None:
+                _grade_index = register_tracked(GradeIndex())
+
+    return _grade_index
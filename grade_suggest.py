@@ -0,0 +1,268 @@
+"""
+"Did you mean" suggestions for misspelled grade names
+
+Local typo-tolerant lookup over all grade names and their analogues, used
+before falling back to the slow (20-30 s) and paid AI search:
+
+- Keys are normalized grade names with Cyrillic/Latin look-alike letters
+  folded together ("X12MФ" typed with Latin X/M matches "Х12МФ")
+- A trigram index finds candidates sharing most of the query's trigrams
+- A BK-tree finds all names within a small Levenshtein distance
+- Candidates are ranked by edit distance, then trigram similarity
+
+Rebuilt when the catalogue write generation changes
+(see read_snapshot.GenerationTracked).
+"""
+
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple, Any
+
+from grade_index import normalize_grade_name, split_analogues
+from read_snapshot import GenerationTracked, register_tracked
+
+
+# Cyrillic letters that look like Latin ones (typical keyboard layout mix-up)
+_HOMOGLYPHS = str.maketrans('АВЕКМНОРСТУХ', 'ABEKMHOPCTYX')
+
+
+def suggestion_key(name: Optional[str]) -> str:
+    """Normalized grade name with Cyrillic/Latin look-alikes folded"""
+    normalized = normalize_grade_name(name) or ''
+    return normalized.translate(_HOMOGLYPHS)
+
+
+def _pattern_masks(pattern: str) -> Dict[str, int]:
+    """Bit mask of positions for every character of pattern (Myers' algorithm)"""
+    masks: Dict[str, int] = {}
+    for i, char in enumerate(pattern):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+
+def _myers_distance(masks: Dict[str, int], length: int, text: str) -> int:
+    """
+    Levenshtein distance between a pattern (given by its masks) and text
+
+    Bit-parallel algorithm (Myers 1999, Hyyrö 2003): one pass over text with a
+    handful of integer operations per character, so the pattern masks can be
+    reused for many comparisons against the same query.
+    """
+    if length == 0:
+        return len(text)
+
+    full = (1 << length) - 1
+    high = 1 << (length - 1)
+    pv, mv, score = full, 0, length
+
+    for char in text:
+        eq = masks.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+
+    return score
+
+
+def levenshtein(a: str, b: str) -> int:
+    """Levenshtein edit distance between a and b"""
+    if a == b:
+        return 0
+    return _myers_distance(_pattern_masks(a), len(a), b)
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class BKTree:
+    """Burkhard-Keller tree for edit-distance neighbourhood queries"""
+
+    def __init__(self):
+        self._root: Optional[Tuple[str, Dict[int, Any]]] = None
+
+    def add(self, term: str) -> None:
+        if self._root is None:
+            self._root = (term, {})
+            return
+
+        masks = _pattern_masks(term)
+        node = self._root
+        while True:
+            node_term, children = node
+            distance = _myers_distance(masks, len(term), node_term)
+            if distance == 0:
+                return
+            child = children.get(distance)
+            if child is None:
+                children[distance] = (term, {})
+                return
+            node = child
+
+    def search(self, term: str, max_distance: int) -> List[Tuple[int, str]]:
+        """All terms within max_distance of term as (distance, term)"""
+        if self._root is None:
+            return []
+
+        masks = _pattern_masks(term)
+        length = len(term)
+        found = []
+        stack = [self._root]
+        while stack:
+            node_term, children = stack.pop()
+            distance = _myers_distance(masks, length, node_term)
+            if distance <= max_distance:
+                found.append((distance, node_term))
+            # Triangle inequality: only children in [d - max, d + max] can match
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+
+class GradeSuggester(GenerationTracked):
+    """Typo-tolerant suggestions over grade names and analogues"""
+
+    # Minimum Dice coefficient of trigram sets for trigram-only candidates
+    MIN_TRIGRAM_SIMILARITY = 0.6
+
+    # Trigram candidates to verify with edit distance
+    MAX_TRIGRAM_CANDIDATES = 50
+
+    def __init__(self):
+        super().__init__()
+        self._data = ({}, {}, BKTree())
+
+    def _build(self, conn: sqlite3.Connection, generation: int) -> None:
+        # key -> {'grades': set of DB grade names, 'names': spellings, 'analogue_of': grades}
+        entries: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {'grades': set(), 'names': set(), 'analogue_of': set()}
+        )
+
+        for grade, analogues in conn.execute("SELECT grade, analogues FROM steel_grades"):
+            if not grade:
+                continue
+            key = suggestion_key(grade)
+            if key:
+                entries[key]['grades'].add(grade)
+                entries[key]['names'].add(grade)
+            for analogue in split_analogues(analogues):
+                analogue_key = suggestion_key(analogue)
+                if analogue_key:
+                    entries[analogue_key]['names'].add(analogue)
+                    entries[analogue_key]['analogue_of'].add(grade)
+
+        trigrams: Dict[str, List[str]] = defaultdict(list)
+        bk_tree = BKTree()
+        for key, entry in entries.items():
+            key_trigrams = _trigrams(key)
+            entry['trigram_count'] = len(key_trigrams)
+            for trigram in key_trigrams:
+                trigrams[trigram].append(key)
+            bk_tree.add(key)
+
+        self._data = (dict(entries), dict(trigrams), bk_tree)
+
+    def suggest(self, query: str, limit: int = 5,
+                max_distance: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Ranked near-miss grade names for query
+
+        Args:
+            query: Grade name as typed by the user
+            limit: Maximum number of suggestions
+            max_distance: Maximum edit distance (default: 1 for short queries, else 2)
+
+        Returns:
+            [
+                {
+                    'grade': 'Х12МФ',          # grade in DB (or analogue name)
+                    'distance': 1,             # edit distance of normalized names
+                    'similarity': 0.83,        # trigram Dice coefficient
+                    'in_database': True,       # False: known only as an analogue
+                    'analogue_of': []          # grades listing this name as analogue
+                }
+            ]
+        """
+        key = suggestion_key(query)
+        if not key or limit <= 0:
+            return []
+
+        if max_distance is None:
+            max_distance = 1 if len(key) <= 4 else 2
+
+        self.refresh()
+        entries, trigrams, bk_tree = self._data
+
+        # Edit-distance neighbourhood (includes distance 0 = same normalized name)
+        candidates: Dict[str, int] = {
+            term: distance for distance, term in bk_tree.search(key, max_distance)
+        }
+
+        # Trigram recall: catches longer names with extra parts (e.g. missing suffix)
+        query_trigrams = _trigrams(key)
+        shared: Dict[str, int] = defaultdict(int)
+        for trigram in query_trigrams:
+            for term in trigrams.get(trigram, ()):
+                shared[term] += 1
+
+        similarity = {}
+        for term, count in shared.items():
+            similarity[term] = 2 * count / (len(query_trigrams) + entries[term]['trigram_count'])
+
+        best_by_trigram = sorted(
+            (term for term in shared if term not in candidates),
+            key=lambda t: -similarity[t]
+        )[:self.MAX_TRIGRAM_CANDIDATES]
+        for term in best_by_trigram:
+            if similarity[term] >= self.MIN_TRIGRAM_SIMILARITY:
+                candidates[term] = levenshtein(key, term)
+
+        ranked = sorted(
+            candidates.items(),
+            key=lambda item: (item[1], -similarity.get(item[0], 0.0),
+                              not entries[item[0]]['grades'], item[0])
+        )
+
+        suggestions = []
+        for term, distance in ranked[:limit]:
+            entry = entries[term]
+            in_database = bool(entry['grades'])
+            name = sorted(entry['grades'] or entry['names'])[0]
+            suggestions.append({
+                'grade': name,
+                'distance': distance,
+                'similarity': round(similarity.get(term, 0.0), 2),
+                'in_database': in_database,
+                'analogue_of': sorted(entry['analogue_of'])[:3] if not in_database else []
+            })
+
+        return suggestions
+
+
+# Singleton instance
+_grade_suggester = None
+_grade_suggester_lock = threading.Lock()
+
+
+def get_grade_suggester() -> GradeSuggester:
+    """Get or create GradeSuggester singleton instance"""
+    global _grade_suggester
+
+    if _grade_suggester is None:
+        with _grade_suggester_lock:
+            if _grade_suggester is None:
+                _grade_suggester = register_tracked(GradeSuggester())
+
+    return _grade_suggester
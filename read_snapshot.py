@@ -0,0 +1,273 @@
+"""
+In-memory read snapshot of the steel catalogue
+
+The catalogue is read thousands of times for every write, so in snapshot mode
+read endpoints are served from an in-memory copy of the database instead of
+the on-disk WAL file.
+
+- Only the catalogue tables (SNAPSHOT_TABLES: steel_grades, the analogue
+  graph and db_meta) are copied, in one read transaction, into a
+  shared-cache memory database, so every request still gets its own
+  connection; AI caches, telemetry and enrich runs stay on disk
+- The snapshot is tagged with the write generation it was built from and is
+  rebuilt (and atomically swapped) when the generation changes
+- Old snapshots stay alive until the last reader connection is closed
+
+Other in-memory structures derived from the catalogue (autocomplete index,
+suggestions, ...) subclass GenerationTracked and are refreshed the same way.
+
+Usage:
+    from read_snapshot import get_read_connection, notify_write_committed
+
+    conn = get_read_connection()     # snapshot or disk connection
+    ...
+    notify_write_committed()         # after a committed write
+"""
+
+import sqlite3
+import threading
+import time
+import itertools
+from typing import Optional, List
+
+import config
+from database_schema import get_connection, get_write_generation
+
+# Tables copied into the snapshot (everything read through get_read_connection)
+SNAPSHOT_TABLES = ('steel_grades', 'grade_keys', 'steel_analogues', 'grade_classes', 'db_meta')
+
+
+class GenerationTracked:
+    """
+    Base class for in-memory data rebuilt when the write generation changes
+
+    Subclasses implement _build(conn, generation). The generation is polled at
+    most every check_interval seconds; invalidate() forces a check on next use.
+    """
+
+    def __init__(self, check_interval: float = config.GENERATION_CHECK_INTERVAL):
+        """
+        Args:
+            check_interval: How often (seconds) to poll the write generation
+        """
+        self.check_interval = check_interval
+
+        self._generation: Optional[int] = None
+        self._built = False
+        self._checked_at = 0.0
+        self._build_lock = threading.Lock()
+
+        self.rebuild_count = 0
+        self.last_build_seconds = 0.0
+
+    @property
+    def generation(self) -> Optional[int]:
+        """Write generation the current data was built from"""
+        return self._generation
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connection used to read generation and source data"""
+        return get_read_connection()
+
+    def _build(self, conn: sqlite3.Connection, generation: int) -> None:
+        """Rebuild in-memory data from conn"""
+        raise NotImplementedError
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Rebuild if the write generation changed
+
+        Args:
+            force: Check the generation now instead of waiting for check_interval
+
+        Returns:
+            True if data was rebuilt
+        """
+        now = time.monotonic()
+        if not force and self._built and now - self._checked_at < self.check_interval:
+            return False
+
+        # Only one builder at a time; other readers keep using current data
+        if not self._build_lock.acquire(blocking=force or not self._built):
+            return False
+
+        try:
+            conn = self._connect()
+            try:
+                # Read generation BEFORE building: a write racing with the build
+                # leaves data tagged with an older generation and it is simply
+                # rebuilt on the next check
+                generation = get_write_generation(conn)
+                self._checked_at = time.monotonic()
+
+                if self._built and generation == self._generation:
+                    return False
+
+                started = time.perf_counter()
+                self._build(conn, generation)
+            finally:
+                conn.close()
+
+            self._generation = generation
+            self._built = True
+            self.rebuild_count += 1
+            self.last_build_seconds = time.perf_counter() - started
+            return True
+
+        finally:
+            self._build_lock.release()
+
+    def invalidate(self) -> None:
+        """Force a generation check on next use"""
+        self._checked_at = 0.0
+
+
+class ReadSnapshot(GenerationTracked):
+    """Immutable in-memory copy of the database, swapped on write generation change"""
+
+    _names = itertools.count(1)
+
+    def __init__(self, check_interval: float = config.GENERATION_CHECK_INTERVAL):
+        super().__init__(check_interval)
+
+        self._uri: Optional[str] = None
+        self._anchor: Optional[sqlite3.Connection] = None  # Keeps memory DB alive
+        self._swap_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Snapshot is always built from the on-disk database
+        return get_connection()
+
+    def _build(self, disk: sqlite3.Connection, generation: int) -> None:
+        started = time.perf_counter()
+        uri = f"file:steel_snapshot_{next(self._names)}?mode=memory&cache=shared"
+        anchor = sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+        placeholders = ', '.join('?' * len(SNAPSHOT_TABLES))
+        try:
+            # One read transaction: all tables come from the same commit
+            disk.execute("BEGIN")
+            schema = disk.execute(
+                f"SELECT type, name, sql FROM sqlite_master "
+                f"WHERE tbl_name IN ({placeholders}) AND sql IS NOT NULL "
+                f"ORDER BY type = 'index'",
+                SNAPSHOT_TABLES
+            ).fetchall()
+
+            for kind, name, sql in schema:
+                if kind != 'table':
+                    continue
+                anchor.execute(sql)
+                rows = disk.execute(f'SELECT * FROM "{name}"')
+                columns = len(rows.description)
+                anchor.executemany(
+                    f'INSERT INTO "{name}" VALUES ({", ".join("?" * columns)})', rows
+                )
+            # Indexes after the rows: one sort instead of per-row index updates
+            for kind, name, sql in schema:
+                if kind == 'index':
+                    anchor.execute(sql)
+            anchor.commit()
+        except Exception:
+            anchor.close()
+            raise
+        finally:
+            disk.rollback()
+
+        # Atomic swap
+        with self._swap_lock:
+            old_anchor = self._anchor
+            self._uri = uri
+            self._anchor = anchor
+
+        if old_anchor is not None:
+            old_anchor.close()
+
+        print(f"[Snapshot] Built read snapshot for generation {generation} "
+              f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Open a read-only connection to the current snapshot
+
+        Returns:
+            New sqlite3 connection (caller closes it)
+        """
+        self.refresh()
+
+        with self._swap_lock:
+            uri = self._uri
+            conn = sqlite3.connect(uri, uri=True)
+
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def close(self) -> None:
+        """Drop the current snapshot"""
+        with self._swap_lock:
+            if self._anchor is not None:
+                self._anchor.close()
+            self._anchor = None
+            self._uri = None
+            self._generation = None
+            self._built = False
+
+
+# Singleton instance
+_read_snapshot = None
+_read_snapshot_lock = threading.Lock()
+
+# In-memory indexes to invalidate after local writes
+_tracked: List[GenerationTracked] = []
+
+
+def get_read_snapshot() -> ReadSnapshot:
+    """Get or create ReadSnapshot singleton instance"""
+    global _read_snapshot
+
+    if _read_snapshot is None:
+        with _read_snapshot_lock:
+            if _read_snapshot is None:
+                _read_snapshot = ReadSnapshot()
+
+    return _read_snapshot
+
+
+def get_read_connection() -> sqlite3.Connection:
+    """
+    Get connection for read-only queries
+
+    Returns snapshot connection if READ_SNAPSHOT_ENABLED, otherwise a regular
+    on-disk connection (see database_schema.get_connection)
+    """
+    if not config.READ_SNAPSHOT_ENABLED:
+        return get_connection()
+
+    try:
+        return get_read_snapshot().connect()
+    except Exception as e:
+        print(f"[Snapshot] Falling back to disk connection: {e}")
+        return get_connection()
+
+
+def register_tracked(tracked: GenerationTracked) -> GenerationTracked:
+    """Register in-memory index to be invalidated by notify_write_committed()"""
+    _tracked.append(tracked)
+    return tracked
+
+
+def notify_write_committed() -> None:
+    """
+    Call after a committed write to steel_grades
+
+    Rebuilds the snapshot right away (read-your-writes) and makes registered
+    in-memory indexes re-check the generation on next use.
+    """
+    if config.READ_SNAPSHOT_ENABLED:
+        try:
+            get_read_snapshot().refresh(force=True)
+        except Exception as e:
+            print(f"[Snapshot] Refresh after write failed: {e}")
+
+    for tracked in _tracked:
+        tracked.invalidate()
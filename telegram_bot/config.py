@@ -13,8 +13,16 @@ API_BASE_URL = os.getenv('PARSERSTEEL_API_URL', 'http://localhost:5001')
 # API Endpoints
 SEARCH_ENDPOINT = f"{API_BASE_URL}/api/steels"
 AI_SEARCH_ENDPOINT = f"{API_BASE_URL}/api/steels/ai-search"
+AI_JOBS_ENDPOINT = f"{API_BASE_URL}/api/steels/ai-search/jobs"
 STATS_ENDPOINT = f"{API_BASE_URL}/api/stats"
+ADD_ENDPOINT = f"{API_BASE_URL}/api/steels/add"
 
 # Bot settings
 MAX_RESULTS_PER_MESSAGE = 5
 CACHE_TTL = 3600  # 1 hour
+
+# AI search jobs: poll interval and max wait (seconds). The wait is extended
+# while a running job reports time left of its deadline (AI_JOB_DEADLINE of
+# the API, 180 s by default); AI_JOB_TIMEOUT covers the time in the queue.
+AI_JOB_POLL_INTERVAL = 2
+AI_JOB_TIMEOUT = int(os.getenv('AI_JOB_TIMEOUT', '200'))
@@ -22,9 +22,24 @@ class ContextAnalyzer:
         self.model = 'gpt-4o-mini'  # GPT-4 mini for fast, cheap inference
         self.enabled = bool(self.api_key)
 
+        # Created on first use and reused (keeps HTTPS connections alive)
+        self._client: Optional[OpenAI] = None
+
         if not self.enabled:
             print("WARNING: Context analyzer disabled - OPENAI_API_KEY not found")
 
+    @property
+    def client(self) -> OpenAI:
+        """Shared OpenAI client with a keep-alive connection pool"""
+        if self._client is None:
+            self._client = OpenAI(
+                api_key=self.api_key,
+                base_url=os.getenv('OPENAI_BASE_URL') or None,
+                timeout=float(os.getenv('CONTEXT_ANALYZER_TIMEOUT', '15')),
+                max_retries=1
+            )
+        return self._client
+
     def analyze_message(self, message_text: str) -> Dict[str, Any]:
         """
         Analyze user message to determine intent and extract parameters
@@ -43,7 +58,7 @@ class ContextAnalyzer:
             return self._simple_analysis(message_text)
 
         try:
-            client = OpenAI(api_key=self.api_key)
+            client = self.client
 
             prompt = f"""Analyze this user message and determine their intent.
 
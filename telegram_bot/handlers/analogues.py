@@ -1,4 +1,6 @@
 """Analogues search handler"""
+from urllib.parse import quote
+
 import requests
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -24,36 +26,32 @@ async def analogues_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='Markdown'
         )
 
-        # First, find the grade (exact match only)
+        # Grade with analogues resolved on the server (single request)
         response = requests.get(
-            config.SEARCH_ENDPOINT,
-            params={'grade': grade_name, 'exact': 'true'},
+            f"{config.API_BASE_URL}/api/steels/{quote(grade_name, safe='')}/analogues",
             timeout=30
         )
 
-        if response.status_code != 200:
-            await status_msg.edit_text(
-                f"❌ Ошибка поиска: {response.status_code}"
-            )
-            return
-
-        results = response.json()
-
         # Delete "searching" message
         await status_msg.delete()
 
-        if not results:
+        if response.status_code == 404:
             await update.message.reply_text(
                 f"❌ Марка `{grade_name}` не найдена в базе данных.",
                 parse_mode='Markdown'
             )
             return
 
-        # Get the first result
-        steel = results[0]
+        if response.status_code != 200:
+            await update.message.reply_text(
+                f"❌ Ошибка поиска: {response.status_code}"
+            )
+            return
+
+        result = response.json()
 
         # Format analogues message
-        message = format_analogues(steel)
+        message = format_analogues(result['reference'], result.get('analogues', []))
         await update.message.reply_text(message, parse_mode='Markdown')
 
     except requests.exceptions.Timeout:
@@ -66,60 +64,39 @@ async def analogues_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
-def format_analogues(steel: dict) -> str:
-    """Format analogues information"""
+def format_analogues(steel: dict, analogues: list) -> str:
+    """
+    Format analogues information
+
+    Args:
+        steel: Reference grade record
+        analogues: [{'name': 'D2', 'data': {...record...} or None}, ...]
+    """
     grade = steel.get('grade', 'N/A')
-    analogues = steel.get('analogues', '')
 
     lines = [
         f"🔗 **Аналоги для: {grade}**",
         ""
     ]
 
-    if analogues and analogues not in [None, '', 'N/A']:
+    if analogues:
         lines.append("**Мировые аналоги:**")
-        # Split by space or comma
-        analogue_list = analogues.replace(',', ' ').split()
-
-        # Get detailed info for each analogue
-        for analogue in analogue_list:
-            if analogue:
-                # Try to get additional info from database
-                try:
-                    response = requests.get(
-                        config.SEARCH_ENDPOINT,
-                        params={'grade': analogue, 'exact': 'true'},
-                        timeout=5
-                    )
-
-                    if response.status_code == 200:
-                        results = response.json()
-                        if results and len(results) > 0:
-                            analogue_data = results[0]
-
-                            # Build info string: Grade, Standard, Manufacturer, Country
-                            info_parts = [analogue]
-
-                            standard = analogue_data.get('standard')
-                            if standard and standard not in [None, '', 'N/A']:
-                                info_parts.append(standard)
-
-                            manufacturer = analogue_data.get('manufacturer')
-                            if manufacturer and manufacturer not in [None, '', 'N/A']:
-                                info_parts.append(manufacturer)
-
-                            # Note: country is typically part of standard (e.g., GOST = Russia, AISI = USA)
-                            # If there's a separate country field, add it here
-
-                            lines.append(f"  • {', '.join(info_parts)}")
-                        else:
-                            # Analogue not found in DB, show just name
-                            lines.append(f"  • {analogue}")
-                    else:
-                        lines.append(f"  • {analogue}")
-                except:
-                    # If request fails, show just the name
-                    lines.append(f"  • {analogue}")
+
+        for analogue in analogues:
+            # Build info string: Grade, Standard, Manufacturer
+            info_parts = [analogue['name']]
+            analogue_data = analogue.get('data')
+
+            if analogue_data:
+                standard = analogue_data.get('standard')
+                if standard and standard not in [None, '', 'N/A']:
+                    info_parts.append(standard)
+
+                manufacturer = analogue_data.get('manufacturer')
+                if manufacturer and manufacturer not in [None, '', 'N/A']:
+                    info_parts.append(manufacturer)
+
+            lines.append(f"  • {', '.join(info_parts)}")
     else:
         lines.append("_Аналоги не найдены в базе данных._")
         lines.append("\nПопробуйте использовать `/search` для поиска похожих марок по химическому составу.")
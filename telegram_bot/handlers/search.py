@@ -1,4 +1,6 @@
 """Search handler with AI context understanding"""
+import asyncio
+import time
 import requests
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler
@@ -228,6 +230,14 @@ async def perform_search(update: Update, grade_name: str, context: ContextTypes.
             timeout=60
         )
 
+        if response.status_code == 429:
+            # AI provider limits reached - server refused instead of queueing
+            retry_after = response.headers.get('Retry-After', '30')
+            await status_msg.edit_text(
+                f"⏳ AI поиск сейчас перегружен. Повторите через {retry_after} сек."
+            )
+            return
+
         if response.status_code != 200:
             await status_msg.edit_text(
                 f"❌ Ошибка поиска: {response.status_code}"
@@ -236,6 +246,9 @@ async def perform_search(update: Update, grade_name: str, context: ContextTypes.
 
         results = response.json()
 
+        # "Did you mean" suggestions from local index (instant, no AI tokens used)
+        suggestions = parse_suggestions_header(response.headers.get('X-Did-You-Mean'))
+
         # Delete "searching" message
         await status_msg.delete()
 
@@ -246,6 +259,27 @@ async def perform_search(update: Update, grade_name: str, context: ContextTypes.
                 attempt_count += 1
                 context.user_data['search_attempts'][normalized_grade] = attempt_count
 
+            if suggestions and not force_ai:
+                # Likely a typo - offer similar grades before slow AI search
+                keyboard = [
+                    [InlineKeyboardButton(f"🔍 {suggestion}", callback_data=f'search:{suggestion}')]
+                    for suggestion in suggestions
+                ]
+                keyboard.append([
+                    InlineKeyboardButton("🤖 AI Search (Perplexity)", callback_data=f'confirm_ai:{grade_name}')
+                ])
+                reply_markup = InlineKeyboardMarkup(keyboard)
+
+                await update.message.reply_text(
+                    f"❌ **Марка `{grade_name}` не найдена в базе данных**\n\n"
+                    "🤔 **Возможно, вы имели в виду:**\n"
+                    + '\n'.join(f"• `{suggestion}`" for suggestion in suggestions) +
+                    "\n\nВыберите марку или запустите AI поиск (20-30 сек):",
+                    parse_mode='Markdown',
+                    reply_markup=reply_markup
+                )
+                return
+
             if attempt_count == 1:
                 # First attempt - offer choice: correct spelling OR AI search
                 keyboard = [
@@ -316,8 +350,28 @@ async def perform_search(update: Update, grade_name: str, context: ContextTypes.
         )
 
 
-async def perform_ai_search(update: Update, grade_name: str, context: ContextTypes.DEFAULT_TYPE = None):
-    """Perform AI search with Perplexity"""
+def parse_suggestions_header(header_value: str, limit: int = 3) -> list:
+    """Parse X-Did-You-Mean header (JSON list of grade names)"""
+    if not header_value:
+        return []
+    try:
+        suggestions = json.loads(header_value)
+    except ValueError:
+        return []
+
+    # Telegram limits callback_data to 64 bytes
+    return [
+        s for s in suggestions
+        if isinstance(s, str) and len(f'search:{s}'.encode('utf-8')) <= 64
+    ][:limit]
+
+
+async def perform_ai_search(update: Update, grade_name: str, context: ContextTypes.DEFAULT_TYPE = None, force: bool = False):
+    """
+    Perform AI search with Perplexity
+
+    force=True makes the API skip cached results and recent "not found" answers
+    """
     try:
         status_msg = await update.message.reply_text(
             f"🤖 Ищу марку `{grade_name}` через Perplexity AI...\n\n"
@@ -325,28 +379,58 @@ async def perform_ai_search(update: Update, grade_name: str, context: ContextTyp
             parse_mode='Markdown'
         )
 
-        # Make API request with AI enabled
-        response = requests.get(
-            config.SEARCH_ENDPOINT,
-            params={
-                'grade': grade_name,
-                'ai': 'true'
-            },
-            timeout=60
+        # Start background AI search job (returns immediately, no worker held for 20-60 s)
+        response = requests.post(
+            config.AI_JOBS_ENDPOINT,
+            json={'grade': grade_name, 'force': force},
+            timeout=10
         )
 
-        if response.status_code != 200:
+        if response.status_code == 503:
+            await status_msg.edit_text(
+                "⏳ Сейчас выполняется слишком много AI поисков.\n"
+                "Попробуйте через минуту."
+            )
+            return
+
+        if response.status_code != 202:
             await status_msg.edit_text(
                 f"❌ Ошибка AI поиска: {response.status_code}"
             )
             return
 
-        results = response.json()
+        job = await wait_for_ai_job(response.json()['job_id'], status_msg, grade_name)
+
+        if job is None:
+            await status_msg.edit_text(
+                "⏱️ Превышено время ожидания AI поиска.\n"
+                "Попробуйте позже."
+            )
+            return
+
+        if job['status'] == 'failed':
+            await status_msg.edit_text(
+                f"❌ Ошибка AI поиска: {job.get('error')}"
+            )
+            return
+
+        # Format AI result like /api/steels?ai=true does
+        results = []
+        if job.get('result'):
+            result = job['result']
+            result['id'] = 'AI'
+            result.setdefault('link', None)
+            results = [result]
 
         # Delete status message
         await status_msg.delete()
 
         if not results:
+            # Repeated misses come from the API's short "not found" cache;
+            # this button forces a fresh AI search
+            keyboard = [[
+                InlineKeyboardButton("🔄 Повторить AI поиск", callback_data=f'force_ai:{grade_name}')
+            ]]
             await update.message.reply_text(
                 f"❌ **Марка `{grade_name}` не найдена даже через AI Search**\n\n"
                 f"Поиск выполнен:\n"
@@ -358,7 +442,8 @@ async def perform_ai_search(update: Update, grade_name: str, context: ContextTyp
                 f"• Проверить написание марки\n"
                 f"• Использовать альтернативное обозначение\n"
                 f"• Уточнить производителя или стандарт",
-                parse_mode='Markdown'
+                parse_mode='Markdown',
+                reply_markup=InlineKeyboardMarkup(keyboard)
             )
             return
 
@@ -368,10 +453,16 @@ async def perform_ai_search(update: Update, grade_name: str, context: ContextTyp
             if normalized_grade in context.user_data.get('search_attempts', {}):
                 del context.user_data['search_attempts'][normalized_grade]
 
-        # Format and send results
+        # Format and send results; "Add" inserts the stored result by its token
+        # (no second AI search, same data as shown)
         for i, result in enumerate(results[:config.MAX_RESULTS_PER_MESSAGE], 1):
             message = format_steel_result(result, i, len(results))
-            await update.message.reply_text(message, parse_mode='Markdown')
+            reply_markup = None
+            if result.get('result_token'):
+                reply_markup = InlineKeyboardMarkup([[
+                    InlineKeyboardButton("➕ Добавить в базу", callback_data=f"add:{result['result_token']}")
+                ]])
+            await update.message.reply_text(message, parse_mode='Markdown', reply_markup=reply_markup)
 
         # If more results exist
         if len(results) > config.MAX_RESULTS_PER_MESSAGE:
@@ -390,6 +481,59 @@ async def perform_ai_search(update: Update, grade_name: str, context: ContextTyp
         )
 
 
+# Stage names reported by the AI job API
+AI_STAGE_LABELS = {
+    'queued': '⏳ В очереди',
+    'started': '🚀 Поиск запущен',
+    'cache': '🗂 Проверка кэша',
+    'waiting': '👥 Ожидание такого же поиска',
+    'perplexity': '🌐 Поиск через Perplexity AI',
+    'pdf': '📄 Анализ PDF datasheet',
+    'scoring': '🧪 Проверка химического состава',
+}
+
+
+async def wait_for_ai_job(job_id: str, status_msg, grade_name: str):
+    """
+    Poll AI search job until it finishes, showing the current stage
+
+    Returns:
+        Job dict (status 'done'/'failed') or None on timeout
+    """
+    deadline = time.monotonic() + config.AI_JOB_TIMEOUT
+    shown_stage = None
+
+    while time.monotonic() < deadline:
+        await asyncio.sleep(config.AI_JOB_POLL_INTERVAL)
+
+        response = requests.get(f"{config.AI_JOBS_ENDPOINT}/{job_id}", timeout=10)
+        if response.status_code != 200:
+            continue
+
+        job = response.json()
+        if job['status'] in ('done', 'failed'):
+            return job
+
+        # Never give up on a job the API is still allowed to finish
+        if job.get('deadline_remaining') is not None:
+            deadline = max(deadline, time.monotonic() + job['deadline_remaining']
+                           + 2 * config.AI_JOB_POLL_INTERVAL)
+
+        stage = job.get('stage')
+        if stage != shown_stage and stage in AI_STAGE_LABELS:
+            shown_stage = stage
+            try:
+                await status_msg.edit_text(
+                    f"🤖 Ищу марку `{grade_name}` через Perplexity AI...\n\n"
+                    f"{AI_STAGE_LABELS[stage]} ({job.get('elapsed', 0):.0f} сек)",
+                    parse_mode='Markdown'
+                )
+            except Exception:
+                pass  # Message unchanged or deleted - progress is cosmetic
+
+    return None
+
+
 def format_steel_result(result: dict, index: int = 1, total: int = 1) -> str:
     """Format steel grade result for display"""
     # Header
@@ -501,6 +645,21 @@ def format_steel_result(result: dict, index: int = 1, total: int = 1) -> str:
     return '\n'.join(lines)
 
 
+def make_callback_update(query):
+    """Create a fake update object so message handlers can reply to a callback query"""
+    class FakeMessage:
+        def __init__(self, chat_id):
+            self.chat_id = chat_id
+            self.message_id = None
+
+        async def reply_text(self, text, parse_mode=None, reply_markup=None):
+            return await query.message.reply_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
+
+    return type('obj', (object,), {
+        'message': FakeMessage(query.message.chat_id)
+    })()
+
+
 async def handle_button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle inline keyboard button callbacks"""
     query = update.callback_query
@@ -522,20 +681,25 @@ async def handle_button_callback(update: Update, context: ContextTypes.DEFAULT_T
             del context.user_data['search_attempts'][normalized_grade]
 
         # Perform AI search
-        # Create a fake update object for perform_ai_search
-        class FakeMessage:
-            def __init__(self, chat_id):
-                self.chat_id = chat_id
-                self.message_id = None
-
-            async def reply_text(self, text, parse_mode=None):
-                return await query.message.reply_text(text, parse_mode=parse_mode)
+        await perform_ai_search(make_callback_update(query), grade_name, context)
+        return
 
-        fake_update = type('obj', (object,), {
-            'message': FakeMessage(query.message.chat_id)
-        })()
+    elif action == 'force_ai':
+        # User wants a fresh AI search despite a recent "not found"
+        await query.edit_message_text(
+            f"🔄 Повторяю AI Search для марки `{grade_name}`...",
+            parse_mode='Markdown'
+        )
+        await perform_ai_search(make_callback_update(query), grade_name, context, force=True)
+        return
 
-        await perform_ai_search(fake_update, grade_name, context)
+    elif action == 'search':
+        # User picked a "did you mean" suggestion
+        await query.edit_message_text(
+            f"🔍 Ищу марку `{grade_name}`...",
+            parse_mode='Markdown'
+        )
+        await perform_search(make_callback_update(query), grade_name, context)
         return
 
     elif action == 'retry_search':
@@ -549,53 +713,33 @@ async def handle_button_callback(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     elif action == 'add':
-        # Get AI result from cache to add to database
+        # Insert the AI result shown in this message (stored on the server under its token)
+        result_token = grade_name
         try:
-            # Request API to get full result
-            response = requests.get(
-                f"{config.SEARCH_ENDPOINT}?grade={grade_name}&ai=true",
+            add_response = requests.post(
+                config.ADD_ENDPOINT,
+                json={'result_token': result_token},
                 timeout=10
             )
 
-            if response.status_code == 200:
-                results = response.json()
-                if results and len(results) > 0:
-                    result = results[0]
-
-                    # Call API to add to database
-                    add_response = requests.post(
-                        f"{config.SEARCH_ENDPOINT.replace('/steels', '/steels/add')}",
-                        json=result,
-                        timeout=10
-                    )
-
-                    if add_response.status_code == 200:
-                        await query.edit_message_text(
-                            f"✅ Марка `{grade_name}` добавлена в базу данных!",
-                            parse_mode='Markdown'
-                        )
-                    else:
-                        error = add_response.json().get('error', 'Unknown error')
-                        await query.edit_message_text(
-                            f"❌ Ошибка добавления: {error}",
-                            parse_mode='Markdown'
-                        )
-                else:
-                    await query.edit_message_text(
-                        f"❌ Данные для `{grade_name}` не найдены",
-                        parse_mode='Markdown'
-                    )
-            else:
-                await query.edit_message_text(
-                    f"❌ Ошибка получения данных: {response.status_code}",
+            if add_response.status_code == 200:
+                await query.edit_message_reply_markup(reply_markup=None)
+                await query.message.reply_text(
+                    f"✅ Марка `{add_response.json().get('grade')}` добавлена в базу данных!",
                     parse_mode='Markdown'
                 )
+            elif add_response.status_code == 410:
+                await query.edit_message_reply_markup(reply_markup=None)
+                await query.message.reply_text(
+                    "⌛ Результат AI поиска устарел.\n"
+                    "Повторите поиск, чтобы добавить марку."
+                )
+            else:
+                error = add_response.json().get('error', 'Unknown error')
+                await query.message.reply_text(f"❌ Ошибка добавления: {error}")
 
         except Exception as e:
-            await query.edit_message_text(
-                f"❌ Ошибка: {str(e)}",
-                parse_mode='Markdown'
-            )
+            await query.message.reply_text(f"❌ Ошибка: {str(e)}")
 
     elif action == 'del':
         # Delete from database
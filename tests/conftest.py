@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the top-level modules of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Fresh database with the current schema (config.DB_FILE points to it)"""
+    from database_schema import create_database, migrate_database
+
+    monkeypatch.setattr(config, 'DB_FILE', str(tmp_path / 'steel_database.db'))
+    create_database()
+    migrate_database()
+    return config.DB_FILE
@@ -0,0 +1,80 @@
+"""
+create_completion against a local HTTP upstream (stalling / failing)
+"""
+
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import pytest
+
+pytest.importorskip('openai')
+
+import ai_clients  # noqa: E402
+from ai_clients import create_completion  # noqa: E402
+from ai_concurrency import CallGuard  # noqa: E402
+from ai_deadline import Deadline  # noqa: E402
+
+MESSAGES = [{'role': 'user', 'content': 'HARDOX 500'}]
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Chat completions upstream; behaviour set per test ('stall' or 'error')"""
+    state = {'mode': 'stall', 'hits': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            state['hits'] += 1
+            if state['mode'] == 'stall':
+                time.sleep(10)
+                return
+            self.send_response(500)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+        def log_message(self, *args):
+            pass
+
+    server = _Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(ai_clients._BASE_URLS, 'openai', f'http://127.0.0.1:{server.server_port}')
+    monkeypatch.setenv('AI_HTTP_MAX_RETRIES', '2')
+
+    yield state
+
+    server.shutdown()
+    ai_clients.close_clients()
+
+
+def test_stalled_request_ends_at_deadline(upstream):
+    guard = CallGuard()
+    started = time.monotonic()
+    with pytest.raises(Exception) as error:
+        create_completion(ai_clients.get_openai_client('test'), Deadline(2), guard,
+                          model='test', messages=MESSAGES)
+
+    # The client's own retries would take 3 x 2 s
+    assert time.monotonic() - started < 3
+    assert 'Timeout' in type(error.value).__name__
+    assert upstream['hits'] == 1
+    assert guard.deadline_limited is True
+
+
+def test_provider_errors_are_retried_within_deadline(upstream):
+    upstream['mode'] = 'error'
+    with pytest.raises(Exception):
+        create_completion(ai_clients.get_openai_client('test'), Deadline(20), model='test', messages=MESSAGES)
+    assert upstream['hits'] == 3
+
+    # No time for a retry after the backoff
+    upstream['hits'] = 0
+    with pytest.raises(Exception):
+        create_completion(ai_clients.get_openai_client('test'), Deadline(2), model='test', messages=MESSAGES)
+    assert upstream['hits'] == 1
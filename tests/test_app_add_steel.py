@@ -0,0 +1,47 @@
+"""
+POST /api/steels/add with result tokens (expired tokens, web page fallback)
+"""
+
+import pytest
+
+from database.change_journal import ChangeJournal
+
+
+@pytest.fixture
+def client(database, tmp_path, monkeypatch):
+    import app
+
+    # No backups / journal in the repository's database directory
+    journal = ChangeJournal(tmp_path / 'change_journal.jsonl')
+    monkeypatch.setattr(app, 'get_change_journal', lambda: journal)
+    monkeypatch.setattr(app, 'request_backup', lambda reason=None: None)
+    return app.app.test_client()
+
+
+def test_token_adds_stored_result(client):
+    from ai_result_store import attach_result_token
+
+    result = attach_result_token({'grade': 'TOKEN 1', 'c': '0.40', 'cr': '5.20', 'mo': '1.40'})
+    response = client.post('/api/steels/add', json={'result_token': result['result_token'], 'c': '9.99'})
+
+    assert response.status_code == 200
+    assert response.get_json()['grade'] == 'TOKEN 1'
+
+
+def test_expired_token_only_request_is_gone(client):
+    response = client.post('/api/steels/add', json={'result_token': 'expired'})
+    assert response.status_code == 410
+
+
+def test_expired_token_falls_back_to_body(client):
+    # The web page posts the whole result it shows, including the token
+    response = client.post('/api/steels/add', json={
+        'result_token': 'expired', 'id': 'AI', 'grade': 'WEB 1', 'c': '0.35-0.42', 'cr': 1.1
+    })
+    assert response.status_code == 200
+    assert response.get_json()['grade'] == 'WEB 1'
+
+
+def test_body_values_are_validated(client):
+    response = client.post('/api/steels/add', json={'result_token': 'expired', 'grade': 'BAD 1', 'c': {'min': 1}})
+    assert response.status_code == 400
@@ -0,0 +1,75 @@
+"""
+BackupScheduler timing with a fake backup manager (no database copies)
+"""
+
+import threading
+import time
+
+from database.backup_scheduler import BackupScheduler
+
+
+class FakeManager:
+    """create_backup fails the first `failures` calls, then succeeds"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create_backup(self, reason="manual"):
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise OSError("No space left on device")
+        return f"backup_{self.calls}"
+
+
+class FakeJournal:
+    def stats(self):
+        return {}
+
+
+def _scheduler(manager, quiet_period, max_delay):
+    return BackupScheduler(quiet_period=quiet_period, max_delay=max_delay,
+                           manager=manager, journal=FakeJournal())
+
+
+def test_backups_are_coalesced():
+    manager = FakeManager(failures=0)
+    scheduler = _scheduler(manager, quiet_period=0.2, max_delay=5)
+
+    for _ in range(20):
+        scheduler.request(reason="api_add_steel")
+    time.sleep(0.6)
+
+    assert manager.calls == 1
+    assert scheduler.stats()['pending'] is False
+
+
+def test_failed_backup_is_retried_with_backoff():
+    # max_delay already passed on the first failure: retries must still wait
+    manager = FakeManager(failures=10 ** 9)
+    scheduler = _scheduler(manager, quiet_period=0.1, max_delay=0.2)
+
+    scheduler.request(reason="api_add_steel")
+    time.sleep(2.5)
+
+    stats = scheduler.stats()
+    assert 2 <= manager.calls <= 4
+    assert stats['pending'] is True
+    assert stats['failures'] == manager.calls
+
+
+def test_success_after_failure_clears_retry():
+    manager = FakeManager(failures=1)
+    scheduler = _scheduler(manager, quiet_period=0.1, max_delay=0.2)
+    scheduler.MIN_RETRY_DELAY = 0.2
+
+    scheduler.request(reason="api_add_steel")
+    time.sleep(0.8)
+
+    stats = scheduler.stats()
+    assert manager.calls == 2
+    assert stats['backups'] == 1
+    assert stats['pending'] is False
+    assert stats['failed_in_row'] == 0
@@ -0,0 +1,79 @@
+"""
+BulkEnricher against a fake provider (no network, no AI keys)
+
+test_throughput_with_fake_provider is also the throughput harness: run
+    python -m pytest tests/test_bulk_enrich.py -s
+to print grades/s and latency percentiles of the pipeline with a fixed
+provider latency (FAKE_LATENCY) at CONCURRENCY concurrent searches.
+"""
+
+import asyncio
+import threading
+import time
+
+from ai_concurrency import ProviderBusyError
+from bulk_enrich import BulkEnricher, prepare_run
+from database_schema import get_connection
+
+FAKE_LATENCY = 0.05
+CONCURRENCY = 8
+
+
+class FakeSearch:
+    """AISearch stand-in: fixed latency, busy and failing grades by prefix"""
+
+    def __init__(self, latency=FAKE_LATENCY):
+        self.latency = latency
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def search_steel(self, grade, force=False, raise_errors=False, deadline=None):
+        with self._lock:
+            self.calls[grade] = self.calls.get(grade, 0) + 1
+        time.sleep(self.latency)
+        if grade.startswith('BUSY'):
+            raise ProviderBusyError('perplexity', 'queue full', retry_after=0.01)
+        if grade.startswith('FAIL'):
+            raise RuntimeError('upstream failed')
+        return {'grade': grade, 'c': '0.40', 'cr': '5.20', 'validated': True, 'confidence': 'high'}
+
+
+def _items(run_id):
+    conn = get_connection()
+    try:
+        return {grade: (status, attempts) for grade, status, attempts in conn.execute(
+            "SELECT grade, status, attempts FROM enrich_items WHERE run_id = ?", (run_id,))}
+    finally:
+        conn.close()
+
+
+def test_throughput_with_fake_provider(database):
+    grades = [f'GRADE {i}' for i in range(200)]
+    run_id, _ = prepare_run(grades, 'test')
+
+    enricher = BulkEnricher(FakeSearch(), run_id, concurrency=CONCURRENCY, batch_size=20, flush_interval=0.5)
+    summary = asyncio.run(enricher.run())
+    print(f"\n[Bulk harness] {summary}")
+
+    assert summary['counts']['staged'] == len(grades)
+    assert all(status == 'staged' for status, _ in _items(run_id).values())
+    # Ideal is CONCURRENCY / FAKE_LATENCY = 160 grades/s; batching must not serialize the searches
+    assert summary['grades_per_second'] > CONCURRENCY / FAKE_LATENCY / 4
+
+
+def test_busy_provider_retries_are_bounded(database):
+    run_id, _ = prepare_run(['BUSY 1', 'GRADE 1', 'FAIL 1'], 'test')
+    search = FakeSearch(latency=0)
+
+    summary = asyncio.run(BulkEnricher(search, run_id, busy_retries=3, flush_interval=0.1).run())
+
+    assert search.calls['BUSY 1'] == 4
+    assert summary['counts'] == {'staged': 1, 'rejected': 0, 'not_found': 0, 'error': 2}
+    items = _items(run_id)
+    # A busy provider does not use up an attempt of the grade, a failure does
+    assert items['BUSY 1'] == ('error', 0)
+    assert items['FAIL 1'] == ('error', 1)
+
+    # Both are retried on resume, the staged grade is not
+    asyncio.run(BulkEnricher(search, run_id, busy_retries=0, flush_interval=0.1).run())
+    assert search.calls == {'BUSY 1': 5, 'GRADE 1': 1, 'FAIL 1': 2}
@@ -0,0 +1,30 @@
+"""
+X-Did-You-Mean header of exact searches without results
+"""
+
+import json
+
+from database_schema import get_connection, bump_write_generation
+
+
+def test_header_lists_only_grades_in_database(database, monkeypatch):
+    conn = get_connection()
+    conn.execute("INSERT INTO steel_grades (grade, analogues) VALUES ('HARDOX 500', 'XAR500')")
+    bump_write_generation(conn)
+    conn.commit()
+    conn.close()
+
+    import app
+    from grade_suggest import GradeSuggester
+
+    # Fresh index: the singleton may hold another test database of the same generation
+    monkeypatch.setattr(app, 'get_grade_suggester', GradeSuggester)
+    client = app.app.test_client()
+
+    response = client.get('/api/steels?grade=HARDOX 50&exact=true')
+    assert json.loads(response.headers['X-Did-You-Mean']) == ['HARDOX 500']
+
+    # XAR500 is only known as an analogue: searching it exactly would find nothing again
+    response = client.get('/api/steels?grade=XAR 50&exact=true')
+    assert response.get_json() == []
+    assert 'X-Did-You-Mean' not in response.headers
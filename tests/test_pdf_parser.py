@@ -0,0 +1,62 @@
+"""
+Composition table layouts of utils.pdf_parser (fixture texts and PDFs in
+tests/fixtures/datasheets; add a text file + expected result for every
+datasheet layout the parser is taught)
+"""
+
+from pathlib import Path
+
+import pytest
+
+from utils.pdf_parser import PDFParser, parse_composition, find_pdf_urls_in_text
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'datasheets'
+
+LAYOUTS = {
+    # Header row of symbols, one value row
+    'header_row.txt': {'c': '0.39', 'si': '1.00', 'mn': '0.40', 'cr': '5.20', 'mo': '1.40', 'v': '0.90'},
+    # "C 0,38 – 0,45  Si max. 0,40" pairs: decimal commas, dashes, max prefixes
+    'inline_ranges.txt': {'c': '0.38-0.45', 'si': '0.40', 'mn': '0.60-0.90', 'p': '0.025', 's': '0.035',
+                          'cr': '0.90-1.20', 'mo': '0.15-0.30'},
+    # Separate min / max rows → ranges (B is a column but not an extracted element)
+    'min_max_rows.txt': {'c': '0.25-0.30', 'si': '0.10-0.50', 'mn': '0.80-1.60', 'p': '0-0.020',
+                         's': '0-0.010', 'cr': '0.20-1.20', 'ni': '0.10-1.00', 'mo': '0.10-0.60'},
+    'german_heading.txt': {'c': '1.55', 'si': '0.25', 'mn': '0.35', 'cr': '11.80', 'mo': '0.80', 'v': '0.95'},
+    # Ranges and "до" (up to) values
+    'russian_heading.txt': {'c': '0.36-0.45', 'si': '0.8', 'mn': '0.8', 'cr': '12.0-14.0', 'ni': '0.6',
+                            's': '0.025', 'p': '0.030'},
+    # No heading: header-row layout with a label column
+    'no_heading_table.txt': {'c': '1.28', 'cr': '4.20', 'mo': '5.00', 'v': '3.10', 'w': '6.40', 'co': '8.50'},
+    'no_composition.txt': {},
+}
+
+
+@pytest.mark.parametrize('name', sorted(LAYOUTS))
+def test_parse_composition_layouts(name):
+    text = (FIXTURES / name).read_text(encoding='utf-8')
+    assert parse_composition(text) == LAYOUTS[name]
+
+
+def test_parse_composition_needs_min_elements():
+    assert parse_composition("Chemical composition\nC 0.40 Cr 5.20\n") == {}
+    assert parse_composition("") == {}
+    assert parse_composition(None) == {}
+
+
+def test_parse_pdf_file_stops_after_table_page():
+    data = PDFParser(use_pool=False).parse_pdf_file(str(FIXTURES / 'table_on_page_2.pdf'))
+
+    assert data['composition'] == LAYOUTS['header_row.txt']
+    assert data['pages_total'] == 3
+    assert data['pages_parsed'] == 2
+    assert data['stopped_early'] is True
+
+
+def test_parse_pdf_file_rejects_non_pdf():
+    assert PDFParser(use_pool=False).parse_pdf_file(str(FIXTURES / 'header_row.txt')) is None
+
+
+def test_find_pdf_urls_in_text():
+    text = ("See https://example.com/ds/orvar.pdf. Also (https://example.com/a.PDF?v=2), "
+            "https://example.com/page.html and https://example.com/ds/orvar.pdf again")
+    assert find_pdf_urls_in_text(text) == ['https://example.com/ds/orvar.pdf', 'https://example.com/a.PDF?v=2']
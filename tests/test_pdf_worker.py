@@ -0,0 +1,81 @@
+"""
+PDFWorkerPool timeouts: a stuck document is killed, documents in flight in
+the same pool are resubmitted
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from utils.pdf_worker import PDFWorkerPool
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'datasheets'
+
+
+def _catalogue_pdf(path, pages):
+    """PDF of `pages` text pages without a composition table (slow to parse fully)"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = ' '.join(f"{4 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i in range(pages):
+        content = "BT /F1 12 Tf 72 720 Td 16 TL " + f"(Page {i} catalogue text) Tj T* " * 20 + "ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream".encode())
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(data)
+    return path
+
+
+@pytest.fixture
+def pool():
+    pool = PDFWorkerPool(workers=2, timeout=60)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason="needs a named pipe for a stuck document")
+def test_stuck_document_is_killed_and_others_resubmitted(pool, tmp_path):
+    # Opening a FIFO without a writer blocks the worker forever
+    stuck = tmp_path / 'stuck.pdf'
+    os.mkfifo(stuck)
+    catalogue = _catalogue_pdf(tmp_path / 'catalogue.pdf', pages=150)
+
+    # Warm up both workers, so the timeout below measures only the stuck parse
+    assert pool.extract_text(str(FIXTURES / 'table_on_page_2.pdf'))['pages_parsed'] == 2
+
+    results = {}
+    healthy = threading.Thread(target=lambda: results.update(
+        catalogue=pool.extract_text(str(catalogue), max_pages=1000, early_stop=False)))
+    healthy.start()
+    time.sleep(0.3)
+
+    started = time.monotonic()
+    assert pool.extract_text(str(stuck), timeout=1.0) is None
+    assert time.monotonic() - started < 5
+    healthy.join(60)
+
+    # The catalogue was still being parsed when the pool was killed
+    assert results['catalogue'] is not None
+    assert results['catalogue']['pages_parsed'] == 150
+    stats = pool.stats()
+    assert stats['timeouts'] == 1
+    assert stats['restarts'] == 1
+    assert stats['resubmitted'] == 1
+    assert stats['failures'] == 0
+
+    # The new pool works
+    assert pool.extract_text(str(FIXTURES / 'table_on_page_2.pdf'))['stopped_early'] is True
@@ -0,0 +1,3 @@
+"""
+Helpers for AI search: PDF datasheet download, caching and parsing
+"""
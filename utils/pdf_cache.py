@@ -0,0 +1,450 @@
+"""
+Content-addressed disk cache for PDF datasheets
+
+The same manufacturer datasheets (Bohler, SSAB, Uddeholm, ...) are referenced
+by many AI results. Without a cache every reference downloads and parses the
+PDF again. The cache keeps:
+
+- the raw PDF, stored once per SHA-256 of its content (blobs/ab/<sha>.pdf)
+- the parse result (text + regex composition + timings) next to it
+  (<sha>.<parser_version>.json), so a new parser version re-parses
+- an index (index.db): URL → content hash, ETag, Last-Modified, last check;
+  content hash → size, last access, download/parse timings
+
+A URL checked within PDF_CACHE_REVALIDATE seconds is served from disk without
+network access. After that it is revalidated with If-None-Match /
+If-Modified-Since: 304 keeps the cached copy, 200 stores the new content (a
+changed datasheet gets a new hash and is parsed again). If the server is not
+reachable, the stale copy is used.
+
+Total size is bounded by PDF_CACHE_MAX_BYTES; least recently used documents
+are evicted first.
+
+Settings (.env):
+    PDF_CACHE_ENABLED=True
+    PDF_CACHE_DIR=database/pdf_cache
+    PDF_CACHE_MAX_BYTES=524288000   # 500 MB
+    PDF_CACHE_REVALIDATE=86400      # seconds before a URL is checked again
+    PDF_DOWNLOAD_TIMEOUT=30         # seconds
+    PDF_MAX_DOWNLOAD_BYTES=52428800 # larger documents are not downloaded
+
+Usage:
+    from utils.pdf_cache import get_pdf_cache
+    pdf_data = get_pdf_cache().fetch(url, parser.parse_pdf_file)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, Callable
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+
+# parse_file(path) -> {'text': ..., 'composition': {...}, ...} or None
+ParseFunction = Callable[[str], Optional[Dict[str, Any]]]
+
+_BASE_DIR = Path(__file__).resolve().parent.parent
+_CHUNK_SIZE = 64 * 1024
+
+
+class PDFCache:
+    """Disk cache of downloaded PDFs and their parse results"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None,
+                 revalidate_after: Optional[int] = None):
+        """
+        Args:
+            cache_dir: Cache directory (default: PDF_CACHE_DIR)
+            max_bytes: Max total size of cached files (default: PDF_CACHE_MAX_BYTES)
+            revalidate_after: Seconds a URL is served without revalidation (default: PDF_CACHE_REVALIDATE)
+        """
+        self.enabled = os.getenv('PDF_CACHE_ENABLED', 'True').lower() == 'true'
+
+        cache_dir = Path(cache_dir or os.getenv('PDF_CACHE_DIR', 'database/pdf_cache'))
+        self.cache_dir = cache_dir if cache_dir.is_absolute() else _BASE_DIR / cache_dir
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv('PDF_CACHE_MAX_BYTES', str(500 * 1024 * 1024)))
+        self.revalidate_after = revalidate_after if revalidate_after is not None else int(os.getenv('PDF_CACHE_REVALIDATE', '86400'))
+        self.timeout = float(os.getenv('PDF_DOWNLOAD_TIMEOUT', '30'))
+        self.max_download = int(os.getenv('PDF_MAX_DOWNLOAD_BYTES', str(50 * 1024 * 1024)))
+
+        self._lock = threading.Lock()
+        self._stats = {
+            'fresh_hits': 0,       # served from disk without network access
+            'not_modified': 0,     # revalidated, server answered 304
+            'stale_hits': 0,       # server unreachable, stale copy used
+            'downloads': 0,
+            'downloaded_bytes': 0,
+            'download_seconds': 0.0,
+            'parse_hits': 0,       # parse result reused
+            'parses': 0,
+            'parse_seconds': 0.0,
+            'evicted': 0
+        }
+
+        self._index_path = self.cache_dir / 'index.db'
+        (self.cache_dir / 'blobs').mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS pdf_urls (
+                    url TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    checked_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_pdf_urls_sha ON pdf_urls(sha256);
+                CREATE TABLE IF NOT EXISTS pdf_blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    download_ms INTEGER,
+                    parse_ms INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_pdf_blobs_access ON pdf_blobs(last_access);
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self._index_path), timeout=30)
+
+    def _blob_path(self, sha256: str, suffix: str) -> Path:
+        return self.cache_dir / 'blobs' / sha256[:2] / f"{sha256}{suffix}"
+
+    def _count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._stats[name] += value
+
+    # ---------------------------------------------------------------- download
+
+    def _download(self, url: str, headers: Dict[str, str], timeout: Optional[float] = None):
+        """
+        GET url into the blob store
+
+        Args:
+            timeout: Seconds for the whole download, at most PDF_DOWNLOAD_TIMEOUT
+
+        Returns:
+            ('not_modified', None, None) on 304, or ('ok', sha256, response headers)
+
+        Raises:
+            requests.RequestException / ValueError: download failed or not a PDF
+        """
+        started = time.monotonic()
+        timeout = self.timeout if timeout is None else min(self.timeout, timeout)
+        response = requests.get(url, headers=headers, stream=True, timeout=timeout)
+        try:
+            if response.status_code == 304:
+                return 'not_modified', None, None
+            response.raise_for_status()
+
+            declared = int(response.headers.get('Content-Length') or 0)
+            if declared > self.max_download:
+                raise ValueError(f"PDF too large ({declared} bytes)")
+
+            digest = hashlib.sha256()
+            size = 0
+            tmp_path = self.cache_dir / 'blobs' / f".download-{threading.get_ident()}-{time.monotonic_ns()}"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(_CHUNK_SIZE):
+                        if size == 0 and not chunk.lstrip().startswith(b'%PDF'):
+                            raise ValueError("Response is not a PDF document")
+                        size += len(chunk)
+                        if time.monotonic() - started > timeout:
+                            raise ValueError(f"Download exceeded {timeout:.0f} s")
+                        if size > self.max_download:
+                            raise ValueError(f"PDF too large (> {self.max_download} bytes)")
+                        digest.update(chunk)
+                        f.write(chunk)
+
+                if size == 0:
+                    raise ValueError("Empty response")
+
+                sha256 = digest.hexdigest()
+                path = self._blob_path(sha256, '.pdf')
+                path.parent.mkdir(exist_ok=True)
+                if path.exists():
+                    tmp_path.unlink()  # same content under another URL
+                else:
+                    os.replace(tmp_path, path)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+        finally:
+            response.close()
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._stats['downloads'] += 1
+            self._stats['downloaded_bytes'] += size
+            self._stats['download_seconds'] += elapsed
+
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT INTO pdf_blobs (sha256, size, last_access, download_ms)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(sha256) DO UPDATE SET last_access = excluded.last_access
+            """, (sha256, size, time.time(), int(elapsed * 1000)))
+            conn.commit()
+        finally:
+            conn.close()
+
+        print(f"[PDF Cache] Downloaded {url} ({size // 1024} KB, {elapsed:.1f} s)")
+        return 'ok', sha256, response.headers
+
+    def get_pdf(self, url: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Get content hash of the PDF at url, downloading or revalidating as needed
+
+        Args:
+            url: PDF URL
+            timeout: Download timeout (see _download)
+
+        Returns:
+            SHA-256 of the cached document, or None if it could not be obtained
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT sha256, etag, last_modified, checked_at FROM pdf_urls WHERE url = ?", (url,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if row and not self._blob_path(row[0], '.pdf').exists():
+            row = None  # evicted or removed by hand
+
+        if row and time.time() - row[3] < self.revalidate_after:
+            self._count('fresh_hits')
+            return row[0]
+
+        if requests is None:
+            print("[PDF Cache] requests package not installed, cannot download PDFs")
+            return row[0] if row else None
+
+        headers = {'User-Agent': 'Mozilla/5.0 (compatible; ParserSteel datasheet fetcher)'}
+        if row and row[1]:
+            headers['If-None-Match'] = row[1]
+        if row and row[2]:
+            headers['If-Modified-Since'] = row[2]
+
+        try:
+            status, sha256, response_headers = self._download(url, headers, timeout)
+        except Exception as e:
+            if row:
+                print(f"[PDF Cache] Revalidation of {url} failed ({e}), using cached copy")
+                self._count('stale_hits')
+                return row[0]
+            print(f"[PDF Cache] Download of {url} failed: {e}")
+            return None
+
+        conn = self._connect()
+        try:
+            if status == 'not_modified':
+                self._count('not_modified')
+                conn.execute("UPDATE pdf_urls SET checked_at = ? WHERE url = ?", (time.time(), url))
+                sha256 = row[0]
+            else:
+                conn.execute("""
+                    INSERT OR REPLACE INTO pdf_urls (url, sha256, etag, last_modified, checked_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (url, sha256, response_headers.get('ETag'),
+                      response_headers.get('Last-Modified'), time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+
+        return sha256
+
+    # ------------------------------------------------------------------- parse
+
+    def fetch(self, url: str, parse_file: ParseFunction, parser_version: str = '1',
+              timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get parse result for the PDF at url (downloading and parsing only when needed)
+
+        Args:
+            url: PDF URL
+            parse_file: Parser called with the cached PDF path on a parse miss
+            parser_version: Parse results of other versions are not reused
+            timeout: Download timeout (see _download); parse_file applies its own
+
+        Returns:
+            Parse result with 'pdf_sha256' and 'parse_cached' added, or None
+        """
+        if not self.enabled:
+            return None
+
+        sha256 = self.get_pdf(url, timeout)
+        if not sha256:
+            return None
+
+        parsed_path = self._blob_path(sha256, f".{parser_version}.json")
+        data = None
+        if parsed_path.exists():
+            try:
+                with open(parsed_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._count('parse_hits')
+                data['parse_cached'] = True
+            except (OSError, ValueError):
+                data = None
+
+        if data is None:
+            started = time.monotonic()
+            data = parse_file(str(self._blob_path(sha256, '.pdf')))
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._stats['parses'] += 1
+                self._stats['parse_seconds'] += elapsed
+            print(f"[PDF Cache] Parsed {sha256[:12]} in {elapsed:.2f} s")
+
+            if not data:
+                self._touch(sha256, parse_ms=int(elapsed * 1000))
+                return None
+
+            data.setdefault('parse_seconds', round(elapsed, 3))
+            tmp_path = parsed_path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, parsed_path)
+            data['parse_cached'] = False
+            self._touch(sha256, parse_ms=int(elapsed * 1000), extra_size=parsed_path.stat().st_size)
+        else:
+            self._touch(sha256)
+
+        data['pdf_sha256'] = sha256
+        self._evict(keep=sha256)
+        return data
+
+    def _touch(self, sha256: str, parse_ms: Optional[int] = None, extra_size: int = 0) -> None:
+        conn = self._connect()
+        try:
+            conn.execute("""
+                UPDATE pdf_blobs
+                SET last_access = ?, size = size + ?, parse_ms = COALESCE(?, parse_ms)
+                WHERE sha256 = ?
+            """, (time.time(), extra_size, parse_ms, sha256))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ---------------------------------------------------------------- eviction
+
+    def _remove_blob(self, conn: sqlite3.Connection, sha256: str) -> None:
+        directory = self._blob_path(sha256, '').parent
+        for path in directory.glob(f"{sha256}.*"):
+            try:
+                path.unlink()
+            except OSError as e:
+                print(f"[PDF Cache] Cannot remove {path}: {e}")
+        conn.execute("DELETE FROM pdf_blobs WHERE sha256 = ?", (sha256,))
+        conn.execute("DELETE FROM pdf_urls WHERE sha256 = ?", (sha256,))
+
+    def _evict(self, keep: Optional[str] = None) -> int:
+        """Remove least recently used documents until total size fits max_bytes"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pdf_blobs").fetchone()[0]
+                if total <= self.max_bytes:
+                    return 0
+
+                removed = 0
+                rows = conn.execute("SELECT sha256, size FROM pdf_blobs ORDER BY last_access").fetchall()
+                for sha256, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    if sha256 == keep:
+                        continue
+                    self._remove_blob(conn, sha256)
+                    total -= size
+                    removed += 1
+                conn.commit()
+            finally:
+                conn.close()
+
+            self._stats['evicted'] += removed
+
+        if removed:
+            print(f"[PDF Cache] Evicted {removed} documents (LRU), {total // 1024} KB cached")
+        return removed
+
+    def purge(self) -> int:
+        """Remove all cached documents; returns number removed"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                hashes = [row[0] for row in conn.execute("SELECT sha256 FROM pdf_blobs")]
+                for sha256 in hashes:
+                    self._remove_blob(conn, sha256)
+                conn.execute("DELETE FROM pdf_urls")
+                conn.commit()
+            finally:
+                conn.close()
+
+        print(f"[PDF Cache] Purged {len(hashes)} documents")
+        return len(hashes)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit counters, download/parse timings and disk usage"""
+        with self._lock:
+            stats = dict(self._stats)
+
+        try:
+            conn = self._connect()
+            try:
+                documents, size = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pdf_blobs"
+                ).fetchone()
+                avg_parse_ms = conn.execute(
+                    "SELECT AVG(parse_ms) FROM pdf_blobs WHERE parse_ms IS NOT NULL"
+                ).fetchone()[0]
+                urls = conn.execute("SELECT COUNT(*) FROM pdf_urls").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[PDF Cache] Stats error: {e}")
+            documents = size = urls = 0
+            avg_parse_ms = None
+
+        lookups = stats['parse_hits'] + stats['parses']
+        stats['parse_hit_rate'] = round(stats['parse_hits'] / lookups, 3) if lookups else 0.0
+        stats['download_seconds'] = round(stats['download_seconds'], 2)
+        stats['parse_seconds'] = round(stats['parse_seconds'], 2)
+        stats['avg_parse_ms'] = round(avg_parse_ms) if avg_parse_ms is not None else None
+        stats['documents'] = documents
+        stats['urls'] = urls
+        stats['size_bytes'] = size
+        stats['max_bytes'] = self.max_bytes
+        stats['enabled'] = self.enabled
+        return stats
+
+
+# Singleton instance
+_pdf_cache = None
+_pdf_cache_lock = threading.Lock()
+
+
+def get_pdf_cache() -> PDFCache:
+    """Get or create PDFCache singleton instance"""
+    global _pdf_cache
+
+    if _pdf_cache is None:
+        with _pdf_cache_lock:
+            if _pdf_cache is None:
+                _pdf_cache = PDFCache()
+
+    return _pdf_cache
@@ -0,0 +1,378 @@
+"""
+PDF datasheet parser: chemical composition from manufacturer datasheets
+
+Used by AISearch._enhance_with_pdf to replace Perplexity's composition
+values with the ones printed in the datasheet the answer cites.
+
+- downloads are streamed to a temporary file (size-limited, PDF magic checked)
+- text is extracted page by page in the PDF worker pool (utils.pdf_worker);
+  reading stops at the first page where a composition table can be parsed
+- the composition table is parsed for ELEMENTS in both common layouts:
+
+      Typical Composition %           Chemical composition
+      C     Si    Mn    Cr    Mo      C 0.35-0.42  Si max. 0.40  Mn 0.60-0.90
+      0.40  1.00  0.40  5.20  1.30
+
+  plus "min"/"max" rows under one header (→ ranges)
+
+Everything except the download works on local files, so the parser can be
+run offline: PDFParser(use_pool=False).parse_pdf_file('datasheet.pdf').
+Supported layouts are covered by tests/test_pdf_parser.py (fixture texts in
+tests/fixtures/datasheets).
+
+Usage:
+    from utils.pdf_parser import PDFParser, find_pdf_urls_in_text
+    parser = PDFParser()
+    data = parser.parse_pdf_from_url(url)
+    # {'composition': {'c': '0.40', 'cr': '5.20', ...}, 'text': ..., 'pages_parsed': 3,
+    #  'stopped_early': True, 'download_seconds': 0.8, 'parse_seconds': 0.9, ...}
+"""
+
+import os
+import re
+import json
+import time
+import tempfile
+from typing import Optional, Dict, Any, List
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+# Text extraction runs in worker processes; fail here so that AISearch
+# disables PDF enhancement when pdfplumber is missing
+import pdfplumber  # noqa: F401
+
+from utils.pdf_worker import extract_pdf_text, get_pdf_worker_pool
+
+
+# Headings of composition tables (EN / DE / RU datasheets)
+COMPOSITION_HEADING = re.compile(
+    r'(typical\s+(chemical\s+)?(composition|analysis)|chemical\s+(composition|analysis)'
+    r'|chemische\s+zusammensetzung|richtanalyse|химический\s+состав)',
+    re.IGNORECASE
+)
+
+# Elements extracted from datasheets (same set AISearch._enhance_with_pdf applies)
+ELEMENTS = ['c', 'cr', 'mo', 'v', 'w', 'co', 'ni', 'mn', 'si', 's', 'p', 'cu', 'nb', 'n', 'ti', 'al']
+
+# Other symbols that appear as table columns (needed to align values with columns)
+_OTHER_SYMBOLS = ['B', 'Fe', 'Zr', 'Ta', 'Sn', 'As', 'Ca', 'Ce', 'Pb', 'Se', 'Te', 'Bi', 'Mg', 'Sb', 'Zn', 'H', 'O']
+_SYMBOLS = {element.capitalize(): element for element in ELEMENTS}
+_SYMBOLS.update({symbol: None for symbol in _OTHER_SYMBOLS})
+
+# Elements a table must yield to count as found
+MIN_ELEMENTS = 3
+
+# Characters of text after a heading searched for the table
+_SECTION_LENGTH = 2500
+
+_NUMBER = r'\d+(?:[.,]\d+)?'
+_VALUE_TOKEN = re.compile(rf'^(?:max\.?|≤|<|до)?({_NUMBER})(?:-({_NUMBER}))?%?$', re.IGNORECASE)
+_INLINE_VALUE = re.compile(
+    r'(?<![A-Za-z])(' + '|'.join(sorted(_SYMBOLS, key=len, reverse=True)) + r')(?![a-z])'
+    rf'\s*[:=]?\s*(max\.?\s*|≤\s*|<\s*|до\s*)?({_NUMBER})(?:\s*-\s*({_NUMBER}))?'
+)
+_PDF_URL = re.compile(r'https?://[^\s<>"\'()\[\]]+?\.pdf(?:\?[^\s<>"\'()\[\]]*)?(?=[\s<>"\'()\[\],;.]|$)',
+                      re.IGNORECASE)
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def find_pdf_urls_in_text(text: str) -> List[str]:
+    """
+    Find PDF links in text (e.g. Perplexity answer with citations)
+
+    Returns:
+        Unique URLs in order of appearance
+    """
+    urls = []
+    for match in _PDF_URL.finditer(text or ''):
+        url = match.group(0).rstrip('.')
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+def _normalize(text: str) -> str:
+    """Unify dashes and decimal commas, glue ranges and max prefixes to values"""
+    text = text.replace('–', '-').replace('—', '-').replace('−', '-')
+    text = re.sub(rf'({_NUMBER})\s*-\s*({_NUMBER})', r'\1-\2', text)
+    # Not at line start: there "max" labels a row of maximum values
+    text = re.sub(r'(?<=[ \t])(max\.?|≤|<|до)\s+(?=\d)', r'\1', text, flags=re.IGNORECASE)
+    return text
+
+
+def _value(token: str) -> Optional[str]:
+    """Table cell → value string as stored in the database ('0.40', '0.35-0.42')"""
+    match = _VALUE_TOKEN.match(token)
+    if not match:
+        return None
+    low = match.group(1).replace(',', '.')
+    high = match.group(2)
+    return f"{low}-{high.replace(',', '.')}" if high else low
+
+
+def _header_symbols(line: str) -> Optional[List[str]]:
+    """Element symbols of a table header row, or None if line is not a header"""
+    tokens = [token.strip('(),;|%') for token in line.split()]
+    tokens = [token for token in tokens if token and token not in ('%', 'wt', 'wt.')]
+    symbols = [token for token in tokens if token in _SYMBOLS]
+    known = [symbol for symbol in symbols if _SYMBOLS[symbol]]
+
+    # Allow a leading label column ("Element", "Grade", "%")
+    if len(known) < MIN_ELEMENTS or len(symbols) < len(tokens) - 1:
+        return None
+    return symbols
+
+
+def _value_rows(lines: List[str], count: int) -> List[tuple]:
+    """Rows below a header with exactly `count` values: [(label, [values...]), ...]"""
+    rows = []
+    for line in lines:
+        tokens = line.split()
+        for start, token in enumerate(tokens):
+            if _value(token) is not None:
+                break
+        else:
+            if rows:
+                break
+            continue
+
+        label = ' '.join(tokens[:start]).lower()
+        cells = tokens[start:]
+        if len(cells) != count:
+            if rows:
+                break
+            continue
+        rows.append((label, cells))
+        if len(rows) == 2:
+            break
+    return rows
+
+
+def _parse_table(lines: List[str]) -> Dict[str, str]:
+    """Composition from a header row of symbols followed by value row(s)"""
+    for i, line in enumerate(lines):
+        symbols = _header_symbols(line)
+        if not symbols:
+            continue
+
+        rows = _value_rows(lines[i + 1:i + 5], len(symbols))
+        if not rows:
+            continue
+
+        cells = rows[0][1]
+        # Separate min / max rows → ranges
+        if len(rows) == 2 and rows[0][0].startswith('min') and rows[1][0].startswith('max'):
+            cells = [f"{low}-{high}" if _value(low) and _value(high) else high
+                     for low, high in zip(rows[0][1], rows[1][1])]
+
+        composition = {}
+        for symbol, cell in zip(symbols, cells):
+            element = _SYMBOLS[symbol]
+            value = _value(cell)
+            if element and value is not None:
+                composition[element] = value
+        if len(composition) >= MIN_ELEMENTS:
+            return composition
+    return {}
+
+
+def _parse_inline(section: str) -> Dict[str, str]:
+    """Composition from "C 0.40 Si 1.00 ..." pairs"""
+    composition = {}
+    for symbol, _, low, high in _INLINE_VALUE.findall(section):
+        element = _SYMBOLS[symbol]
+        if element and element not in composition:
+            value = low.replace(',', '.')
+            composition[element] = f"{value}-{high.replace(',', '.')}" if high else value
+    return composition if len(composition) >= MIN_ELEMENTS else {}
+
+
+def parse_composition(text: str) -> Dict[str, str]:
+    """
+    Parse chemical composition table from datasheet text
+
+    Args:
+        text: Extracted PDF text (any number of pages)
+
+    Returns:
+        {element: value} for ELEMENTS (e.g. {'c': '0.40', 'mn': '0.60-0.90'}),
+        empty if no table with at least MIN_ELEMENTS elements was found
+    """
+    text = _normalize(text or '')
+
+    for heading in COMPOSITION_HEADING.finditer(text):
+        section = text[heading.end():heading.end() + _SECTION_LENGTH]
+        composition = _parse_table(section.splitlines()) or _parse_inline(section[:600])
+        if composition:
+            return composition
+
+    # Tables without a recognized heading: only the (unambiguous) header-row layout
+    return _parse_table(text.splitlines())
+
+
+class PDFParser:
+    """Download and parse PDF datasheets"""
+
+    # Part of the PDF cache key: bump when parse results change
+    VERSION = '1'
+
+    def __init__(self, use_pool: Optional[bool] = None):
+        """
+        Args:
+            use_pool: Parse in the PDF worker pool (default: PDF_USE_WORKERS);
+                      False parses in the calling thread (scripts, offline checks)
+        """
+        if use_pool is None:
+            use_pool = os.getenv('PDF_USE_WORKERS', 'True').lower() == 'true'
+        self.use_pool = use_pool
+        self.timeout = float(os.getenv('PDF_DOWNLOAD_TIMEOUT', '30'))
+        self.max_download = int(os.getenv('PDF_MAX_DOWNLOAD_BYTES', str(50 * 1024 * 1024)))
+        self.max_pages = int(os.getenv('PDF_MAX_PAGES', '30'))
+        self.ai_model = os.getenv('OPENAI_MODEL', 'gpt-4')
+
+    def parse_pdf_file(self, path: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Extract text and composition from a local PDF
+
+        Args:
+            path: PDF file path
+            timeout: Seconds for the worker pool, at most PDF_PARSE_TIMEOUT
+                     (ignored when parsing inline)
+
+        Returns:
+            Dict with composition, text, pages_parsed, pages_total,
+            stopped_early and parse_seconds, or None if the PDF cannot be read
+        """
+        if self.use_pool:
+            data = get_pdf_worker_pool().extract_text(path, timeout=timeout)
+        else:
+            try:
+                data = extract_pdf_text(path, self.max_pages)
+            except Exception as e:
+                print(f"[PDF Parser] Failed to parse {path}: {e}")
+                data = None
+
+        return data
+
+    def parse_pdf_from_url(self, url: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Stream PDF to a temporary file and parse it
+
+        Args:
+            url: PDF URL
+            timeout: Seconds for download plus parsing (default: PDF_DOWNLOAD_TIMEOUT
+                     for the download, PDF_PARSE_TIMEOUT for the parse)
+
+        Returns:
+            See parse_pdf_file, plus download_seconds, download_bytes and
+            total_seconds; None if download or parsing failed
+        """
+        if requests is None:
+            print("[PDF Parser] requests package not installed, cannot download PDFs")
+            return None
+
+        started = time.monotonic()
+        download_timeout = self.timeout if timeout is None else min(self.timeout, timeout)
+        fd, tmp_path = tempfile.mkstemp(suffix='.pdf', prefix='datasheet-')
+        try:
+            size = 0
+            try:
+                with os.fdopen(fd, 'wb') as f, requests.get(
+                        url, stream=True, timeout=download_timeout,
+                        headers={'User-Agent': 'Mozilla/5.0 (compatible; ParserSteel datasheet fetcher)'}
+                ) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(_CHUNK_SIZE):
+                        if size == 0 and not chunk.lstrip().startswith(b'%PDF'):
+                            raise ValueError("Response is not a PDF document")
+                        size += len(chunk)
+                        if time.monotonic() - started > download_timeout:
+                            raise ValueError(f"Download exceeded {download_timeout:.0f} s")
+                        if size > self.max_download:
+                            raise ValueError(f"PDF too large (> {self.max_download} bytes)")
+                        f.write(chunk)
+            except Exception as e:
+                print(f"[PDF Parser] Download of {url} failed: {e}")
+                return None
+
+            downloaded = time.monotonic()
+            parse_timeout = None if timeout is None else timeout - (downloaded - started)
+            data = self.parse_pdf_file(tmp_path, timeout=parse_timeout)
+        finally:
+            os.unlink(tmp_path)
+
+        if data is None:
+            return None
+
+        data['download_seconds'] = round(downloaded - started, 3)
+        data['download_bytes'] = size
+        data['total_seconds'] = round(time.monotonic() - started, 3)
+        print(f"[PDF Parser] {url}: {len(data['composition'])} elements, "
+              f"{data['pages_parsed']}/{data['pages_total']} pages, {data['total_seconds']:.1f} s")
+        return data
+
+    def extract_composition_with_ai(self, text: str, client, deadline=None, guard=None,
+                                    usage: Optional[Dict[str, int]] = None) -> Optional[Dict[str, str]]:
+        """
+        Extract composition with an OpenAI model (for layouts the table parser misses)
+
+        Only the text around the composition heading is sent.
+
+        Args:
+            text: Extracted PDF text
+            client: OpenAI client (see ai_clients.get_openai_client)
+            deadline: ai_deadline.Deadline cutting the request and its retries
+                      (default: the client's timeout and retries)
+            guard: CallGuard of the OpenAI circuit breaker (see ai_clients.create_completion)
+            usage: Filled with prompt_tokens / completion_tokens of the response
+
+        Returns:
+            {element: value} for ELEMENTS, or None
+        """
+        heading = COMPOSITION_HEADING.search(text or '')
+        start = max(heading.start() - 200, 0) if heading else 0
+        excerpt = (text or '')[start:start + 6000]
+        if not excerpt.strip():
+            return None
+
+        prompt = (
+            "Extract the chemical composition (weight %) of the steel from this datasheet text. "
+            "Prefer the 'Typical Composition' table. Answer with JSON only, keys are lowercase "
+            f"element symbols from {ELEMENTS}, values are strings like \"0.40\" or \"0.35-0.42\". "
+            "Omit elements that are not given.\n\n" + excerpt
+        )
+
+        from ai_clients import create_completion
+
+        response = create_completion(
+            client, deadline, guard,
+            model=self.ai_model,
+            messages=[{'role': 'user', 'content': prompt}],
+            temperature=0,
+            max_tokens=400
+        )
+        if usage is not None and getattr(response, 'usage', None) is not None:
+            usage['prompt_tokens'] = response.usage.prompt_tokens
+            usage['completion_tokens'] = response.usage.completion_tokens
+        content = response.choices[0].message.content or ''
+
+        match = re.search(r'\{.*\}', content, re.DOTALL)
+        if not match:
+            return None
+        try:
+            raw = json.loads(match.group(0))
+        except ValueError:
+            return None
+
+        composition = {}
+        for element, value in raw.items():
+            element = str(element).lower()
+            if element in ELEMENTS and value not in (None, ''):
+                value = _value(_normalize(str(value)).replace(' ', ''))
+                if value is not None:
+                    composition[element] = value
+        return composition or None
@@ -0,0 +1,268 @@
+"""
+PDF text extraction in an isolated process pool
+
+pdfplumber is pure Python and CPU-heavy: parsing a 200-page catalogue in the
+request thread holds the GIL for tens of seconds and stalls every other
+request of the Flask worker. Extraction runs in a small pool of worker
+processes instead:
+
+- at most PDF_WORKERS documents are parsed at once; other callers wait for a
+  free worker (up to the same timeout)
+- a document taking longer than PDF_PARSE_TIMEOUT is abandoned: the pool's
+  processes are killed (where the executor exposes them) and the pool is
+  recreated on the next call. Other documents in flight in the killed pool
+  are resubmitted to the new pool once, within their own timeout
+- only the first PDF_MAX_PAGES pages are read
+- reading stops at the page where a chemical composition table
+  ("Typical Composition", "Chemical composition", ...) can be parsed
+  (utils.pdf_parser.parse_composition); datasheets put it on the first
+  pages, catalogues somewhere in the middle
+- workers are replaced after PDF_WORKER_MAX_TASKS documents (pdfplumber
+  caches grow with every document)
+
+Settings (.env):
+    PDF_WORKERS=2
+    PDF_PARSE_TIMEOUT=20        # seconds per document
+    PDF_MAX_PAGES=30
+    PDF_WORKER_MAX_TASKS=50
+
+Usage:
+    from utils.pdf_worker import get_pdf_worker_pool
+    data = get_pdf_worker_pool().extract_text(path)
+    # {'text': ..., 'composition': {...}, 'pages_parsed': 3, 'pages_total': 12, 'stopped_early': True, ...}
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, CancelledError, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Dict, Any
+
+
+def extract_pdf_text(path: str, max_pages: int, early_stop: bool = True) -> Dict[str, Any]:
+    """
+    Extract text page by page (runs in a worker process)
+
+    Args:
+        path: PDF file path
+        max_pages: Pages to read at most
+        early_stop: Stop after the page completing a composition table
+
+    Returns:
+        Dict with text, composition, pages_parsed, pages_total, stopped_early, parse_seconds
+    """
+    import pdfplumber
+    from utils.pdf_parser import parse_composition
+
+    started = time.monotonic()
+    pages = []
+    composition = {}
+    stopped_early = False
+
+    with pdfplumber.open(path) as pdf:
+        pages_total = len(pdf.pages)
+        for page in pdf.pages[:max_pages]:
+            pages.append(page.extract_text() or '')
+            page.flush_cache()  # free parsed layout objects of the page
+
+            # A table may start at the bottom of one page and continue on the next
+            if early_stop:
+                composition = parse_composition('\n'.join(pages[-2:]))
+                if composition:
+                    stopped_early = True
+                    break
+
+    text = '\n'.join(pages)
+    return {
+        'text': text,
+        'composition': composition if stopped_early else parse_composition(text),
+        'pages_parsed': len(pages),
+        'pages_total': pages_total,
+        'stopped_early': stopped_early,
+        'parse_seconds': round(time.monotonic() - started, 3)
+    }
+
+
+class PDFWorkerPool:
+    """Bounded process pool for PDF extraction with per-document timeout"""
+
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None,
+                 max_pages: Optional[int] = None, max_tasks_per_child: Optional[int] = None):
+        """
+        Args:
+            workers: Worker processes (default: PDF_WORKERS)
+            timeout: Seconds per document (default: PDF_PARSE_TIMEOUT)
+            max_pages: Pages read per document (default: PDF_MAX_PAGES)
+            max_tasks_per_child: Documents before a worker is replaced (default: PDF_WORKER_MAX_TASKS)
+        """
+        self.workers = workers or int(os.getenv('PDF_WORKERS', '2'))
+        self.timeout = timeout or float(os.getenv('PDF_PARSE_TIMEOUT', '20'))
+        self.max_pages = max_pages or int(os.getenv('PDF_MAX_PAGES', '30'))
+        self.max_tasks_per_child = max_tasks_per_child or int(os.getenv('PDF_WORKER_MAX_TASKS', '50'))
+
+        # forkserver: workers are not forked from the threaded Flask process
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        if 'forkserver' in methods:
+            # Workers replaced after a timeout start without re-importing pdfplumber
+            self._context.set_forkserver_preload(['pdfplumber'])
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._lock = threading.Lock()
+
+        self._stats = {
+            'parsed': 0,
+            'stopped_early': 0,
+            'timeouts': 0,
+            'failures': 0,
+            'busy': 0,
+            'restarts': 0,
+            'resubmitted': 0,
+            'pages_parsed': 0,
+            'parse_seconds': 0.0
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=self._context,
+                    max_tasks_per_child=self.max_tasks_per_child
+                )
+            return self._executor
+
+    def _restart(self, executor: ProcessPoolExecutor) -> None:
+        """Kill a pool stuck on (or broken by) a document; next call creates a new one"""
+        with self._lock:
+            if self._executor is not executor:
+                return  # already replaced by another caller
+            self._executor = None
+            self._stats['restarts'] += 1
+
+        # ProcessPoolExecutor cannot cancel a running task - kill its processes.
+        # There is no public API for them: if a Python version drops the private
+        # _processes, the stuck worker finishes (or hits max_pages) on its own
+        # while callers already use the new pool.
+        processes = getattr(executor, '_processes', None)
+        if isinstance(processes, dict):
+            for process in list(processes.values()):
+                try:
+                    process.kill()
+                except Exception:
+                    pass
+        else:
+            print("[PDF Workers] Cannot kill workers of this Python version, "
+                  "abandoned pool shuts down after its running documents")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def extract_text(self, path: str, max_pages: Optional[int] = None,
+                     early_stop: bool = True, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Extract text of a PDF in a worker process
+
+        Args:
+            path: PDF file path
+            max_pages: Override PDF_MAX_PAGES
+            early_stop: Stop after the composition table
+            timeout: Seconds for waiting plus parsing, at most PDF_PARSE_TIMEOUT
+                     (the caller's remaining deadline)
+
+        Returns:
+            See extract_pdf_text, or None on timeout / parse failure
+        """
+        started = time.monotonic()
+        timeout = self.timeout if timeout is None else max(0.0, min(self.timeout, timeout))
+        if not self._slots.acquire(timeout=timeout):
+            self._count('busy')
+            print(f"[PDF Workers] All {self.workers} workers busy, skipping {path}")
+            return None
+
+        try:
+            # Second attempt only for documents whose pool was killed under them
+            for attempt in range(2):
+                executor = self._get_executor()
+                try:
+                    future = executor.submit(extract_pdf_text, path, max_pages or self.max_pages, early_stop)
+                    result = future.result(timeout=max(0.0, timeout - (time.monotonic() - started)))
+                    break
+                except FuturesTimeoutError:
+                    self._count('timeouts')
+                    print(f"[PDF Workers] Parsing {path} exceeded {timeout:g} s, worker killed")
+                    self._restart(executor)
+                    return None
+                except (BrokenProcessPool, CancelledError, RuntimeError) as e:
+                    # Cancelled / RuntimeError: queued in or submitted to a pool another
+                    # caller just shut down
+                    if type(e) is RuntimeError and 'shutdown' not in str(e):
+                        raise
+                    self._restart(executor)
+                    if attempt == 0 and time.monotonic() - started < timeout:
+                        # Killed for another document (or this one crashed its worker)
+                        self._count('resubmitted')
+                        print(f"[PDF Workers] Worker pool restarted while parsing {path}, resubmitting")
+                        continue
+                    self._count('failures')
+                    print(f"[PDF Workers] Worker process died while parsing {path}")
+                    return None
+        except Exception as e:
+            self._count('failures')
+            print(f"[PDF Workers] Failed to parse {path}: {e}")
+            return None
+        finally:
+            self._slots.release()
+
+        with self._lock:
+            self._stats['parsed'] += 1
+            self._stats['stopped_early'] += int(result['stopped_early'])
+            self._stats['pages_parsed'] += result['pages_parsed']
+            self._stats['parse_seconds'] += result['parse_seconds']
+
+        result['wall_seconds'] = round(time.monotonic() - started, 3)
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Documents parsed, timeouts and average parse time"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['avg_parse_seconds'] = round(stats['parse_seconds'] / stats['parsed'], 3) if stats['parsed'] else 0.0
+        stats['parse_seconds'] = round(stats['parse_seconds'], 2)
+        stats['workers'] = self.workers
+        stats['timeout'] = self.timeout
+        stats['max_pages'] = self.max_pages
+        return stats
+
+
+# Singleton instance
+_pdf_worker_pool = None
+_pdf_worker_pool_lock = threading.Lock()
+
+
+def get_pdf_worker_pool() -> PDFWorkerPool:
+    """Get or create PDFWorkerPool singleton instance (processes start on first use)"""
+    global _pdf_worker_pool
+
+    if _pdf_worker_pool is None:
+        with _pdf_worker_pool_lock:
+            if _pdf_worker_pool is None:
+                _pdf_worker_pool = PDFWorkerPool()
+
+    return _pdf_worker_pool
+
+
+def pdf_worker_stats() -> Optional[Dict[str, Any]]:
+    """Pool metrics, or None if no PDF has been parsed in this process"""
+    return _pdf_worker_pool.stats() if _pdf_worker_pool is not None else None